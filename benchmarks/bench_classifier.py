@@ -0,0 +1,74 @@
+"""
+Benchmark of the review classification in 30_transform_amazon_reviews.py.
+
+Compares the original transformation (str.contains for the "no scent" words, two groupbys and a merge) with
+classify.flag_categories and classify.count_categories for all complaint categories, and checks that they give
+the same "no scent" counts:
+
+    python benchmarks/bench_classifier.py [--reviews <number of reviews>]
+"""
+import argparse
+import pathlib
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent / "sample scripts"))
+import classify  # noqa: E402
+
+import generators  # noqa: E402
+
+CATEGORIES = {
+    'no_scent': ['scent', 'smell', 'fragrance'],
+    'burn': ['burn', 'tunnel', 'soot', 'smoke'],
+    'wick': ['wick'],
+    'packaging': ['packag', 'broken', 'shatter', 'crack'],
+}
+
+
+def original_transform(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy()
+    df['flag_no_scent'] = df['review'].str.contains("scent|smell|fragrance", case=False, regex=True)
+    df_group = df.groupby(['product', 'date']).count().reset_index()
+    df_group = df_group.drop(columns=['review']).rename(columns={'flag_no_scent': 'num_negative_reviews'})
+    df_group2 = df[df['flag_no_scent'] == True].groupby(['product', 'date']).count().reset_index()  # noqa: E712
+    df_group2 = df_group2.drop(columns=['review']).rename(columns={'flag_no_scent': 'num_no_scent_reviews'})
+    return df_group.merge(df_group2, on=['product', 'date'], how='left').fillna(0)
+
+
+def contains_per_category(df: pd.DataFrame) -> pd.DataFrame:
+    flags = pd.DataFrame({name: df['review'].str.contains("|".join(keywords), case=False, regex=True)
+                          for name, keywords in CATEGORIES.items()})
+    return classify.count_categories(df, flags, ['product', 'date'])
+
+
+def single_pass(df: pd.DataFrame) -> pd.DataFrame:
+    return classify.count_categories(df, classify.flag_categories(df['review'], CATEGORIES), ['product', 'date'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reviews", type=int, default=1_000_000, help="Number of synthetic reviews")
+    args = parser.parse_args()
+
+    df = generators.review_corpus(args.reviews, products=2, days=365)
+    print(f"{len(df)} reviews")
+    results = {}
+    for name, function in [("original (no scent only)", original_transform),
+                           ("str.contains per category", contains_per_category),
+                           ("single pass (all categories)", single_pass)]:
+        start = time.perf_counter()
+        results[name] = function(df)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<30} {elapsed:8.3f} s   {len(df) / elapsed:12,.0f} reviews/s")
+
+    expected = results.pop("original (no scent only)")
+    for name, result in results.items():
+        for column in ['num_negative_reviews', 'num_no_scent_reviews']:
+            assert (result[column].to_numpy() == expected[column].to_numpy()).all(), f"{name}: different {column}"
+        assert result.equals(results["single pass (all categories)"]), f"{name} gives different category counts"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Benchmark and check of the import time of the data job steps.
+
+Loads each Python step in a new interpreter with `python -X importtime` and reports the time spent importing
+the modules of the step (the best of --repeat runs) and its heaviest top level imports. Fails if a step imports
+one of the FORBIDDEN modules, which are only needed by the code that defers their import (e.g. the p-values of
+correlation.py or the dashboard), or if a step takes longer than --max-ms:
+
+    python benchmarks/bench_import_time.py [--steps 10_ingest_covid_data.py,...] [--repeat 3] [--max-ms 2000]
+"""
+import argparse
+import os
+import pathlib
+import re
+import subprocess
+import sys
+
+from job_steps import JOB_DIR
+
+STEPS = sorted(path.name for path in JOB_DIR.glob("[0-9][0-9]_*.py"))
+FORBIDDEN = ("datefinder", "matplotlib", "pyinstrument", "scipy", "streamlit")
+# e.g. "import time:       612 |       4501 |   pandas.core"
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_times(step: str) -> list:
+    """Returns the (cumulative microseconds, nesting level, module) of the imports made by loading the step."""
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(pathlib.Path(__file__).parent), str(JOB_DIR),
+                                                      env.get("PYTHONPATH")]))
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                              f"import job_steps; job_steps.load_step({step!r})"],
+                             env=env, capture_output=True, text=True, check=True)
+    imports = [(int(match.group(2)), len(match.group(3)) // 2, match.group(4))
+               for match in map(IMPORT_LINE.match, process.stderr.splitlines()) if match]
+    # The imports of the interpreter startup and of job_steps come before those of the step
+    loaded = next(i for i, (_, level, module) in enumerate(imports) if module == "job_steps" and level == 0)
+    return imports[loaded + 1:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", default=",".join(STEPS), help="Comma separated step files")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-ms", type=float, help="Fail if a step takes longer to import")
+    parser.add_argument("--top", type=int, default=5, help="Number of the heaviest imports shown per step")
+    args = parser.parse_args()
+
+    failures = []
+    for step in args.steps.split(","):
+        runs = [import_times(step) for _ in range(args.repeat)]
+        imports = min(runs, key=lambda run: sum(us for us, level, _ in run if level == 0))
+        top_level = sorted(((us, module) for us, level, module in imports if level == 0), reverse=True)
+        total_ms = sum(us for us, _ in top_level) / 1000
+        print(f"{step:<34} {total_ms:8.1f} ms  " +
+              ", ".join(f"{module} {us / 1000:.0f} ms" for us, module in top_level[:args.top]))
+
+        forbidden = sorted({module.split(".")[0] for _, _, module in imports} & set(FORBIDDEN))
+        if forbidden:
+            failures.append(f"{step} imports {', '.join(forbidden)}")
+        if args.max_ms is not None and total_ms > args.max_ms:
+            failures.append(f"{step} takes {total_ms:.0f} ms to import (more than {args.max_ms:.0f} ms)")
+
+    if failures:
+        sys.exit("\n".join(failures))
+
+
+if __name__ == "__main__":
+    main()
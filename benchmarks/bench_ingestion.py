@@ -0,0 +1,62 @@
+"""
+Benchmark of ingestion.send_dataframe against a local SQLite database (see local_job_input.py).
+
+Compares the row-by-row ingestion of df.values (send_tabular_data_for_ingestion) with the multi-row
+INSERT ... VALUES statements built column by column, reports rows/s and bytes/s and checks that both
+write the same rows:
+
+    python benchmarks/bench_ingestion.py [--rows <number of rows>] [--max-bytes <statement size>]
+"""
+import argparse
+import pathlib
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent / "sample scripts"))
+import ingestion  # noqa: E402
+from local_job_input import LocalJobInput  # noqa: E402
+
+import generators  # noqa: E402
+
+
+def synthetic_tables(number: int, seed: int = 0) -> dict:
+    """Returns a dataframe for the raw reviews, transformed reviews and weekly correlation tables."""
+
+    reviews = generators.review_corpus(number, seed=seed)
+    return {
+        'yankee_candle_reviews': pd.DataFrame({
+            'Product': reviews['product'],
+            'Review_filter': "critical",
+            'Date': reviews['date'],
+            'Review': reviews['review'],
+        }),
+        'yankee_candle_reviews_transformed': generators.transformed_reviews(number, products=10, seed=seed),
+        'weekly_correlation': generators.weekly_correlation(number, seed=seed),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--max-bytes", type=int, default=ingestion.MAX_STATEMENT_BYTES)
+    args = parser.parse_args()
+
+    schemas = ingestion.table_schemas()
+    for table, df in synthetic_tables(args.rows).items():
+        results = {}
+        for bulk in (False, True):
+            job_input = LocalJobInput()
+            columns = ", ".join(f"{name} {column_type}" for name, column_type in schemas[table].items())
+            job_input.execute_query(f"CREATE TABLE bench_{table} ({columns})")
+            stats = ingestion.send_dataframe(job_input, df, f"bench_{table}", bulk=bulk, max_bytes=args.max_bytes)
+            results[bulk] = job_input.execute_query(f"SELECT * FROM bench_{table}")
+            print(f"{table:36} {'VALUES statements' if bulk else 'row by row':18} "
+                  f"{stats['rows'] / stats['seconds']:12,.0f} rows/s {stats['bytes'] / stats['seconds'] / 2**20:8.1f} MiB/s")
+            job_input.close()
+        assert len(results[False]) == len(results[True]) == len(df)
+        assert pd.DataFrame(results[False]).fillna(-1).equals(pd.DataFrame(results[True]).fillna(-1)), table
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark of queries.read_query against a local SQLite database (see local_job_input.py).
+
+Compares reading the whole result with execute_query into Python lists, building the dataframe with
+pd.DataFrame and parsing the dates afterwards with reading it chunk by chunk into typed columns.
+Reports the time and the peak memory (tracemalloc) and checks that both give the same values:
+
+    python benchmarks/bench_query_reader.py [--rows <number of rows>] [--chunk-size <rows per chunk>]
+"""
+import argparse
+import pathlib
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent / "sample scripts"))
+import queries  # noqa: E402
+from local_job_input import LocalJobInput  # noqa: E402
+
+COLUMNS = {'date': 'date', 'num_negative_reviews': 'int32', 'num_no_scent_reviews': 'int32'}
+QUERY = "SELECT date, num_negative_reviews, num_no_scent_reviews FROM bench_reviews_transformed"
+
+
+def fill_database(job_input: LocalJobInput, number: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2000-01-01", periods=10_000).strftime("%Y-%m-%d").to_numpy()
+    job_input.execute_query("CREATE TABLE bench_reviews_transformed "
+                            "(date VARCHAR, num_negative_reviews INTEGER, num_no_scent_reviews INTEGER)")
+    job_input.send_tabular_data_for_ingestion(
+        rows=zip(rng.choice(dates, number).tolist(), rng.integers(0, 50, number).tolist(),
+                 rng.integers(0, 20, number).tolist()),
+        column_names=list(COLUMNS),
+        destination_table="bench_reviews_transformed"
+    )
+
+
+def read_lists(job_input: LocalJobInput) -> pd.DataFrame:
+    df = pd.DataFrame(job_input.execute_query(QUERY), columns=list(COLUMNS))
+    df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d')
+    return df
+
+
+def measure(function, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(*args)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--chunk-size", type=int, default=queries.CHUNK_SIZE)
+    args = parser.parse_args()
+
+    job_input = LocalJobInput()
+    fill_database(job_input, args.rows)
+
+    lists, lists_seconds, lists_peak = measure(read_lists, job_input)
+    typed, typed_seconds, typed_peak = measure(queries.read_query, job_input, QUERY, COLUMNS, args.chunk_size)
+    print(f"execute_query + pd.DataFrame: {lists_seconds:.2f} s, peak {lists_peak / 2**20:.0f} MiB")
+    print(f"queries.read_query:           {typed_seconds:.2f} s, peak {typed_peak / 2**20:.0f} MiB "
+          f"({typed.memory_usage(deep=True).sum() / 2**20:.0f} MiB dataframe)")
+    assert (lists.to_numpy() == typed.to_numpy()).all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Benchmark of the emoji removal in webscrape.py.
+
+Compares cleaning the reviews one by one (the way get_amazon_reviews used to) with cleaning the whole
+Review column with Series.str.replace and with remove_emoji_column (Series.map) and checks that they give
+identical results:
+
+    python benchmarks/bench_remove_emoji.py [--reviews <number of reviews>]
+"""
+import argparse
+import pathlib
+import re
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent / "sample scripts"))
+import webscrape  # noqa: E402
+
+import generators  # noqa: E402
+
+
+def remove_emoji_per_row(df: pd.DataFrame) -> pd.Series:
+    """The original row by row cleaning."""
+
+    for i in range(0, len(df)):
+        df.loc[i, 'Review'] = webscrape.remove_emoji(df.loc[i, 'Review'])
+    return df['Review']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reviews", type=int, default=100_000, help="Number of synthetic reviews")
+    args = parser.parse_args()
+
+    df = pd.DataFrame({'Review': generators.review_texts(args.reviews, symbols=True)})
+    print(f"{len(df)} reviews")
+
+    results = {}
+    for name, function in [("row by row (df.loc)", lambda: remove_emoji_per_row(df.copy())),
+                           ("Series.str.replace", lambda: df['Review'].str.replace(webscrape.EMOJI_PATTERN, '',
+                                                                                   regex=True)),
+                           ("remove_emoji_column", lambda: webscrape.remove_emoji_column(df['Review']))]:
+        start = time.perf_counter()
+        results[name] = function()
+        elapsed = time.perf_counter() - start
+        print(f"{name:<28} {elapsed:8.3f} s   {len(df) / elapsed:12,.0f} reviews/s")
+
+    expected = results.pop("row by row (df.loc)")
+    for name, result in results.items():
+        assert result.equals(expected), f"{name} gives different results"
+    # The cleaned reviews only contain characters that fit in 3 bytes of utf-8
+    assert not expected.str.contains(re.compile("[\U00010000-\U0010FFFF]")).any()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark of the review page parsers in webscrape.py.
+
+Compares the original BeautifulSoup functions (cus_rev and rev_date) with webscrape.parse_page for each available
+HTML parser and checks that they give identical results. Then times the aligned extraction of webscrape.page_reviews
+and counts the reviews which the original pairing of the review lines with the dates gets wrong.
+Runs over a directory of saved review pages (*.html) or over synthetic pages when no directory is given:
+
+    python benchmarks/bench_review_parser.py [--pages <directory>] [--synthetic <number of pages>]
+"""
+import argparse
+import pathlib
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent / "sample scripts"))
+import webscrape  # noqa: E402
+
+import generators  # noqa: E402
+
+
+def original_parse(htmldata: str) -> tuple:
+    soup = webscrape.html_soup(htmldata)
+    return webscrape.cus_rev(soup), webscrape.rev_date(soup)
+
+
+def original_records(htmldata: str) -> list:
+    """The (date, review) records of the original get_amazon_reviews: one review per line, paired by position."""
+
+    reviews, dates = webscrape.parse_page(htmldata)
+    reviews = [line.strip() for line in reviews if line.strip() not in webscrape.NOT_REVIEW_LINES]
+    dates = [date for text in dates[2:] if text.strip() for date in webscrape.review_dates(text)]
+    return list(zip(dates[:len(reviews)], reviews))
+
+
+def timed(function, pages: list) -> tuple:
+    start = time.perf_counter()
+    results = [function(page) for page in pages]
+    return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", help="Directory with saved review pages (*.html)")
+    parser.add_argument("--synthetic", type=int, default=200, help="Number of synthetic pages")
+    args = parser.parse_args()
+
+    if args.pages:
+        pages = [path.read_text(encoding="utf-8") for path in sorted(pathlib.Path(args.pages).glob("*.html"))]
+    else:
+        # Without the empty last page
+        pages = generators.review_pages(generators.review_corpus(args.synthetic * 10))[:-1]
+    print(f"{len(pages)} pages, {sum(map(len, pages)) / 1e6:.1f} MB")
+
+    expected, baseline = timed(original_parse, pages)
+    print(f"{'html.parser (cus_rev + rev_date)':<34} {baseline:8.3f} s")
+    for backend in webscrape.BACKENDS:
+        results, elapsed = timed(lambda page: webscrape.parse_page(page, backend), pages)
+        assert results == expected, f"Backend {backend} gives different results"
+        print(f"{backend:<34} {elapsed:8.3f} s   {baseline / elapsed:5.1f}x")
+
+    print("Aligned extraction (page_reviews)")
+    report = dict.fromkeys(["dates", "reviews", "no_text", "no_date", "misaligned"], 0)
+    wrong = 0
+    for page in pages:
+        dates, reviews, page_report = webscrape.page_reviews(page)
+        report = {name: report[name] + page_report[name] for name in report}
+        # Each line of a review counts as a separate review in the original records
+        wrong += len(set(original_records(page)) - {(date, line.strip()) for date, review in zip(dates, reviews)
+                                                     for line in review.split("\n") if line.strip()})
+    print(f"validation report: {report}, reviews paired with a wrong date by the original records: {wrong}")
+    for backend in webscrape.BACKENDS:
+        _, elapsed = timed(lambda page: webscrape.page_reviews(page, backend), pages)
+        print(f"{backend:<34} {elapsed:8.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Benchmark suite of the data job steps on synthetic data (see generators.py), at several scales (number of rows).
+
+- covid: get_covid_data of step 10, downloading and parsing the whole COVID-19 history from a local HTTP server
+- reviews: the parsing and cleaning of the review pages in get_amazon_reviews of step 20 (10 reviews per page)
+- transform: the classification and the aggregation of the reviews per product and day in step 30
+- ingest: ingestion.send_dataframe of the transformed reviews into a SQLite database (see local_job_input.py)
+- correlation: weekly_correlation of step 40 over the daily data
+- correlation_matrix: read_weekly_data of step 40 from the SQLite database and the correlations of all signals,
+  categories, lags and windows over the whole history (the first run of the step)
+
+Each benchmark reports the best time of --repeat runs. The results are appended to results.jsonl (next to this file)
+with the current git commit, and compared with the previous result of the same benchmark and scale: a benchmark
+REGRESSION_FACTOR times slower is reported as a regression (and fails the run with --check).
+
+    python benchmarks/bench_steps.py [--scales 1000,10000,100000] [--only covid,transform] [--repeat 3] [--check]
+
+The daily series (covid, correlation) are limited to generators.MAX_DAYS dates (until 9999-12-31).
+"""
+import argparse
+import http.server
+import json
+import pathlib
+import platform
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent / "sample scripts"))
+import classify  # noqa: E402
+import ingestion  # noqa: E402
+import sources  # noqa: E402
+from local_job_input import LocalJobInput  # noqa: E402
+
+import generators  # noqa: E402
+from job_steps import load_step  # noqa: E402
+
+RESULTS_FILE = pathlib.Path(__file__).parent / "results.jsonl"
+REGRESSION_FACTOR = 1.5
+PREFIX = "bench"
+
+
+class _PageFetcher:
+    """Returns the given pages like fetcher.PageFetcher.pages, without any requests."""
+
+    def __init__(self, pages: list):
+        self.pages_text = pages
+
+    def pages(self, url_for_page, prefetch: int = 2, first_page: int = 1):
+        for i, page in enumerate(self.pages_text[first_page - 1:], start=first_page):
+            yield i, page
+
+
+def _serve(body: bytes) -> http.server.ThreadingHTTPServer:
+    """Serves the body on a local port until shutdown."""
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _create_table(job_input: LocalJobInput, table: str):
+    columns = ingestion.table_schema(table)
+    job_input.execute_query(f"CREATE TABLE {PREFIX}_{table} ({', '.join(f'{c} {t}' for c, t in columns.items())})")
+
+
+def bench_covid(rows: int):
+    step = load_step("10_ingest_covid_data.py")
+    server = _serve(json.dumps(generators.covid_history(rows)).encode("utf-8"))
+    url = sources.COVID_CASES.url
+    sources.COVID_CASES.url = f"http://127.0.0.1:{server.server_port}/history"
+
+    def run():
+        return len(step.get_covid_data("1800-01-01")[0])
+
+    def close():
+        sources.COVID_CASES.url = url
+        server.shutdown()
+    return run, close
+
+
+def bench_reviews(rows: int):
+    step = load_step("20_ingest_amazon_reviews.py")
+    pages = generators.review_pages(generators.review_corpus(rows))
+    product = {'key': "B000000000_critical", 'product': "B000000000", 'name': "Candle", 'filter': "critical",
+               'start_date': None}
+
+    def run():
+        return sum(len(df) for df in step.get_amazon_reviews(product, "1800-01-01", _PageFetcher(pages)))
+    return run, None
+
+
+def bench_transform(rows: int):
+    step = load_step("30_transform_amazon_reviews.py")
+    df = generators.review_corpus(rows, products=10)
+
+    def run():
+        flags = classify.flag_categories(df['review'], step.COMPLAINT_CATEGORIES)
+        classify.count_categories(df, flags, ['product', 'date'])
+        return len(df)
+    return run, None
+
+
+def bench_ingest(rows: int):
+    df = generators.transformed_reviews(rows, products=10)
+    job_input = LocalJobInput()
+
+    def run():
+        job_input.execute_query(f"DROP TABLE IF EXISTS {PREFIX}_yankee_candle_reviews_transformed")
+        _create_table(job_input, "yankee_candle_reviews_transformed")
+        return ingestion.send_dataframe(job_input, df, f"{PREFIX}_yankee_candle_reviews_transformed")["rows"]
+    return run, job_input.close
+
+
+def bench_correlation(rows: int):
+    step = load_step("40_calculate_correlation.py")
+    df = generators.daily_data(rows)
+
+    def run():
+        step.weekly_correlation(df.copy(), step.new_correlation_state())
+        return len(df)
+    return run, None
+
+
+def bench_correlation_matrix(rows: int):
+    step = load_step("40_calculate_correlation.py")
+    job_input = LocalJobInput()
+    for table in ("covid_cases_usa_daily", "yankee_candle_reviews_transformed"):
+        _create_table(job_input, table)
+    covid = generators.covid_history(rows)['All']['dates']
+    job_input.send_tabular_data_for_ingestion(list(covid.items()), ['obs_date', 'number_of_cases'],
+                                              f"{PREFIX}_covid_cases_usa_daily")
+    reviews = generators.transformed_reviews(min(rows, generators.MAX_DAYS))
+    reviews['product'] = step.PRODUCT
+    job_input.send_tabular_data_for_ingestion(reviews.values.tolist(), reviews.columns.to_list(),
+                                              f"{PREFIX}_yankee_candle_reviews_transformed")
+
+    def run():
+        state = step.new_signals_state()
+        signals, reviews_weekly, _, _ = step.read_weekly_data(job_input, {'prefix': PREFIX}, state)
+        step.extend_signal_correlations(signals, reviews_weekly, state)
+        return len(covid) + len(reviews)
+    return run, job_input.close
+
+
+BENCHMARKS = {
+    'covid': bench_covid,
+    'reviews': bench_reviews,
+    'transform': bench_transform,
+    'ingest': bench_ingest,
+    'correlation': bench_correlation,
+    'correlation_matrix': bench_correlation_matrix,
+}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=pathlib.Path(__file__).parent,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def previous_results(path: pathlib.Path = RESULTS_FILE) -> dict:
+    """Returns the latest recorded result of each benchmark and scale."""
+
+    results = {}
+    if path.exists():
+        for line in path.read_text(encoding="utf-8").splitlines():
+            if line.strip():
+                result = json.loads(line)
+                results[(result['benchmark'], result['scale'])] = result
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default="1000,10000,100000", help="Comma separated numbers of rows")
+    parser.add_argument("--only", help=f"Comma separated benchmarks (default all: {', '.join(BENCHMARKS)})")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--check", action="store_true", help="Exit with an error if any benchmark regressed")
+    args = parser.parse_args()
+
+    names = args.only.split(",") if args.only else list(BENCHMARKS)
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+    scales = [int(float(scale)) for scale in args.scales.split(",")]
+
+    previous = previous_results()
+    commit = git_commit()
+    regressions = []
+    with open(RESULTS_FILE, "a", encoding="utf-8") as results:
+        for name in names:
+            for scale in scales:
+                run, close = BENCHMARKS[name](scale)
+                try:
+                    seconds = []
+                    for _ in range(args.repeat):
+                        start = time.perf_counter()
+                        rows = run()
+                        seconds.append(time.perf_counter() - start)
+                finally:
+                    if close is not None:
+                        close()
+                result = {
+                    'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                    'commit': commit,
+                    'python': platform.python_version(),
+                    'benchmark': name,
+                    'scale': scale,
+                    'rows': rows,
+                    'seconds': min(seconds),
+                    'rows_per_second': rows / max(min(seconds), 1e-9),
+                }
+                results.write(json.dumps(result) + "\n")
+
+                change = ""
+                before = previous.get((name, scale))
+                if before is not None:
+                    ratio = result['seconds'] / max(before['seconds'], 1e-9)
+                    change = f"{ratio:5.2f}x vs {before['commit'] or 'previous'}"
+                    if ratio > REGRESSION_FACTOR:
+                        change += "  REGRESSION"
+                        regressions.append(f"{name} at {scale}")
+                print(f"{name:<20} {scale:>10} {rows:>10} rows {result['seconds']:9.3f} s "
+                      f"{result['rows_per_second']:12.0f} rows/s  {change}")
+
+    if regressions and args.check:
+        sys.exit(f"Regressions: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
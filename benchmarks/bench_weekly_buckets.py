@@ -0,0 +1,80 @@
+"""
+Benchmark of weekly.weekly_buckets used in 40_calculate_correlation.py.
+
+Compares the time of the original weekly aggregation (sort descending, diff, copy, shift the dates by -6 days and
+resample on "W-MON") with weekly.weekly_buckets on synthetic daily data with missing dates. That both give exactly
+the same weeks and weekly numbers is checked by tests/test_weekly.py:
+
+    python benchmarks/bench_weekly_buckets.py [--days <number of days>] [--repeat <number of runs>]
+"""
+import argparse
+import pathlib
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent / "sample scripts"))
+import weekly  # noqa: E402
+
+
+def synthetic_daily_data(days: int, seed: int = 0) -> pd.DataFrame:
+    """Daily cumulative covid cases and "no scent" reviews, with about 5% of the dates missing."""
+
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2020-01-22", periods=days)
+    df = pd.DataFrame({
+        'date': dates,
+        'num_no_scent_reviews': rng.integers(0, 4, days).astype(float),
+        'number_of_covid_cases': np.cumsum(rng.integers(0, 200_000, days)),
+    })
+    return df[rng.random(days) > 0.05].reset_index(drop=True)
+
+
+def original_weekly(df_merged: pd.DataFrame) -> pd.DataFrame:
+    """The weekly aggregation of the original 40_calculate_correlation.py."""
+
+    df_merged = df_merged.sort_values('date', ascending=False).reset_index(drop=True)
+    df_merged['number_of_covid_cases_daily'] = df_merged['number_of_covid_cases'].diff(periods=-1).fillna(0)
+    df_merged_weekly = df_merged.copy()
+    df_merged_weekly['date'] = pd.to_datetime(df_merged_weekly['date']) - pd.to_timedelta(6, unit='D')
+    df_merged_weekly = df_merged_weekly.resample('W-MON', on='date').sum().reset_index()
+    return df_merged_weekly.rename(columns={'number_of_covid_cases_daily': 'number_of_covid_cases_weekly'})\
+                           .drop(columns=["number_of_covid_cases"])
+
+
+def vectorized_weekly(df_merged: pd.DataFrame) -> pd.DataFrame:
+    """The weekly aggregation with weekly.weekly_buckets (as in weekly_correlation)."""
+
+    cases = df_merged['number_of_covid_cases'].to_numpy(dtype=float)
+    weeks, sums = weekly.weekly_buckets(
+        df_merged['date'].to_numpy(),
+        np.column_stack([df_merged['num_no_scent_reviews'].to_numpy(dtype=float), np.diff(cases, prepend=cases[0])])
+    )
+    return pd.DataFrame({'date': weeks, 'num_no_scent_reviews': sums[:, 0],
+                         'number_of_covid_cases_weekly': sums[:, 1]})
+
+
+def measure(function, df: pd.DataFrame, repeat: int) -> tuple:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function(df)
+    return result, (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    df = synthetic_daily_data(args.days)
+    _, original_seconds = measure(original_weekly, df, args.repeat)
+    _, vectorized_seconds = measure(vectorized_weekly, df, args.repeat)
+    print(f"{len(df)} days: original {original_seconds * 1000:.2f} ms, weekly_buckets {vectorized_seconds * 1000:.2f} ms "
+          f"({original_seconds / vectorized_seconds:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
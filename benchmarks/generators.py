@@ -0,0 +1,144 @@
+"""
+Synthetic data generators for the benchmarks of the data job steps (see bench_steps.py) and of their functions.
+
+All generators are deterministic for a given seed and scale linearly with the number of rows:
+- covid_history: the cumulative COVID-19 cases per day in the format of the COVID-19 API (step 10)
+- review_texts: review texts, optionally with emojis and other non-ASCII characters (SYMBOLS)
+- review_corpus: raw reviews with product, date and review text (steps 20 and 30)
+- review_pages: Amazon-like review pages of a review corpus (step 20)
+- transformed_reviews: review counts per product and day (steps 30 and 40)
+- daily_data: the merged daily reviews and cumulative COVID-19 cases (step 40)
+- weekly_correlation: rows of the weekly correlation table (step 40)
+"""
+import html
+
+import numpy as np
+import pandas as pd
+
+WORDS = ("candle scent smell fragrance wax burn wick tunnel soot jar lid box broken great bad no weak strong "
+         "the a it is was i this not very product").split()
+# The dates are "YYYY-MM-DD" strings, so a daily series can't be longer than the days until 9999-12-31
+FIRST_DATE = np.datetime64('1900-01-01')
+MAX_DAYS = int((np.datetime64('9999-12-31') - FIRST_DATE).astype(int)) + 1
+SYMBOLS = ["\U0001F600", "\U0001F525", "\U0001F44E", "❤", "\U0001F92E", "\U0001FAE0", "é", "’"]
+CATEGORIES = ['no_scent', 'burn', 'wick', 'packaging']
+
+
+def _dates(days: int, last_date: str = '2022-10-10') -> np.ndarray:
+    """Returns the last `days` consecutive dates until last_date (or from FIRST_DATE for long series)."""
+
+    days = min(days, MAX_DAYS)
+    first = max(np.datetime64(last_date) - days + 1, FIRST_DATE)
+    return first + np.arange(days)
+
+
+def covid_history(days: int, seed: int = 0) -> dict:
+    """Returns the response of the COVID-19 API history endpoint with the cumulative cases of `days` dates."""
+
+    rng = np.random.default_rng(seed)
+    dates = _dates(days)
+    cases = np.cumsum(rng.integers(0, 200_000, len(dates)))
+    # The API lists the dates from the newest to the oldest
+    return {'All': {'country': 'US', 'dates': dict(zip(dates[::-1].astype(str).tolist(), cases[::-1].tolist()))}}
+
+
+def review_texts(rows: int, seed: int = 0, symbols: bool = False) -> np.ndarray:
+    """
+    Returns `rows` review texts of 5 to 60 words, some of them with several lines or emojis. With symbols,
+    the SYMBOLS are drawn like words.
+    """
+
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(5, 61, rows)
+    vocabulary = WORDS + SYMBOLS if symbols else WORDS
+    words = np.array(vocabulary, dtype=object)[rng.integers(0, len(vocabulary), lengths.sum())]
+    texts = [" ".join(text) for text in np.split(words, np.cumsum(lengths)[:-1])]
+    for i in np.flatnonzero(rng.random(rows) < 0.1):
+        texts[i] = texts[i].replace(" great ", " great & \U0001F600 ", 1).replace(" the ", "\nthe ", 1)
+    return np.array(texts, dtype=object)
+
+
+def review_corpus(rows: int, products: int = 1, days: int = 1000, seed: int = 0) -> pd.DataFrame:
+    """Returns `rows` raw reviews of the products over the last `days` dates, sorted from the newest."""
+
+    rng = np.random.default_rng(seed)
+    dates = _dates(days).astype(str)
+    df = pd.DataFrame({
+        'product': np.array([f"B{i:09d}" for i in range(products)])[rng.integers(0, products, rows)],
+        'date': dates[rng.integers(0, len(dates), rows)],
+        'review': review_texts(rows, seed),
+    })
+    return df.sort_values('date', ascending=False, kind='stable', ignore_index=True)
+
+
+def review_pages(reviews: pd.DataFrame, reviews_per_page: int = 10, seed: int = 0) -> list:
+    """
+    Returns the review pages of the reviews (sorted from the newest), `reviews_per_page` reviews per page, followed
+    by an empty last page. Like the Amazon pages, each page starts with the top positive and critical reviews,
+    and some reviews start with a "The media could not be loaded." line.
+    """
+
+    rng = np.random.default_rng(seed)
+    media = rng.random(len(reviews)) < 0.1
+
+    def date_span(date: str) -> str:
+        return ('<span data-hook="review-date" class="a-size-base a-color-secondary review-date">'
+                f'Reviewed in the United States on {pd.Timestamp(date):%B %d, %Y}</span>')
+
+    head = ('<html><head><title>Reviews</title></head><body><div id="cm_cr-product_info">Yankee Candle</div>' +
+            "".join(f'<div class="a-row a-spacing-top-mini">{date_span("2020-01-01")}</div>' for _ in range(2)) +
+            '<div id="cm_cr-review_list">')
+    containers = [
+        f'<div data-hook="review" class="a-section review aok-relative">'
+        f'<div class="a-row"><span class="a-profile-name">Customer {i}</span></div>\n{date_span(date)}\n'
+        f'<div class="a-row a-spacing-small review-data">'
+        f'<span data-hook="review-body" class="a-size-base review-text review-text-content">\n'
+        f'  <span>\n  {"The media could not be loaded." + chr(10) if with_media else ""}'
+        f'{html.escape(review).replace(chr(10), "<br/>" + chr(10))}\n</span>\n</span></div></div>\n'
+        for i, (date, review, with_media) in enumerate(zip(reviews['date'], reviews['review'], media))
+    ]
+    pages = ["".join([head, *containers[i:i + reviews_per_page], '</div></body></html>'])
+             for i in range(0, len(containers), reviews_per_page)]
+    return pages + [head + '</div></body></html>']
+
+
+def transformed_reviews(rows: int, products: int = 1, seed: int = 0) -> pd.DataFrame:
+    """Returns `rows` rows of the transformed reviews table (review counts per product and day)."""
+
+    rng = np.random.default_rng(seed)
+    days = -(-rows // products)
+    dates = np.tile(_dates(days).astype(str), products)[:rows]
+    negative = rng.integers(0, 50, rows)
+    return pd.DataFrame({
+        'product': np.repeat([f"B{i:09d}" for i in range(products)], days)[:rows],
+        'review_filter': 'critical',
+        'date': dates,
+        'num_negative_reviews': negative,
+        **{f"num_{name}_reviews": rng.integers(0, negative + 1) for name in CATEGORIES},
+    })
+
+
+def daily_data(days: int, seed: int = 0) -> pd.DataFrame:
+    """Returns the merged daily "no scent" reviews and cumulative COVID-19 cases, as read by step 40."""
+
+    rng = np.random.default_rng(seed)
+    dates = _dates(days)
+    return pd.DataFrame({
+        # Day precision: nanosecond timestamps can't go past 2262-04-11
+        'date': dates,
+        'num_no_scent_reviews': rng.integers(0, 5, len(dates)),
+        'number_of_covid_cases': np.cumsum(rng.integers(0, 200_000, len(dates))),
+    })
+
+
+def weekly_correlation(rows: int, seed: int = 0) -> pd.DataFrame:
+    """Returns `rows` rows of the weekly correlation table, some of them without a correlation coefficient."""
+
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        # Weekly dates, repeated if there are more rows than weeks
+        'date': np.resize(_dates(rows * 7)[::7].astype(str), rows),
+        'num_no_scent_reviews': rng.integers(0, 50, rows).astype(float),
+        'number_of_covid_cases_weekly': rng.integers(0, 5_000_000, rows).astype(float),
+        'correlation_coeff': np.where(rng.random(rows) < 0.1, np.nan, rng.uniform(-1, 1, rows)),
+    })
@@ -0,0 +1,28 @@
+"""
+Loading of the data job steps for the benchmarks. Only uses the standard library, so that loading a step
+imports exactly what the step imports (see bench_import_time.py).
+"""
+import pathlib
+import types
+
+JOB_DIR = pathlib.Path(__file__).parent.parent / "sample scripts"
+
+
+def load_step(name: str) -> types.ModuleType:
+    """
+    Load the functions of a job step. The steps contain the blanks of the exercises (marked with !!!),
+    so the top level functions with blanks (e.g. run) are left out.
+    """
+
+    blocks = [[]]
+    for line in (JOB_DIR / name).read_text(encoding="utf-8").splitlines(keepends=True):
+        # A top level function or class starts a new block, together with its decorators
+        decorated = blocks[-1] and blocks[-1][-1].startswith("@")
+        if line.startswith(("@", "def ", "class ")) and not decorated:
+            blocks.append([])
+        blocks[-1].append(line)
+    source = "".join("".join(block) for block in blocks if "!!!" not in "".join(block))
+    module = types.ModuleType(pathlib.Path(name).stem)
+    module.__file__ = str(JOB_DIR / name)
+    exec(compile(source, module.__file__, "exec"), module.__dict__)
+    return module
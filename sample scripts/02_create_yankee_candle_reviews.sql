@@ -1,8 +1,11 @@
--- Create a table that will store the Amazon Yankee candle reviews with 2 columns: date and review
+-- Create a table that will store the Amazon Yankee candle reviews with 4 columns: product (ASIN), review filter
+-- (e.g. critical), date and review. The reviews of all products in products.ini are stored in this table.
 -- Table naming convention: prefix + _ + yankee_candle_reviews 
 
 
 CREATE TABLE IF NOT EXISTS {prefix}_yankee_candle_reviews (
+    Product VARCHAR,
+    Review_filter VARCHAR,
     Date VARCHAR,
     Review VARCHAR
 )
@@ -1,10 +1,17 @@
--- Create a table that will store the transformed Amazon reviews table with 3 columns:
--- date, number of total negative reviews and number of negative reviews indicating "no scent".
+-- Create a table that will store the transformed Amazon reviews table with the columns: product (ASIN),
+-- review filter (e.g. critical), date, number of total reviews (the negative reviews of the critical filter)
+-- and number of reviews of each complaint category
+-- (indicating "no scent", burning, wick or packaging issues - see COMPLAINT_CATEGORIES in 30_transform_amazon_reviews.py).
 -- Table naming convention: prefix + _ + yankee_candle_reviews_transformed 
 
 
 CREATE TABLE IF NOT EXISTS /*!!! ENTER THE NAME OF THE TABLE HERE !!!*/ (
+    product VARCHAR,
+    review_filter VARCHAR,
     date VARCHAR,
     num_negative_reviews INTEGER,
-    num_no_scent_reviews INTEGER
+    num_no_scent_reviews INTEGER,
+    num_burn_reviews INTEGER,
+    num_wick_reviews INTEGER,
+    num_packaging_reviews INTEGER
 )
@@ -0,0 +1,12 @@
+-- Create a table that will store the correlation coefficients between each time series (e.g. COVID cases, see
+-- sources.py) and the number of reviews of each complaint category (e.g. no_scent), calculated each week.
+-- Table naming convention: prefix + _ + correlation_matrix
+
+
+CREATE TABLE IF NOT EXISTS {prefix}_correlation_matrix (
+    date VARCHAR,
+    signal VARCHAR,
+    category VARCHAR,
+    correlation_coeff REAL,
+    num_weeks INTEGER
+)
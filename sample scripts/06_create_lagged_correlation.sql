@@ -0,0 +1,16 @@
+-- Create a table that will store the lagged and rolling correlation coefficients between each time series and
+-- each review category, with their p-values (see CORRELATION_MODE in 40_calculate_correlation.py).
+-- One row per week, signal, category, window size (0 for the expanding window) and lag.
+-- Table naming convention: prefix + _ + lagged_correlation
+
+
+CREATE TABLE IF NOT EXISTS {prefix}_lagged_correlation (
+    date VARCHAR,
+    signal VARCHAR,
+    category VARCHAR,
+    window_weeks INTEGER,
+    lag_weeks INTEGER,
+    correlation_coeff REAL,
+    p_value REAL,
+    num_weeks INTEGER
+)
@@ -0,0 +1,11 @@
+-- Create a table that will store the metrics of each run of the Python steps (see metrics.py), e.g. the time spent
+-- fetching the review pages or the number of ingested rows. Only used if the metrics_table property is true.
+-- Table naming convention: prefix + _ + job_stats
+
+
+CREATE TABLE IF NOT EXISTS {prefix}_job_stats (
+    run_time VARCHAR,
+    step VARCHAR,
+    metric VARCHAR,
+    value REAL
+)
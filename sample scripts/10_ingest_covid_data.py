@@ -1,36 +1,48 @@
 # Copyright 2021 VMware, Inc.
 # SPDX-License-Identifier: Apache-2.0
 import logging
-import requests
-import pandas as pd
+import ingestion
+import metrics
+import sources
 from vdk.api.job_input import IJobInput
 
 log = logging.getLogger(__name__)
 
 
-def get_covid_data(last_date_covid):
-    # Initialize URL
-    url = "https://covid-api.mmediagroup.fr/v1/history?country=US&status=confirmed"
+def get_covid_data(last_date_covid: str, validators: dict = None) -> tuple:
+    """
+    Get the cumulative number of COVID-19 cases in the US for the dates after last_date_covid.
+    The request is conditional on the validators (ETag and Last-Modified) of the previous response, so nothing
+    is downloaded if the data hasn't changed (see sources.CovidCasesSource). Returns the new rows and the validators
+    of the response.
+    """
+
+    df_covid, validators = sources.COVID_CASES.fetch(last_date_covid, validators)
+    if len(df_covid) == 0:
+        log.info("No new COVID-19 data since the previous run.")
+    return df_covid.rename(columns={'date': 'obs_date', 'value': 'number_of_cases'}), validators
 
-    # Make a GET request to the COVID-19 API
-    response = requests.get(url)
-    # Check if the request was successful
-    response.raise_for_status()
 
-    dates_cases = response.json()['All']['dates']
-    # Reformat the dictionary
-    dates_cases_dict = {'obs_date': [], 'number_of_cases': []}
+def ingest_sources(job_input: IJobInput, props: dict):
+    """Ingest the new values of the other time series sources (see sources.py) into their tables."""
 
-    for key, value in dates_cases.items():
-        dates_cases_dict['obs_date'].append(key)
-        dates_cases_dict['number_of_cases'].append(value)
+    for source in sources.SOURCES:
+        if source is sources.COVID_CASES:
+            continue
+        # Each source keeps its latest ingested date and the state of its fetch in the sources property
+        source_props = props.setdefault("sources", {}).setdefault(source.name, {'last_date': '2020-01-01', 'state': None})
+        df, source_props['state'] = source.fetch(source_props['last_date'], source_props['state'])
+        if len(df) > 0:
+            ingestion.send_dataframe(
+                job_input, df.rename(columns={'date': source.date_column, 'value': source.value_column}),
+                destination_table=f"{props['prefix']}_{source.table}"
+            )
+            source_props['last_date'] = df['date'].iloc[-1]
+        job_input.set_all_properties(props)
+        log.info(f"Success! {len(df)} rows were inserted in the {source.name} table.")
 
-    # Convert the dictionary into a DF
-    df_covid = pd.DataFrame.from_dict(dates_cases_dict)
-    # Keep only the dates which are not present in the table already (based on last_date_covid property)
-    df_covid = df_covid[df_covid['obs_date'] > last_date_covid]
-    return df_covid
 
+@metrics.step
 def run(job_input: IJobInput):
     """
     Collect COVID-19 historical data for number of cases per day in the US since the start of the pandemic through
@@ -48,17 +60,21 @@ def run(job_input: IJobInput):
     else:
         props["last_date_covid"] = '2020-01-01'
 
-    df_covid = get_covid_data(props["last_date_covid"])
+    df_covid, validators = get_covid_data(props["last_date_covid"], props.get("covid_api_validators"))
 
-    # Ingest the dictionary into a SQLite database using VDK's job_input method (if any results are fetched)
+    # Ingest the dictionary into the DB with a few multi-row INSERT statements (if any results are fetched)
+    # See ingestion.send_dataframe
     if len(df_covid) > 0:
-        job_input.send_tabular_data_for_ingestion(
-            rows=df_covid.values,
-            column_names=df_covid.columns.to_list(),
+        ingestion.send_dataframe(
+            job_input, df_covid,
             destination_table=f"" # <- !!! ENTER BETWEEN THE QUOTATION MARKS THE NAME OF THE TABLE CREATED IN SCRIPT 01_create_covid_cases_usa_daily.sql) !!!
         )
         # Reset the last_date property value to the latest date in the covid source db table
         props["last_date_covid"] = max(df_covid['obs_date'])
-        job_input.set_all_properties(props)
+    # Save the validators of the API response, so that the next run only downloads the data if it has changed
+    props["covid_api_validators"] = validators
+    job_input.set_all_properties(props)
 
     log.info(f"Success! {len(df_covid)} rows were inserted in the daily covid cases table.")
+
+    ingest_sources(job_input, props)
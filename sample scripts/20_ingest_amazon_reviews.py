@@ -2,106 +2,341 @@
 # SPDX-License-Identifier: Apache-2.0
 import pandas as pd
 import logging
-import datefinder
 from datetime import datetime
-import time
+import configparser
+import pathlib
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable
 import webscrape
+import fetcher
+import archive
+import dedup
+import ingestion
+import metrics
 from vdk.api.job_input import IJobInput
 
 log = logging.getLogger(__name__)
 
 
-def get_amazon_reviews(last_date_amazon: datetime):
-    # Initialize variables
-    i = 1
-    rev_result = []
-    date_result = []
+# Settings of the review page fetcher: number of parallel requests, requests per second,
+# number of pages fetched ahead of the one being processed and number of retries of a failed request.
+# The requests for all products share these limits.
+MAX_WORKERS = 4
+REQUESTS_PER_SECOND = 1.0
+PREFETCH_PAGES = 2
+RETRIES = 3
+# Number of products scraped at the same time
+MAX_PARALLEL_PRODUCTS = 4
+# File with the products to scrape
+PRODUCTS_FILE = pathlib.Path(__file__).parent / "products.ini"
+# The fetched review pages are archived in this directory (see archive.py), unless the page_archive_dir
+# property is set to another directory.
+ARCHIVE_DIR = pathlib.Path(__file__).parent / "page_archive"
+# "crawl" scrapes the new reviews from Amazon. "replay" rebuilds the reviews from the latest archived pages of each
+# product without any requests, e.g. to backfill a new table after changing the cleaning rules.
+# Can be overridden with the scrape_mode property.
+SCRAPE_MODE = "crawl"
+# Number of processes parsing the archived pages in the replay mode (None for one per CPU)
+REPLAY_WORKERS = None
+
+# Sum of the validation reports of the pages scraped by the current run (see webscrape.page_reviews).
+# The products are scraped in several threads, so it is only updated by count_extraction.
+extraction_counters = Counter()
+counters_lock = threading.Lock()
+
+
+def count_extraction(report: dict):
+    """Add the validation report of a page to the extraction counters."""
+
+    with counters_lock:
+        extraction_counters.update(report)
+
+
+def get_products(path: pathlib.Path = PRODUCTS_FILE) -> list:
+    """
+    Read the products to scrape from the products file. Returns a list with one dictionary for each product
+    and star filter, with keys: key (used in the data job properties), product (ASIN), name, filter and start_date.
+    """
+
+    config = configparser.ConfigParser()
+    if not config.read(path):
+        raise FileNotFoundError(f"Products file {path} not found.")
+    products = []
+    for asin in config.sections():
+        for review_filter in config[asin].get('filters', 'critical').split(','):
+            products.append({
+                'key': f"{asin}_{review_filter.strip()}",
+                'product': asin,
+                'name': config[asin]['name'],
+                'filter': review_filter.strip(),
+                'start_date': config[asin].get('start_date')
+            })
+    return products
+
+
+def review_page_url(product: dict, i: int) -> str:
+    """Returns the URL of the i-th page of the product reviews sorted by most recent."""
+
+    # Parameterize the URL to iterate over the pages
+    return f"https://www.amazon.com/{product['name']}/product-reviews/{product['product']}/ref=cm_cr_arp_d_" \
+           f"viewopt_srt?ie=UTF8&reviewerType=all_reviews&filterByStar={product['filter']}&pageNumber={i}&sortBy=recent"
+
+
+def review_frame(product: dict, dates: list, reviews: list) -> pd.DataFrame:
+    """
+    Returns the reviews of a page (see webscrape.page_reviews) as a dataframe with the Product, Review_filter,
+    Date and Review columns.
+    """
+
+    # Create a pandas dataframe with the product, review text and dates
+    df = pd.DataFrame(zip(dates, reviews), columns=['Date', 'Review'])
+    df.insert(0, 'Product', product['product'])
+    df.insert(1, 'Review_filter', product['filter'])
+    # Remove emojis from the Review column since they are not utf-8 compliant and break ingestion
+    return df.assign(Review=webscrape.remove_emoji_column(df['Review']))
+
+
+def new_reviews(df: pd.DataFrame, last_date_amazon: str, seen: dedup.SeenSet, crawled: dedup.SeenSet,
+                crawl: dict = None) -> tuple:
+    """
+    Keep the reviews which haven't been ingested yet: not in the seen set of the product (the hashes of its ingested
+    reviews of last_date_amazon, see dedup.py), not found earlier by the current crawl (crawled, to which the reviews
+    are added), not in the dates ingested by the interrupted crawl and not older than last_date_amazon.
+    Returns the new reviews and whether all reviews had been seen.
+    """
+
+    hashes = dedup.review_hashes(df['Date'], df['Review'])
+    ingested = seen.contains(hashes)
+    known = ingested | crawled.contains(hashes)
+    crawled.add(hashes)
+    if len(seen) > 0:
+        # New reviews of the last ingested date are kept, the ones already ingested are recognized by their hash
+        keep = (df['Date'] >= last_date_amazon).to_numpy() & ~known
+    else:
+        # Products without saved hashes (never scraped) are filtered by the last ingested date
+        keep = (df['Date'] > last_date_amazon).to_numpy() & ~known
+    # The dates between the oldest and the newest date of the interrupted crawl have been ingested completely,
+    # the reviews of these two dates which it ingested are recognized by their hash
+    if crawl:
+        outside = ((df['Date'] < crawl['oldest']) | (df['Date'] > crawl['newest'])).to_numpy()
+        on_edge = (df['Date'] == crawl['oldest']).to_numpy() | (df['Date'] == crawl['newest']).to_numpy()
+        edge_seen = dedup.SeenSet.loads(crawl.get('oldest_seen'))
+        edge_seen.add(dedup.SeenSet.loads(crawl.get('newest_seen')).hashes)
+        keep &= outside | (on_edge & ~edge_seen.contains(hashes))
+    return df[keep], len(df) > 0 and bool(ingested.all())
+
+
+def get_amazon_reviews(product: dict, last_date_amazon: str, page_fetcher: fetcher.PageFetcher, crawl: dict = None,
+                       seen: dedup.SeenSet = None):
+    """
+    Scrape the reviews of the product newer than last_date_amazon page by page. Yields the cleaned reviews of
+    each page as a dataframe, so that they can be ingested before going to the next page. The reviews in the seen set
+    and the reviews already ingested by an interrupted crawl (see ingest_product_reviews below) are skipped.
+    """
+
+    seen = seen if seen is not None else dedup.SeenSet()
+    crawled = dedup.SeenSet()
+
     # Date to start iterating from = current date (in the format "2020-01-01")
     date = datetime.now().strftime("%Y-%m-%d")
+    # Reviews of the oldest date on the previous page (the same date may continue on the next page)
+    df_pending = pd.DataFrame(columns=['Product', 'Review_filter', 'Date', 'Review'])
+
+    # Go through the review pages and scrape reviews. The next pages are fetched in the background while
+    # the current one is processed, and the remaining ones are cancelled once the last ingested date is reached.
+    for i, htmldata in page_fetcher.pages(partial(review_page_url, product), prefetch=PREFETCH_PAGES):
+        log.info(f'Rendering page {i} of {product["key"]}...')
+        # Get the cleaned reviews and their dates for the current page from the HTML code
+        with metrics.timer("parse"):
+            date_result, rev_result, report = webscrape.page_reviews(htmldata)
+        count_extraction(report)
+        if date_result:
+            date = date_result[-1]
+        log.info(f"{len(rev_result)} reviews found on page {i} of {product['key']} (validation report: {report})")
+        with metrics.timer("clean"):
+            df, all_seen = new_reviews(review_frame(product, date_result, rev_result), last_date_amazon, seen,
+                                       crawled, crawl)
+        df = pd.concat([df_pending, df], ignore_index=True)
+        # A page with only ingested reviews continues the reviews of the previous runs, unless it is part of
+        # the dates ingested by the interrupted crawl
+        all_seen = all_seen and (not crawl or date < crawl['oldest'])
+
+        # Stop once the reviews reach the last ingested date or an already ingested page, or there are no more reviews
+        if date <= last_date_amazon or all_seen or report['reviews'] == 0:
+            yield df
+            break
+
+        # Only yield the complete dates, so that an interrupted crawl can be resumed by date
+        complete = df['Date'] > date
+        df_pending = df[~complete]
+        yield df[complete]
+
+
+def replay_amazon_reviews(product: dict, last_date_amazon: str, page_archive: archive.PageArchive,
+                          crawl: dict = None, seen: dedup.SeenSet = None):
+    """
+    Rebuild the reviews of the product newer than last_date_amazon from its archived review pages, parsed in
+    a process pool. Yields the reviews of all pages as one dataframe, like get_amazon_reviews.
+    """
+
+    # The latest archived page of each page number, until the first page number which was never fetched
+    latest = page_archive.latest()
+    hashes = []
+    while review_page_url(product, len(hashes) + 1) in latest:
+        hashes.append(latest[review_page_url(product, len(hashes) + 1)])
+    log.info(f"Replaying {len(hashes)} archived pages of {product['key']}...")
+
+    with metrics.timer("parse"):
+        pages = archive.replay(page_archive, hashes, webscrape.page_reviews, max_workers=REPLAY_WORKERS)
+    # Pages fetched at different times overlap when new reviews have pushed the older ones to the next pages.
+    # The reviews found on a previous page are skipped like in get_amazon_reviews.
+    seen = seen if seen is not None else dedup.SeenSet()
+    crawled = dedup.SeenSet()
+    for _, _, report in pages:
+        count_extraction(report)
+    with metrics.timer("clean"):
+        df = pd.concat([pd.DataFrame(columns=['Product', 'Review_filter', 'Date', 'Review'])] +
+                       [new_reviews(review_frame(product, dates, reviews), last_date_amazon, seen, crawled, crawl)[0]
+                        for dates, reviews, _ in pages],
+                       ignore_index=True)
+    yield df
+
+
+def crawl_progress(crawl: dict, df: pd.DataFrame) -> dict:
+    """
+    Returns the progress of the crawl after ingesting the reviews: the oldest and the newest ingested date and
+    the hashes of the ingested reviews of these two dates (oldest_seen and newest_seen).
+    """
+
+    progress = {}
+    for edge, pick in (('oldest', min), ('newest', max)):
+        date = pick(df['Date'])
+        on_date = (df['Date'] == date).to_numpy()
+        edge_seen = dedup.SeenSet(dedup.review_hashes(df['Date'][on_date], df['Review'][on_date]))
+        if crawl is not None and pick(crawl[edge], date) != date:
+            date, edge_seen = crawl[edge], dedup.SeenSet.loads(crawl.get(f'{edge}_seen'))
+        elif crawl is not None and crawl[edge] == date:
+            edge_seen.add(dedup.SeenSet.loads(crawl.get(f'{edge}_seen')).hashes)
+        progress[edge], progress[f'{edge}_seen'] = date, edge_seen.dumps()
+    return progress
 
-    # Go through the review pages and scrape reviews
-    while date > last_date_amazon:
-        log.info(f'Rendering page {i}...')
-        # Parameterize the URL to iterate over the pages
-        url = f"https://www.amazon.com/Yankee-Candle-Large-Balsam-Cedar/product-reviews/B000JDGC78/ref=cm_cr_arp_d_\
-            viewopt_srt?ie=UTF8&reviewerType=all_reviews&filterByStar=critical&pageNumber={i}&sortBy=recent"
-
-        # Get HTML code into a BeautifulSoup object
-        soup = webscrape.html_code(url)
-        # Get the reviews and dates for the current page
-        rev_page = webscrape.cus_rev(soup)
-        date_page = webscrape.rev_date(soup)[2:]
-
-        # Append reviews text into a list removing the empty reviews
-        for j in rev_page:
-            if j.strip() == "" or j.strip() == "The media could not be loaded.":
-                pass
-            else:
-                rev_result.append(j.strip())
-        log.info(len(rev_result))
-
-        # Append review dates into a list by extracting the date from text
-        for d in date_page:
-            if d.strip() == "":
-                pass
-            else:
-                # Initially, dates are in the format "Reviewed in the United States on February 14, 2022"
-                # datefinder package extracts the date from the text and converts it to datetime object
-                date_match = datefinder.find_dates(d)
-                for date in date_match:
-                    # Convert to string
-                    date = date.strftime("%Y-%m-%d")
-                    date_result.append(date)
-        log.info(len(date_result))
-
-        # In each page, check whether there are more dates than reviews (empty reviews with photo only) and remove them
-        while len(rev_result) < len(date_result):
-            date_result.pop(-1)
-
-        # Go to the next page
-        i += 1
-
-    # Create a pandas dataframe with the review text and dates
-    df = pd.DataFrame(zip(date_result, rev_result), columns=['Date', 'Review'])
-    # Since the while loop above always executes at least once (current timestamp > last ingested review), the first review
-    # page will always be scraped, so delete the already ingested records manually from the df using the DJ property
-    df = df[df['Date'] > last_date_amazon]
-    # Remove emojis from the Review column since they are not utf-8 compliant and break ingestion
-    for i in range(0, len(df)):
-        # Go through each review and clean it if needed
-        df.loc[i, 'Review'] = webscrape.remove_emoji(df.loc[i, 'Review'])
-    return df
 
+def send_reviews(job_input: IJobInput, df: pd.DataFrame, destination_table: str):
+    """Ingest the reviews of a page into the destination table."""
+
+    # Ingest the dataframe into a SQLite database using VDK's job_input method
+    job_input.send_tabular_data_for_ingestion(
+        rows=df. , # <- !!! ENTER HERE THE VALUES THAT WILL BE INSERTED INTO THE ROWS OF THE TABLE !!!
+        column_names=df. , # <- !!! ENTER HERE THE COLUMNS NAMES USING THE SAME COLUMN NAMES AS IN THE REVIEWS DATA FRAME !!!
+        destination_table=destination_table
+    )
+
+
+def ingest_product_reviews(job_input: IJobInput, props: dict, lock: threading.Lock, product: dict,
+                           scrape: Callable) -> int:
+    """
+    Scrape the new reviews of the product and ingest them. scrape yields the reviews like get_amazon_reviews
+    (with its arguments product, last_date_amazon, crawl and seen). Returns the number of ingested reviews.
+    """
+
+    key = product['key']
+    with lock:
+        # Products scraped for the first time start from their start_date or from the last_date_amazon property
+        last_date_amazon = props["last_date_amazon_products"].get(key, product['start_date'] or props["last_date_amazon"])
+        # The dates ingested so far by the current crawl. Set only if the crawl hasn't finished yet.
+        crawl = props["amazon_crawl"].get(key)
+        # The hashes of the ingested reviews of the last ingested date of the product
+        saved = props["amazon_seen_reviews"].get(key)
+        seen = dedup.SeenSet.loads(saved['hashes'] if saved and saved['date'] == last_date_amazon else None)
+    total = 0
+    # The ingested reviews are only newer than last_date_amazon, so they are visible once the number of reviews
+    # of the product from that date has grown by the number of ingested reviews
+    condition = f"Product = '{product['product']}' AND Review_filter = '{product['filter']}' " \
+                f"AND Date >= '{last_date_amazon}'"
+    baseline = job_input.execute_query(f"SELECT count(*) FROM {props['prefix']}_yankee_candle_reviews "
+                                       f"WHERE {condition}")[0][0]
+
+    for df in scrape(product, last_date_amazon, crawl=crawl, seen=seen):
+        # Ingest the dataframe (if any results are fetched)
+        if len(df) > 0:
+            with metrics.timer("ingest"):
+                send_reviews(job_input, df, f"{props['prefix']}_yankee_candle_reviews")
+            metrics.count("ingest_rows", len(df))
+            total += len(df)
+            # The ingestion waits for the data to be sent (see ingester_wait_to_finish_after_every_send in config.ini),
+            # so save the progress of the crawl. Pages go from the newest to the oldest reviews, so all the dates
+            # between the oldest and the newest ingested date have been ingested.
+            crawl = crawl_progress(crawl, df)
+            with lock:
+                props["amazon_crawl"][key] = crawl
+                job_input.set_all_properties(props)
+
+    # Reset the last_date property value of the product to its latest ingested date once the crawl is finished.
+    # Only the hashes of the reviews of that date are kept, as the older reviews are skipped by their date.
+    if crawl:
+        newest_seen = dedup.SeenSet.loads(crawl.get('newest_seen'))
+        if crawl['newest'] == last_date_amazon:
+            newest_seen.add(seen.hashes)
+        with lock:
+            props["last_date_amazon_products"][key] = crawl['newest']
+            props["amazon_seen_reviews"][key] = {'date': crawl['newest'], 'hashes': newest_seen.dumps()}
+            del props["amazon_crawl"][key]
+            job_input.set_all_properties(props)
+
+    # Wait until the ingested reviews are visible in the table, so that the next steps can read them
+    if total > 0:
+        ingestion.wait_for_rows(job_input, f"{props['prefix']}_yankee_candle_reviews", condition, baseline + total)
+
+    log.info(f"{total} reviews of {key} were ingested.")
+    return total
+
+
+@metrics.step
 def run(job_input: IJobInput):
     """
-    Scrape bad Amazon Reviews for one of the most popular Yankee candles on Amazon
-    and ingest them into a cloud Trino database.
+    Scrape bad Amazon Reviews for the products in products.ini (one of the most popular Yankee candles
+    on Amazon by default) and ingest them into a cloud Trino database.
     """
 
     log.info(f"Starting job step {__name__}")
 
     # Create/retrieve the data job property storing latest ingested date for yankee_candle_reviews table.
     # If the property does not exist, set it to "2020-01-01" (around the start of the pandemic).
+    # Each product keeps its own latest ingested date in the last_date_amazon_products property.
     props = job_input.get_all_properties()
     if "last_date_amazon" in props:
         pass
     else:
         # <- !!! INITIALIZE THE "last_date_amazon" PROPERTY TO '2020-01-01' !!!
-    df = get_amazon_reviews(props['last_date_amazon'])
-    
-    log.info(f"Shape of the review dataset: {df.shape}")
-
-    # Ingest the dataframe into a SQLite database using VDK's job_input method (if any results are fetched)
-    if len(df) > 0:
-        job_input.send_tabular_data_for_ingestion(
-            rows=df. , # <- !!! ENTER HERE THE VALUES THAT WILL BE INSERTED INTO THE ROWS OF THE TABLE !!!
-            column_names=df. , # <- !!! ENTER HERE THE COLUMNS NAMES USING THE SAME COLUMN NAMES AS IN THE REVIEWS DATA FRAME !!!
-            destination_table=f"{props['prefix']}_yankee_candle_reviews"
-        )
-        # Reset the last_date property value to the latest date in the amazon source db table
-        props["last_date_amazon"] = max(df['Date'])
-        job_input.set_all_properties(props)
-
-    log.info(f"Success! {len(df)} rows were inserted in raw yankee candle reviews table.")
-    # Delay execution for 10 seconds so that records are ingested into the DB before going to the next script
-    time.sleep(10)
+    props.setdefault("last_date_amazon_products", {})
+    props.setdefault("amazon_crawl", {})
+    props.setdefault("amazon_seen_reviews", {})
+
+    extraction_counters.clear()
+    mode = props.get("scrape_mode", SCRAPE_MODE)
+    if mode not in ("crawl", "replay"):
+        raise ValueError(f"Unknown scrape mode '{mode}'. Use 'crawl' or 'replay'.")
+    page_archive = archive.PageArchive(props.get("page_archive_dir", ARCHIVE_DIR))
+
+    # Scrape several products in parallel. All their requests go through the same page fetcher,
+    # so they share the request rate limit. The replay mode parses the pages of one product at a time
+    # in a process pool instead.
+    products = get_products()
+    lock = threading.Lock()
+    with fetcher.PageFetcher(max_workers=MAX_WORKERS, rate=REQUESTS_PER_SECOND, retries=RETRIES,
+                             archive=page_archive) as page_fetcher, \
+            ThreadPoolExecutor(max_workers=MAX_PARALLEL_PRODUCTS if mode == "crawl" else 1) as executor:
+        if mode == "crawl":
+            scrape = partial(get_amazon_reviews, page_fetcher=page_fetcher)
+        else:
+            scrape = partial(replay_amazon_reviews, page_archive=page_archive)
+        # The products are scraped in other threads, which measure into this step
+        totals = list(executor.map(
+            metrics.in_step(lambda product: ingest_product_reviews(job_input, props, lock, product, scrape)), products
+        ))
+
+    log.info(f"Reviews extracted: {dict(extraction_counters)}")
+    log.info(f"Success! {sum(totals)} rows were inserted in raw yankee candle reviews table.")
@@ -2,20 +2,129 @@
 # SPDX-License-Identifier: Apache-2.0
 import pandas as pd
 import logging
-import os
-import pathlib
-import time
+import classify
+import ingestion
+import metrics
+import queries
 from vdk.api.job_input import IJobInput
 
 log = logging.getLogger(__name__)
-# Make the current directory the same as the job directory
-os.chdir(pathlib.Path(__file__).parent.absolute())
 
+# Complaint categories and the words that indicate them (e.g. scent, smell or fragrance words for "no scent").
+# The number of reviews of each category per product and day is stored in the num_<category>_reviews column
+# of the transformed table.
+COMPLAINT_CATEGORIES = {
+    'no_scent': ['scent', 'smell', 'fragrance'],
+    'burn': ['burn', 'tunnel', 'soot', 'smoke'],
+    'wick': ['wick'],
+    'packaging': ['packag', 'broken', 'shatter', 'crack'],
+}
+# Where the reviews are aggregated (can be overridden by the transform_mode data job property):
+# - "pandas": read the reviews and aggregate them in the data job
+# - "sql": aggregate them with a query in the DB and only read the aggregated rows
+# - "insert": aggregate them and write the result into the transformed table with a single INSERT INTO ... SELECT query
+TRANSFORM_MODE = "pandas"
 
+
+def transform_ranges(props: dict) -> dict:
+    """
+    Returns the range of dates (first, last) to aggregate for each product and review filter, keyed by
+    (product, review filter): from its last transformed date (in the last_date_amazon_transformed_products property)
+    to its last ingested date (in the last_date_amazon_products property of step 20). The last transformed date
+    is aggregated again, as step 20 can ingest more reviews of that date after it was transformed. Products and
+    filters transformed for the first time are aggregated from their first review, so the products added with
+    an earlier start_date are transformed completely. The dates of a crawl which hasn't finished yet are left for
+    the next run, as the crawl can still ingest older dates.
+    """
+
+    transformed = props["last_date_amazon_transformed_products"]
+    ranges = {}
+    for key, last_date in props.get("last_date_amazon_products", {}).items():
+        # The keys of step 20 are "<ASIN>_<filter>" (ASINs don't contain underscores)
+        product, review_filter = key.split('_', 1)
+        ranges[(product, review_filter)] = (transformed.get(key, ''), last_date)
+    return ranges
+
+
+def range_condition(ranges: dict) -> str:
+    """Returns the SQL condition selecting the rows of each product and review filter in its range of dates."""
+
+    return " OR ".join(f"(product = '{product}' AND review_filter = '{review_filter}' "
+                       f"AND date >= '{first}' AND date <= '{last}')"
+                       for (product, review_filter), (first, last) in ranges.items())
+
+
+def update_transformed_dates(job_input: IJobInput, props: dict, ranges: dict):
+    """Save the properties with the last transformed date of each product and review filter (the end of its range)."""
+
+    for (product, review_filter), (_, last) in ranges.items():
+        props["last_date_amazon_transformed_products"][f"{product}_{review_filter}"] = last
+    job_input.set_all_properties(props)
+
+
+def wait_for_transformed_rows(job_input: IJobInput, table: str, condition: str, rows: int):
+    """
+    Wait until the rows sent by ingestion.send_dataframe are visible in the table, so that the next step can read
+    them. The multi-row INSERT statements of bulk ingestion are synchronous, so this only waits for the rows sent with
+    send_tabular_data_for_ingestion, which are ingested in the background. The rows of the aggregated ranges of
+    dates were deleted first (see range_condition), so the rows in these ranges are the sent ones.
+    """
+
+    if not ingestion.BULK_INGESTION:
+        ingestion.wait_for_rows(job_input, table, condition, rows)
+
+
+def transform_in_database(job_input: IJobInput, props: dict, mode: str, ranges: dict):
+    """
+    Count the reviews and the reviews of each complaint category per product, review filter and day in the DB,
+    so that the review texts are not transferred to the data job. Only the aggregated rows are read
+    (or none, in "insert" mode). The ranges of dates of each product and filter come from transform_ranges.
+    """
+
+    source_table = f"{props['prefix']}_yankee_candle_reviews"
+    destination_table = f"{props['prefix']}_yankee_candle_reviews_transformed"
+    condition = range_condition(ranges)
+
+    columns = ['product', 'review_filter', 'date', 'num_negative_reviews'] + \
+              [f"num_{name}_reviews" for name in COMPLAINT_CATEGORIES]
+    category_counts = ",\n".join(f"count_if(regexp_like(lower(Review), '{'|'.join(keywords)}')) AS num_{name}_reviews"
+                                 for name, keywords in COMPLAINT_CATEGORIES.items())
+    query = f"""
+        SELECT Product AS product,
+               Review_filter AS review_filter,
+               Date AS date,
+               count(*) AS num_negative_reviews,
+               {category_counts}
+        FROM {source_table}
+        WHERE {condition}
+        GROUP BY Product, Review_filter, Date
+        """
+    # Replace the transformed rows of the aggregated dates
+    job_input.execute_query(f"DELETE FROM {destination_table} WHERE {condition}")
+    if mode == "insert":
+        job_input.execute_query(f"INSERT INTO {destination_table} ({', '.join(columns)}) {query}")
+        log.info(f"Success! The reviews of {len(ranges)} products and filters were aggregated into the transformed "
+                 f"yankee candle reviews table.")
+    else:
+        # Read the aggregated rows chunk by chunk into typed columns
+        df_group = queries.read_query(job_input, query, {name: 'str' if not name.startswith('num_') else 'int32'
+                                                         for name in columns})
+        ingestion.send_dataframe(
+            job_input, df_group,
+            destination_table=destination_table
+        )
+        log.info(f"Success! {len(df_group)} rows were inserted in the transformed yankee candle reviews table.")
+        wait_for_transformed_rows(job_input, destination_table, condition, len(df_group))
+
+    props["last_date_amazon_transformed"] = max(last for _, last in ranges.values())
+    update_transformed_dates(job_input, props, ranges)
+
+
+@metrics.step
 def run(job_input: IJobInput):
     """
     Read the ingested yankee candle reviews and do text processing - flag the "no scent" complaints.
-    Count the number of "no scent" reviews per day.
+    Count the number of "no scent" reviews per product, review filter and day.
     """
 
     log.info(f"Starting job step {__name__}")
@@ -30,46 +139,60 @@ def run(job_input: IJobInput):
     else:
         ...
 
-    # Read the candle review data from the cloud Trino DB and transform it into a df
+    # Each product and review filter keeps its own last transformed date, like the last ingested dates of step 20
+    props.setdefault("last_date_amazon_transformed_products", {})
+    ranges = transform_ranges(props)
+    if not ranges:
+        log.info("No new records to ingest.")
+        return
+    condition = range_condition(ranges)
+
+    # Aggregate in the DB if configured so (see TRANSFORM_MODE above)
+    mode = props.get("transform_mode", TRANSFORM_MODE)
+    if mode not in ("pandas", "sql", "insert"):
+        raise ValueError(f"Unknown transform mode '{mode}'. Use one of: pandas, sql, insert.")
+    if mode in ("sql", "insert"):
+        transform_in_database(job_input, props, mode, ranges)
+        return
+
+    # Read the candle review data of each product and review filter from the cloud Trino DB and transform it into
+    # a df. The last transformed date is read again (see transform_ranges).
     reviews_raw = job_input.execute_query(
         f"""
-        SELECT *
+        SELECT Product, Review_filter, Date, Review
         FROM !!! ENTER HERE THE NAME OF THE TABLE WE POPULATED IN SCRIPT "20_ingest_amazon_reviews.py" !!!
-        WHERE Date > '{props["last_date_amazon_transformed"]}'
+        WHERE {condition}
         ORDER BY Date
         """
     )
-    df = # <- !!! CONVERT THE reviews_raw OBJECT INTO A PANDAS DATAFRAME THROUGH pd.DataFrame(). NAME THE COLUMNS "date" AND "review" !!!
+    df = # <- !!! CONVERT THE reviews_raw OBJECT INTO A PANDAS DATAFRAME THROUGH pd.DataFrame(). NAME THE COLUMNS "product", "review_filter", "date" AND "review" !!!
 
     # If any data is returned, transform
     if len(df) > 0:
-        # Flag the reviews containing scent, smell or fragrance words
-        scent_phrases = "scent|smell|fragrance"
-        df['flag_no_scent'] = df['review'].str.contains(scent_phrases, case=False, regex=True)
-
-        # Calculate total number of (negative) reviews per day
-        df_group = df.groupby('date').count().reset_index()
-        df_group = df_group.drop(columns=['review']).rename(columns={'flag_no_scent': 'num_negative_reviews'})
-
-        # Calculate number of "no scent" reviews per day
-        df_group2 = df[df['flag_no_scent']==True].groupby('date').count().reset_index()
-        df_group2 = df_group2.drop(columns=['review']).rename(columns={'flag_no_scent': 'num_no_scent_reviews'})
-
-        # Combine the columns in one df. Use "left" join to keep the dates with negative reviews
-        # but no "no scent" reviews. Fill missing values with 0.
-        df_group = df_group.merge(df_group2, on=['date'], how='left').fillna(0)
-
-        # Ingest the transformed df into a new table using VDK's job_input method
-        job_input.send_tabular_data_for_ingestion(
-            rows=df_group.values,
-            column_names=df_group.columns.to_list(),
+        # Flag the reviews of each complaint category (e.g. containing scent, smell or fragrance words)
+        # in a single pass over the review texts
+        with metrics.timer("transform"):
+            flags = classify.flag_categories(df['review'], COMPLAINT_CATEGORIES)
+
+            # Calculate total number of reviews and number of reviews of each category (e.g. "no scent")
+            # per product, review filter and day
+            df_group = classify.count_categories(df, flags, ['product', 'review_filter', 'date'])
+        metrics.count("transform_rows", len(df))
+
+        # Replace the transformed rows of the aggregated dates
+        job_input.execute_query(f"DELETE FROM {props['prefix']}_yankee_candle_reviews_transformed WHERE {condition}")
+
+        # Ingest the transformed df into a new table with a few multi-row INSERT statements (see ingestion.py)
+        ingestion.send_dataframe(
+            job_input, df_group,
             destination_table=f"" # <- !!! ENTER BETWEEN THE QUOTES THE NAME OF THE TABLE WE CREATED IN SCRIPT "03_create_yankee_candle_reviews_transformed.sql" !!!
         )
         # Reset the last_date property value to the latest date in the transformed db table
         props["last_date_amazon_transformed"] = # <- !!! ASSIGN THE MAXIMUM DATE FROM df_group TO THE last_date_amazon_transformed PROPERTY !!!
-        job_input.set_all_properties(props)
+        # and the last transformed date of each product and review filter to its last ingested date
+        update_transformed_dates(job_input, props, ranges)
         log.info(f"Success! {len(df_group)} rows were inserted in the transformed yankee candle reviews table.")
-        # Delay execution for 10 seconds so that records are ingested into the DB before going to the next script
-        time.sleep(10)
+        wait_for_transformed_rows(job_input, f"{props['prefix']}_yankee_candle_reviews_transformed", condition,
+                                  len(df_group))
     else:
         log.info("No new records to ingest.")
@@ -3,17 +3,289 @@
 import pandas as pd
 import numpy as np
 import logging
-import os
-import pathlib
-import scipy.stats
-import matplotlib.pyplot as plt
+import correlation
+import ingestion
+import metrics
+import queries
+import sources
+import weekly
 from vdk.api.job_input import IJobInput
 
 log = logging.getLogger(__name__)
-# Make the current directory the same as the job directory
-os.chdir(pathlib.Path(__file__).parent.absolute())
 
+# The product (ASIN) whose reviews are correlated with the covid cases, and the review filter of its negative reviews
+PRODUCT = 'B000JDGC78'
+REVIEW_FILTER = 'critical'
+# Which correlations are calculated (can be overridden by the correlation_mode data job property):
+# - "weekly": the weekly correlation and the correlation matrix of all signals and review categories
+# - "lagged": also the correlations of the signals shifted by each of the LAGS (in weeks, positive when the signal
+#   leads the reviews) over an expanding window and rolling WINDOWS (in weeks, None for the expanding window)
+CORRELATION_MODE = "weekly"
+LAGS = np.arange(-8, 9)
+WINDOWS = [None, 26, 52]
+# The coefficients of the expanding window based on fewer weeks (pairs) are too noisy, so they are left empty (NaN).
+# The rolling windows need all their weeks.
+MIN_WEEKS = 8
 
+
+def new_correlation_state() -> dict:
+    """Returns the correlation state used before the first run of the step."""
+
+    return {
+        # Start (Monday) of the first week that may be incomplete. The next run reads the data again from this week
+        # on, so the week is completed with the dates and the reviews added in the meantime.
+        'week': None,
+        # Cumulative number of covid cases on the day before that week
+        'covid_cases_before_week': None,
+        # Running sums of all the weeks before that week
+        'comoments': correlation.empty_state()
+    }
+
+
+def weekly_correlation(df_merged: pd.DataFrame, state: dict, last_review_date=None) -> tuple:
+    """
+    Aggregate the daily data on weekly level and calculate the correlation coefficient for each week.
+    The correlations continue from the running sums of the state, so only the dates from the week of the state on
+    need to be passed. The weeks from the week of the latest covid date or of last_review_date (the latest date of
+    the reviews, which step 30 aggregates again when more reviews of that date are ingested), whichever is earlier,
+    may be incomplete and are not added to the running sums. Returns the weekly data and the new state.
+    """
+
+    # Calculate new covid cases per day (current numbers are cumulative).
+    # The first date of the pandemic has no previous cumulative number, so its daily number is 0.
+    cases = df_merged['number_of_covid_cases'].to_numpy(dtype=float)
+    previous_cases = cases[0] if state['covid_cases_before_week'] is None else state['covid_cases_before_week']
+    daily_cases = np.diff(cases, prepend=previous_cases)
+
+    # Aggregate on week-start level, i.e. on Monday report the numbers for the period Monday-Sunday of the same week.
+    # The incomplete weeks of the previous run are aggregated again from all their dates. The weeks without any data
+    # are included with 0.
+    dates = df_merged['date'].to_numpy()
+    weeks, sums = weekly.weekly_buckets(
+        dates,
+        np.column_stack([df_merged['num_no_scent_reviews'].to_numpy(dtype=float), daily_cases]),
+        first_week=state['week']
+    )
+    df_weekly = pd.DataFrame({'date': weeks, 'num_no_scent_reviews': sums[:, 0],
+                              'number_of_covid_cases_weekly': sums[:, 1]})
+
+    # Position of the first week that may be incomplete
+    last_date = dates[-1] if last_review_date is None else min(dates[-1], np.datetime64(last_review_date, 'ns'))
+    incomplete = int(np.searchsorted(weeks, weekly.week_starts([last_date])[0].astype('datetime64[D]')))
+
+    # The coefficient for a given week is based on the data from all previous weeks. Only the complete weeks are
+    # added to the running sums, the others are aggregated again on the next run.
+    no_scent_reviews = df_weekly['num_no_scent_reviews'].to_numpy()
+    covid_cases = df_weekly['number_of_covid_cases_weekly'].to_numpy()
+    corr_complete, comoments = correlation.extend_state(state['comoments'], no_scent_reviews[:incomplete],
+                                                        covid_cases[:incomplete])
+    corr_incomplete, _ = correlation.extend_state(comoments, no_scent_reviews[incomplete:-1],
+                                                  covid_cases[incomplete:-1])
+    df_weekly['correlation_coeff'] = np.concatenate([[correlation.state_corr(state['comoments'])], corr_complete,
+                                                     corr_incomplete])
+
+    # The daily numbers of the incomplete weeks are calculated from the cumulative number before them on the next run
+    before_week = dates < weeks[incomplete]
+    state = {
+        'week': df_weekly['date'].iloc[incomplete].strftime('%Y-%m-%d'),
+        'covid_cases_before_week': float(cases[before_week][-1]) if before_week.any() else float(previous_cases),
+        'comoments': comoments
+    }
+    return df_weekly, state
+
+
+def new_signals_state() -> dict:
+    """Returns the state of the correlations between the sources and the review categories before the first run."""
+
+    return {
+        # Start (Monday) of the first week that is not complete for all sources yet. The next run reads the data
+        # again from this week on, so the week is completed with the dates added in the meantime.
+        'week': None,
+        # Value of each cumulative source on the day before that week
+        'values_before_week': {},
+        # Weekly values of the latest completed weeks of each source and category (oldest first, None when missing),
+        # enough for the lags and the rolling windows of the next weeks
+        'history': {'signals': {}, 'reviews': {}},
+        # Running sums of the pairs of each source, category and lag (see correlation.extend_state), as nested lists
+        # of shape (signals, categories, lags) with the names of the signals, categories and lags
+        'comoments': {}
+    }
+
+
+def read_weekly_data(job_input: IJobInput, props: dict, state: dict) -> tuple:
+    """
+    Read the time series sources (see sources.py) and the review categories from the week of the state on (the
+    whole history on the first run) and sum them per week. Returns two dataframes indexed by the same weeks: the
+    signals (one column per source) and the reviews (one column per category, e.g. no_scent from
+    num_no_scent_reviews), and the new state values of the week and of the cumulative sources. The last week is the
+    first week that may not be complete for all sources. The dataframes are empty if a source has no data.
+    """
+
+    condition = f"'{state['week']}'" if state['week'] else None
+    # The review categories are the count columns of the transformed reviews table
+    categories = [name for name in ingestion.table_schema('yankee_candle_reviews_transformed')
+                  if name.startswith('num_')]
+    reviews = queries.read_query(
+        job_input,
+        f"""
+        SELECT date, {', '.join(categories)}
+        FROM {props['prefix']}_yankee_candle_reviews_transformed
+        WHERE product = '{PRODUCT}' AND review_filter = '{REVIEW_FILTER}'
+              {f"AND date >= {condition}" if condition else ""}
+        ORDER BY date
+        """,
+        {'date': 'date', **{name: 'int32' for name in categories}}
+    )
+    daily = {}
+    for source in sources.SOURCES:
+        df = queries.read_query(
+            job_input,
+            f"SELECT {source.date_column}, {source.value_column} FROM {props['prefix']}_{source.table} "
+            f"{f'WHERE {source.date_column} >= {condition} ' if condition else ''}ORDER BY {source.date_column}",
+            {'date': 'date', 'value': 'float64'}
+        )
+        if len(df) == 0:
+            return pd.DataFrame(), pd.DataFrame(), state['week'], state['values_before_week']
+        daily[source] = df
+
+    # Weekly sums from the week of the state (or the first week of the sources) until the first week that may be
+    # incomplete - the week of the latest date of the source that is furthest behind
+    first = state['week'] or min(df['date'].iloc[0] for df in daily.values())
+    last = min(df['date'].iloc[-1] for df in daily.values())
+    signals = {}
+    values_before_week = dict(state['values_before_week'])
+    for source, df in daily.items():
+        dates = df['date'].to_numpy()
+        values = source.daily_values(df['value'], state['values_before_week'].get(source.name))
+        weeks, sums = weekly.weekly_buckets(dates, values, first_week=first, last_week=last)
+        # The weeks before the first date of a source have no value
+        sums[weeks < weekly.week_starts(dates[:1])[0].astype('datetime64[D]')] = np.nan
+        signals[source.name] = sums
+        if source.cumulative:
+            before = np.flatnonzero(weekly.week_starts(dates) < weekly.week_starts([last])[0])
+            if len(before) > 0:
+                values_before_week[source.name] = float(df['value'].iloc[before[-1]])
+    weeks = pd.DatetimeIndex(weeks)
+    _, sums = weekly.weekly_buckets(reviews['date'].to_numpy(), reviews[categories].to_numpy(),
+                                    first_week=weeks[0], last_week=weeks[-1])
+    reviews = pd.DataFrame(sums, index=weeks, columns=[name[len('num_'):-len('_reviews')] for name in categories])
+    return pd.DataFrame(signals, index=weeks), reviews, weeks[-1].strftime('%Y-%m-%d'), values_before_week
+
+
+def _history(values: dict, name: str, length: int) -> np.ndarray:
+    """Returns the saved weekly values of the series, with missing values before it was first saved."""
+
+    saved = np.array(values.get(name, []), dtype=float)
+    return np.concatenate([np.full(length - len(saved), np.nan), saved])
+
+
+def _saved_comoments(saved: dict, signals: list, categories: list, lags: list) -> dict:
+    """
+    Returns the saved running sums of each signal, category and lag as arrays of shape (signals, categories, lags).
+    The sums of the signals, categories and lags which weren't saved yet are empty (see correlation.empty_state).
+    """
+
+    shape = (len(signals), len(categories), len(lags))
+    comoments = {key: np.full(shape, np.nan if value is None else value)
+                 for key, value in correlation.empty_state().items()}
+    if saved:
+        axes = [(saved[name], current) for name, current in (('signals', signals), ('categories', categories),
+                                                             ('lags', lags))]
+        # The positions of the saved names in the current ones and in the saved ones
+        current_positions = np.ix_(*[[i for i, name in enumerate(current) if name in names] for names, current in axes])
+        saved_positions = np.ix_(*[[names.index(name) for name in current if name in names] for names, current in axes])
+        for key in comoments:
+            comoments[key][current_positions] = np.array(saved[key], dtype=float)[saved_positions]
+    return comoments
+
+
+def extend_signal_correlations(signals: pd.DataFrame, reviews: pd.DataFrame, state: dict) -> tuple:
+    """
+    Add the completed weeks (all but the last one) to the running sums of each signal, category and lag, and calculate
+    the correlation coefficients between the signals shifted by each of the LAGS and the review categories over the
+    expanding and the rolling WINDOWS after each of these weeks. As in weekly_correlation, the coefficients of
+    a week are based on the data from the previous weeks. All signals, categories and lags are calculated at once
+    on arrays of shape (weeks, signals, categories, lags). Returns the coefficients (one row per week, signal,
+    category, window and lag) and the new state.
+    """
+
+    # Lag 0 is the correlation matrix
+    lags = np.union1d(LAGS, [0])
+    completed = len(signals) - 1
+    saved = state['history']
+    saved_weeks = max([len(values) for series in saved.values() for values in series.values()], default=0)
+    # The rolling windows and the lags of the next weeks need this many of the latest weeks
+    keep = max([window for window in WINDOWS if window], default=1) + int(np.abs(lags).max())
+
+    # The saved latest weeks and the completed weeks of each signal (x) and category (y), one column per series
+    x = np.column_stack([np.concatenate([_history(saved['signals'], signal, saved_weeks),
+                                         signals[signal].to_numpy(dtype=float)[:completed]])
+                         for signal in signals.columns])
+    y = np.column_stack([np.concatenate([_history(saved['reviews'], category, saved_weeks),
+                                         reviews[category].to_numpy(dtype=float)[:completed]])
+                         for category in reviews.columns])
+    history = {'signals': {signal: [None if np.isnan(value) else value for value in x[-keep:, i].tolist()]
+                           for i, signal in enumerate(signals.columns)},
+               'reviews': {category: [None if np.isnan(value) else value for value in y[-keep:, i].tolist()]
+                           for i, category in enumerate(reviews.columns)}}
+    # Broadcast the signals against the categories
+    x, y = x[:, :, None], y[:, None, :]
+
+    # Expanding window: extend the running sums of each signal, category and lag with the pairs of the new weeks
+    x_lagged, y_lagged = correlation.lagged_pairs(x, y, lags)
+    x_lagged, y_lagged = x_lagged[saved_weeks:], y_lagged[saved_weeks:]
+    before = _saved_comoments(state['comoments'], signals.columns.to_list(), reviews.columns.to_list(), lags.tolist())
+    corr_coeff, comoments = correlation.extend_state(before, x_lagged, y_lagged)
+    num_weeks = before['n'].astype(np.int64) + np.cumsum(~(np.isnan(x_lagged) | np.isnan(y_lagged)), axis=0)
+    corr_coeff[num_weeks < MIN_WEEKS] = np.nan
+    comoments.update(signals=signals.columns.to_list(), categories=reviews.columns.to_list(), lags=lags.tolist())
+
+    # Rolling windows: only the latest weeks are needed
+    windows = [0]
+    corr_coeffs, weeks = [corr_coeff], [num_weeks]
+    for window in WINDOWS:
+        if window:
+            n, corr = correlation.lagged_corr(x, y, lags, window, min_periods=window)
+            windows.append(window)
+            corr_coeffs.append(corr[saved_weeks:])
+            weeks.append(n[saved_weeks:])
+
+    # One row per signal, category, window, week and lag (in this order)
+    corr_coeffs = np.stack(corr_coeffs).transpose(2, 3, 0, 1, 4)
+    shape = corr_coeffs.shape
+
+    def column(values, axis: int) -> np.ndarray:
+        return np.broadcast_to(np.reshape(values, [-1 if i == axis else 1 for i in range(len(shape))]), shape).ravel()
+
+    df_correlations = pd.DataFrame({
+        'date': column(signals.index[1:completed + 1].strftime('%Y-%m-%d').to_numpy(), 3),
+        'signal': column(signals.columns.to_numpy(), 0),
+        'category': column(reviews.columns.to_numpy(), 1),
+        'window_weeks': column(windows, 2),
+        'lag_weeks': column(lags, 4),
+        'correlation_coeff': corr_coeffs.ravel(),
+        'num_weeks': np.stack(weeks).transpose(2, 3, 0, 1, 4).ravel()
+    })
+    return df_correlations, dict(state, history=history, comoments=comoments)
+
+
+def correlation_matrix(df_correlations: pd.DataFrame) -> pd.DataFrame:
+    """Returns the latest correlation coefficients between each signal and each review category."""
+
+    df = df_correlations[(df_correlations['window_weeks'] == 0) & (df_correlations['lag_weeks'] == 0)]
+    df = df[df['date'] == df['date'].max()]
+    return df[['date', 'signal', 'category', 'correlation_coeff', 'num_weeks']].reset_index(drop=True)
+
+
+def lagged_correlation(df_correlations: pd.DataFrame) -> pd.DataFrame:
+    """Returns the correlation coefficients of the LAGS with their p-values."""
+
+    df = df_correlations[df_correlations['lag_weeks'].isin(LAGS)].reset_index(drop=True)
+    df.insert(6, 'p_value', correlation.corr_p_values(df['correlation_coeff'], df['num_weeks']))
+    return df
+
+
+@metrics.step
 def run(job_input: IJobInput):
     """
     Calculate the weekly correlation between "no scent" Yankee candle reviews and COVID cases in the US.
@@ -30,68 +302,108 @@ def run(job_input: IJobInput):
     else:
         props["last_date_correlation"] = '2020-01-01'
 
+    # Calculate the lagged correlations as well if configured so (see CORRELATION_MODE above)
+    mode = props.get("correlation_mode", CORRELATION_MODE)
+    if mode not in ("weekly", "lagged"):
+        raise ValueError(f"Unknown correlation mode '{mode}'. Use one of: weekly, lagged.")
+
+    # Retrieve the running correlation state saved by the previous run (see weekly_correlation above).
+    # Only the dates from the first incomplete week of the previous run on are read from the DB, as step 30 can add
+    # reviews of the dates of that week after they were read.
+    if "correlation_state" in props:
+        state = props["correlation_state"]
+    else:
+        state = new_correlation_state()
+    first_date = state['week'] or ''
+
     # Read the candle review data and transform to df
     reviews = job_input.( # <- !!! BEFORE THE ( ENTER THE APPROPRIATE JOB_INPUT METHOD FOR EXECUTING SQL STATEMENTS FROM PYTHON SCRIPTS !!!
         f"""
         SELECT date, num_no_scent_reviews 
         FROM {props['prefix']}_yankee_candle_reviews_transformed
+        WHERE product = '{PRODUCT}' AND review_filter = '{REVIEW_FILTER}' AND date >= '{first_date}'
         """
     )
-    reviews_df = pd.DataFrame(reviews, columns=['date', 'num_no_scent_reviews'])
+    # Convert the rows straight into typed columns: dates to datetime64 and counts to integers
+    reviews_df = queries.typed_frame(reviews, {'date': 'date', 'num_no_scent_reviews': 'int32'})
 
     # Read the covid data and transform to df
     covid = job_input.( # <- !!! BEFORE THE ( ENTER THE APPROPRIATE JOB_INPUT METHOD FOR EXECUTING SQL STATEMENTS FROM PYTHON SCRIPTS !!!
         f"""
         SELECT * 
         FROM !!! ENTER HERE THE NAME OF THE TABLE WE POPULATED IN SCRIPT "10_ingest_covid_data.py" !!!
+        WHERE obs_date >= '{first_date}'
         """
     )
-    covid_df = pd.DataFrame(covid, columns=['date', 'number_of_covid_cases'])
+    covid_df = queries.typed_frame(covid, {'date': 'date', 'number_of_covid_cases': 'int64'})
+
+    if len(covid_df) == 0:
+        log.info("No new records to ingest.")
+        return
 
     # Merge the two dataframes and fill missing values with 0. Use right join since reviews_df doesn't contain all dates
     df_merged = reviews_df.merge(covid_df, on=['date'], how='right').fillna(0)
-    # Sort df values by date descending
-    df_merged = df_merged.sort_values('date', ascending=False).reset_index(drop=True)
-
-    # Calculate new covid cases per day (current numbers are cumulative)
-    df_merged['date'] = pd.to_datetime(df_merged['date'], format='%Y-%m-%d')
-    df_merged['number_of_covid_cases_daily'] = df_merged['number_of_covid_cases'].diff(periods=-1).fillna(0)
-
-    # Aggregate data on weekly level
-    df_merged_weekly = df_merged.copy()
-    # The next step is necessary so that weekly calculations look 7 days ahead instead of backwards
-    # (i.e. on Monday report the numbers for the period Monday-Sunday of the same week)
-    df_merged_weekly['date'] = pd.to_datetime(df_merged_weekly['date']) - pd.to_timedelta(6, unit='d')
-    # Aggregate on week-start level
-    df_merged_weekly = df_merged_weekly.resample('W-MON', on='date').sum().reset_index()
-    df_merged_weekly = df_merged_weekly.rename(columns={'number_of_covid_cases_daily': 'number_of_covid_cases_weekly'})\
-                                       .drop(columns=["number_of_covid_cases"])
-
-    # Calculate correlation coefficients for each week in the df_merged_weekly table
-    corr_coeff = [np.nan]
-    for i in range(1, len(df_merged_weekly)):
-        corr_coeff.append(df_merged_weekly['num_no_scent_reviews'][:i]
-                          .corr(df_merged_weekly['number_of_covid_cases_weekly'][:i]))
-    # Add them as a column in the df
-    df_merged_weekly['correlation_coeff'] = corr_coeff
+    # Sort df values by date ascending
+    df_merged = df_merged.sort_values('date').reset_index(drop=True)
+
+    # Aggregate data on weekly level and calculate correlation coefficients for each week
+    with metrics.timer("transform"):
+        last_review_date = reviews_df['date'].max() if len(reviews_df) > 0 else None
+        df_merged_weekly, state = weekly_correlation(df_merged, state, last_review_date)
 
     # Original date format: "2022-02-06T00:00:00". Transform into "2022-02-06"
     df_merged_weekly['date'] = df_merged_weekly['date'].dt. # <- !!! ENTER HERE THE PANDAS DATETIME METHOD THAT HANDLES DATETIME FORMAT TRANSFORMATIONS !!!
 
-    # Keep only the non-ingested records
-    df_merged_weekly = df_merged_weekly[df_merged_weekly['date'] > props["last_date_correlation"]]
+    # The weeks from the first incomplete week of the previous run on were aggregated again, so their rows are
+    # replaced
+    job_input.execute_query(f"DELETE FROM {props['prefix']}_weekly_correlation WHERE date >= '{first_date}'")
 
     # If any data is returned, ingest
     if len(df_merged_weekly) > 0:
-        # Ingest the weekly data and correlation coefficients into a new table using VDK's job_input method
-        job_input.send_tabular_data_for_ingestion(
-            rows=df_merged_weekly.values,
-            column_names=df_merged_weekly.columns.to_list(),
+        # Ingest the weekly data and correlation coefficients into a new table with a few multi-row INSERT statements
+        # (see ingestion.py)
+        ingestion.send_dataframe(
+            job_input, df_merged_weekly,
             destination_table=f"" # <- !!! ENTER BETWEEN THE QUOTES THE NAME OF THE TABLE WE CREATED IN SCRIPT "04_create_weekly_correlation.sql" !!!
         )
         # Reset the last_date property value to the latest date in the covid source db table
         props["last_date_correlation"] = max(df_merged_weekly['date'])
-        job_input.set_all_properties(props)
         log.info(f"Success! {len(df_merged_weekly)} rows were inserted.")
     else:
         log.info("No new records to ingest.")
+
+    # Save the correlation state right away, so that the weekly rows are not ingested again if the steps below fail
+    props["correlation_state"] = state
+    job_input.set_all_properties(props)
+
+    # Correlate all time series sources with all review categories over the new completed weeks
+    signals_state = props.get("signals_correlation_state") or new_signals_state()
+    signals, reviews_weekly, week, values_before_week = read_weekly_data(job_input, props, signals_state)
+    if len(signals) == 0:
+        log.info("No data of the time series sources to correlate.")
+        return
+    with metrics.timer("transform"):
+        df_correlations, signals_state = extend_signal_correlations(signals, reviews_weekly, signals_state)
+    signals_state.update(week=week, values_before_week=values_before_week)
+
+    # Save the coefficients of the latest week
+    df_matrix = correlation_matrix(df_correlations)
+    if len(df_matrix) > 0 and df_matrix['date'].iloc[0] > props.get("last_date_correlation_matrix", ''):
+        ingestion.send_dataframe(job_input, df_matrix, destination_table=f"{props['prefix']}_correlation_matrix")
+        props["last_date_correlation_matrix"] = df_matrix['date'].iloc[0]
+        job_input.set_all_properties(props)
+        log.info(f"Success! {len(df_matrix)} correlation coefficients were inserted.")
+
+    # In "lagged" mode, also save the lagged and rolling correlations of the new weeks. The running sums are kept
+    # in both modes, so switching to the "lagged" mode saves the weeks from then on.
+    if mode == "lagged":
+        df_lagged = df_correlations[df_correlations['date'] > props.get("last_date_lagged_correlation", '')]
+        if len(df_lagged) > 0:
+            with metrics.timer("transform"):
+                df_lagged = lagged_correlation(df_lagged)
+            ingestion.send_dataframe(job_input, df_lagged, destination_table=f"{props['prefix']}_lagged_correlation")
+            props["last_date_lagged_correlation"] = df_lagged['date'].max()
+            log.info(f"Success! {len(df_lagged)} lagged correlation coefficients were inserted.")
+
+    props["signals_correlation_state"] = signals_state
+    job_input.set_all_properties(props)
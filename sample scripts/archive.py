@@ -0,0 +1,92 @@
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import pathlib
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Callable, Iterator
+
+# USER DEFINED FUNCTIONS FOR ARCHIVING FETCHED WEB PAGES
+
+# The fetched pages are stored gzip-compressed under the SHA-256 of their text (objects/<2 chars>/<hash>.html.gz),
+# so a page fetched several times without changes is stored once. Each fetch is recorded in index.jsonl as a
+# JSON line with the URL, the fetch time (UTC, ISO format) and the hash of the page.
+# The archived pages can be parsed again offline (see replay below), e.g. after changing the cleaning rules.
+
+INDEX_FILE = "index.jsonl"
+
+
+class PageArchive:
+    """A content-addressed archive of fetched web pages. Can be shared by several threads."""
+
+    def __init__(self, directory):
+        self.directory = pathlib.Path(directory)
+        self.lock = threading.Lock()
+
+    def path(self, sha256: str) -> pathlib.Path:
+        return self.directory / "objects" / sha256[:2] / f"{sha256}.html.gz"
+
+    def put(self, url: str, text: str, fetched_at: str = None) -> str:
+        """Archive the page fetched from the URL. Returns the hash of the page."""
+
+        data = text.encode('utf-8')
+        sha256 = hashlib.sha256(data).hexdigest()
+        path = self.path(sha256)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write to a temporary file first, so that a page is never read half written
+            temporary = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            temporary.write_bytes(gzip.compress(data))
+            os.replace(temporary, path)
+
+        entry = {
+            'url': url,
+            'fetched_at': fetched_at or datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'sha256': sha256
+        }
+        with self.lock, open(self.directory / INDEX_FILE, "a", encoding="utf-8") as index:
+            index.write(json.dumps(entry) + "\n")
+        return sha256
+
+    def get(self, sha256: str) -> str:
+        """Returns the text of the archived page with the given hash."""
+
+        return gzip.decompress(self.path(sha256).read_bytes()).decode('utf-8')
+
+    def entries(self) -> Iterator[dict]:
+        """Yields the index entries (url, fetched_at, sha256) in the order the pages were fetched."""
+
+        path = self.directory / INDEX_FILE
+        if not path.exists():
+            return
+        with open(path, encoding="utf-8") as index:
+            for line in index:
+                if line.strip():
+                    yield json.loads(line)
+
+    def latest(self) -> dict:
+        """Returns a dictionary from each archived URL to the hash of its latest fetched page."""
+
+        return {entry['url']: entry['sha256'] for entry in self.entries()}
+
+
+def _parse_archived(directory: str, parse: Callable, sha256: str):
+    return parse(PageArchive(directory).get(sha256))
+
+
+def replay(archive: PageArchive, hashes: list, parse: Callable, max_workers: int = None) -> list:
+    """
+    Parse the archived pages with the given hashes in a process pool, one page per task. parse takes the text of
+    a page and must be picklable (a module level function, e.g. webscrape.page_reviews).
+    Returns the results of parse in the order of the hashes.
+    """
+
+    if not hashes:
+        return []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # The processes read the pages from the archive themselves instead of receiving their texts
+        return list(executor.map(partial(_parse_archived, str(archive.directory), parse), hashes,
+                                 chunksize=max(1, len(hashes) // (4 * (max_workers or os.cpu_count() or 1)))))
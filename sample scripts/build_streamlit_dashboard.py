@@ -1,3 +1,4 @@
+import io
 import os
 import pandas as pd
 import pathlib
@@ -5,9 +6,8 @@ import streamlit as st
 from trino import dbapi
 from trino import constants
 from trino.auth import BasicAuthentication
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-import scipy.stats
+import dashboard_data
+import metrics
 
 # Page title and description
 st.title('Correlation analysis: COVID-19 cases in the US and Yankee candle reviews indicating "no scent"')
@@ -21,59 +21,128 @@ st.header('Number of weekly COVID cases and "no scent" reviews over time')
 # Make the current directory the same as the job directory
 os.chdir(pathlib.Path(__file__).parent.absolute())
 
-# Create a connection to the Trino DB
-auth = None
-conn = dbapi.connect(
-    host=os.environ.get("VDK_TRINO_HOST"),
-    port=int(os.environ.get("VDK_TRINO_PORT")),
-    user="user",
-    auth=auth,
-    catalog=os.environ.get("VDK_TRINO_CATALOG", 'mysql'),
-    schema=os.environ.get("VDK_TRINO_SCHEMA", "default"),
-    http_scheme=constants.HTTP,
-    verify=False,
-    request_timeout=600,
-)
-# Fetch data
-df = pd.read_sql_query(
-    f"SELECT * FROM ...", conn # <- !!! REPLACE THE ... WITH THE NAME OF THE TABLE WE POPULATED IN SCRIPT "40_calculate_correlation.py" !!!
+# Name of the table with the weekly data and correlation coefficients
+TABLE = "..." # <- !!! REPLACE THE ... WITH THE NAME OF THE TABLE WE POPULATED IN SCRIPT "40_calculate_correlation.py" !!!
+# How often (in seconds) to check the DB for new data. The table is only read again after the job adds new weeks.
+REFRESH_SECONDS = 60
+# Columns shown in the charts
+SERIES_COLUMNS = ('num_no_scent_reviews', 'number_of_covid_cases_weekly', 'correlation_coeff')
+
+
+# Create a connection to the Trino DB. The connection is shared by all viewers of the dashboard.
+@st.cache_resource
+def get_connection():
+    auth = None
+    return dbapi.connect(
+        host=os.environ.get("VDK_TRINO_HOST"),
+        port=int(os.environ.get("VDK_TRINO_PORT")),
+        user="user",
+        auth=auth,
+        catalog=os.environ.get("VDK_TRINO_CATALOG", 'mysql'),
+        schema=os.environ.get("VDK_TRINO_SCHEMA", "default"),
+        http_scheme=constants.HTTP,
+        verify=False,
+        request_timeout=600,
+    )
+
+
+# The latest week in the table (the same as the last_date_correlation data job property). Cached for
+# REFRESH_SECONDS, so all page views in that time share one query.
+@st.cache_data(ttl=REFRESH_SECONDS)
+def get_latest_date(table: str) -> str:
+    cursor = get_connection().cursor()
+    cursor.execute(f"SELECT max(date) FROM {table}")
+    return cursor.fetchone()[0]
+
+
+# The date range of the table. Cached per latest date, like the data below.
+@st.cache_data(ttl=7 * 24 * 3600, max_entries=4)
+def get_date_bounds(table: str, latest_date: str) -> tuple:
+    return dashboard_data.date_bounds(get_connection(), table)
+
+
+@st.cache_data(ttl=7 * 24 * 3600, max_entries=64)
+def get_row_count(table: str, start: str, end: str, latest_date: str) -> int:
+    return dashboard_data.row_count(get_connection(), table, start, end)
+
+
+# Fetch data for the selected date range, downsampled to fit the chart (see dashboard_data.py).
+# The result is cached per date range and latest date, so the table is read once after each data change.
+@st.cache_data(ttl=7 * 24 * 3600, max_entries=64)
+def load_series(table: str, columns: tuple, start: str, end: str, latest_date: str) -> dict:
+    return dashboard_data.load_series(get_connection(), table, list(columns), start, end)
+
+
+@st.cache_data(ttl=7 * 24 * 3600, max_entries=4)
+def get_correlation(table: str, latest_date: str):
+    return dashboard_data.value_on(get_connection(), table, 'correlation_coeff', latest_date)
+
+
+@st.cache_data(ttl=7 * 24 * 3600, max_entries=256)
+def load_page(table: str, start: str, end: str, page: int, latest_date: str) -> pd.DataFrame:
+    return dashboard_data.load_page(get_connection(), table, ['correlation_coeff'], start, end, page)
+
+
+# Plot # COVID cases vs no-scent complaints over time. The figure is rendered into a PNG image once per
+# date range and latest date, so the page views don't draw it again.
+@st.cache_data(ttl=7 * 24 * 3600, max_entries=64)
+def build_figure(table: str, start: str, end: str, latest_date: str) -> bytes:
+    # Matplotlib is only imported when a figure isn't cached yet
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+
+    series = load_series(table, SERIES_COLUMNS, start, end, latest_date)
+    fig, ax = plt.subplots(figsize=(12, 6))
+    ax2 = ax.twinx()
+    ax.set_title('No scent Yankee candle reviews and COVID cases')
+    ax.plot(series['num_no_scent_reviews'].index, series['num_no_scent_reviews'], color='green')
+    ax2.plot(series['number_of_covid_cases_weekly'].index, series['number_of_covid_cases_weekly'], color='red')
+    ax.set_ylabel('# "No scent" reviews')
+    ax2.set_ylabel('# Covid cases weekly (in mln)')
+    ax.legend(['no scent reviews'])
+    ax2.legend(['weekly covid cases'], loc='upper center')
+    locator = mdates.AutoDateLocator()
+    ax.xaxis.set_major_locator(locator)
+    ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+    fig.tight_layout()
+    image = io.BytesIO()
+    fig.savefig(image, format='png')
+    plt.close(fig)
+    return image.getvalue()
+
+
+latest_date = get_latest_date(TABLE)
+first_date, last_date = get_date_bounds(TABLE, latest_date)
+# Only the weeks in the selected range are loaded
+start, end = st.slider(
+    'Weeks shown:',
+    min_value=pd.Timestamp(first_date).date(),
+    max_value=pd.Timestamp(last_date).date(),
+    value=(pd.Timestamp(first_date).date(), pd.Timestamp(last_date).date()),
+    format="YYYY-MM-DD"
 )
-# Transform into datetime Series
-df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d')
-
-# Plot # COVID cases vs no-scent complaints over time
-fig, ax = plt.subplots(figsize=(12, 6))
-ax2 = ax.twinx()
-ax.set_title('No scent Yankee candle reviews and COVID cases')
-ax.plot(df['date'], df['num_no_scent_reviews'], color='green')
-ax2.plot(df['date'], df['number_of_covid_cases_weekly'], color='red')
-ax.set_ylabel('# "No scent" reviews')
-ax2.set_ylabel('# Covid cases weekly (in mln)')
-ax.legend(['no scent reviews'])
-ax2.legend(['weekly covid cases'], loc='upper center')
-ax.xaxis.set_major_locator(mdates.MonthLocator(bymonth=range(1,13)))
-ax.xaxis.set_minor_locator(mdates.MonthLocator())
-ax.xaxis.set_major_formatter(
-    mdates.ConciseDateFormatter(ax.xaxis.get_major_locator()))
-plt.tight_layout()
-st.pyplot(fig=plt)
+start, end = start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+st.image(build_figure(TABLE, start, end, latest_date))
 
 # Sub-header
 st.header('Weekly correlation between "no scent" reviews and covid cases')
 
 # Current period correlation
-corr_coeff = pd.to_numeric(df[df['date']==max(df['date'])]['correlation_coeff'], errors='coerce')
+corr_coeff = pd.to_numeric(get_correlation(TABLE, latest_date), errors='coerce')
 st.metric("The current correlation coefficient is:", round(corr_coeff,3))
 
 # Plot the correlation coefficients over time
 st.write('Correlation coefficient over time:')
-df = df.rename(columns={'date': 'index'}).set_index('index')
-df['correlation_coeff'] = df['correlation_coeff'].astype(float)
-st.line_chart(data=df[['correlation_coeff']].fillna(0))
-# Show data in a table
+correlation = load_series(TABLE, SERIES_COLUMNS, start, end, latest_date)['correlation_coeff']
+st.line_chart(data=correlation.rename_axis('index').to_frame().fillna(0))
+# Show data in a table, one page at a time
 st.write('Underlying data:')
-df = df.reset_index().rename(columns={'index': 'week'}).sort_values('week', ascending=False)
-# Convert date to string
-df['week'] = df['week'].dt.strftime('%Y-%m-%d')
+rows = get_row_count(TABLE, start, end, latest_date)
+page = st.number_input('Page:', min_value=1, max_value=max(1, -(-rows // dashboard_data.PAGE_SIZE)), value=1) - 1
+df = load_page(TABLE, start, end, page, latest_date).rename(columns={'date': 'week'})
 # Visualize in the dashboard
 st.dataframe(df[['week', 'correlation_coeff']])
+
+# Time spent in the queries of the dashboard since it was started (see metrics.py)
+with st.expander('Dashboard metrics'):
+    st.json(metrics.flatten(metrics.snapshot()))
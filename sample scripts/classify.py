@@ -0,0 +1,87 @@
+import functools
+import operator
+import re
+
+import numpy as np
+import pandas as pd
+
+# Optional Aho-Corasick automaton for finding the keywords (see flag_categories below)
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# USER DEFINED FUNCTIONS FOR CLASSIFYING REVIEWS
+
+# The reviews are classified into complaint categories (e.g. "no scent") by keywords, e.g.
+# {'no_scent': ['scent', 'smell', 'fragrance'], 'wick': ['wick']}. A review belongs to a category if it contains
+# any of its keywords (case insensitive). All keywords of all categories are searched for in a single pass over
+# each review text, so adding a category doesn't add another pass over the reviews.
+
+
+def _keyword_bits(categories: dict) -> dict:
+    """Returns a dictionary from each (lowercase) keyword to the bits of its categories."""
+
+    bits = {}
+    for i, keywords in enumerate(categories.values()):
+        for keyword in keywords:
+            bits[keyword.lower()] = bits.get(keyword.lower(), 0) | 1 << i
+    return bits
+
+
+def _masks_regex(texts: list, bits: dict) -> list:
+    # The lookahead finds the longest keyword starting at every position of the text, also inside or overlapping
+    # other matches. The shorter keywords starting at the same position are the prefixes of the longest one.
+    pattern = re.compile("(?=(" + "|".join(re.escape(keyword) for keyword in sorted(bits, key=len, reverse=True))
+                         + "))")
+    prefix_bits = {keyword: functools.reduce(operator.or_, (bit for other, bit in bits.items()
+                                                            if keyword.startswith(other)))
+                   for keyword in bits}
+    masks = []
+    for text in texts:
+        mask = 0
+        for keyword in pattern.findall(text):
+            mask |= prefix_bits[keyword]
+        masks.append(mask)
+    return masks
+
+
+def _masks_ahocorasick(texts: list, bits: dict) -> list:
+    automaton = ahocorasick.Automaton()
+    for keyword, bit in bits.items():
+        automaton.add_word(keyword, bit)
+    automaton.make_automaton()
+    masks = []
+    for text in texts:
+        mask = 0
+        for _, bit in automaton.iter(text):
+            mask |= bit
+        masks.append(mask)
+    return masks
+
+
+def flag_categories(texts: pd.Series, categories: dict) -> pd.DataFrame:
+    """Returns a dataframe with one boolean column per category, which flags the texts of that category."""
+
+    bits = _keyword_bits(categories)
+    texts_lower = texts.str.lower().fillna("").to_list()
+    if ahocorasick is not None:
+        masks = _masks_ahocorasick(texts_lower, bits)
+    else:
+        masks = _masks_regex(texts_lower, bits)
+    masks = np.array(masks, dtype=np.int64).reshape(-1, 1)
+    flags = (masks >> np.arange(len(categories))) & 1 == 1
+    return pd.DataFrame(flags, columns=list(categories), index=texts.index)
+
+
+def count_categories(df: pd.DataFrame, flags: pd.DataFrame, keys: list) -> pd.DataFrame:
+    """
+    Count the reviews (num_negative_reviews) and the reviews of each category (num_<category>_reviews)
+    per group of keys (e.g. product and date) in a single groupby.
+    """
+
+    counts = pd.concat([df[keys], flags.astype(int)], axis=1)
+    counts['num_negative_reviews'] = 1
+    counts = counts.groupby(keys, sort=True).sum().reset_index()
+    counts = counts.rename(columns={name: f"num_{name}_reviews" for name in flags.columns})
+    return counts[keys + ['num_negative_reviews'] + [f"num_{name}_reviews" for name in flags.columns]]
@@ -0,0 +1,260 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# USER DEFINED FUNCTIONS FOR CORRELATION CALCULATIONS
+
+# The functions below calculate the correlation coefficient for every prefix (expanding window) or every trailing
+# window (rolling window) of two series and of their lagged pairs in a single vectorized pass over running sums,
+# instead of calling pandas' Series.corr once per week and lag. Pairs where any of the two values is missing are
+# skipped and windows with fewer than 2 pairs or with a constant series give NaN - the same way Series.corr
+# handles them. Both the Pearson and the Spearman (rank) correlation are supported.
+
+
+def _running_sum(a: np.ndarray, window: int = None) -> np.ndarray:
+    """Returns the running (window=None) or trailing window sums of the array along the first axis."""
+
+    total = np.cumsum(a, axis=0)
+    if window is None or window >= len(a):
+        return total
+    result = total.copy()
+    result[window:] -= total[:-window]
+    return result
+
+
+def _running_extremes(a: np.ndarray, valid: np.ndarray, window: int = None) -> tuple:
+    """
+    Returns the running (window=None) or trailing window minimum and maximum of the valid values
+    along the first axis.
+    """
+
+    low = np.where(valid, a, np.inf)
+    high = np.where(valid, a, -np.inf)
+    if window is None or window >= len(a):
+        return np.minimum.accumulate(low, axis=0), np.maximum.accumulate(high, axis=0)
+    # Pad the beginning so that the first windows only contain the values seen so far
+    padding = np.full((window - 1,) + a.shape[1:], np.inf)
+    low = sliding_window_view(np.concatenate([padding, low]), window, axis=0)
+    high = sliding_window_view(np.concatenate([-padding, high]), window, axis=0)
+    return low.min(axis=-1), high.max(axis=-1)
+
+
+def _corr_from_sums(n, sum_x, sum_y, sum_xx, sum_yy, sum_xy):
+    """Returns the Pearson correlation coefficient calculated from the number of pairs and the sums of their values."""
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = sum_xy - sum_x * sum_y / n
+        var_x = sum_xx - sum_x * sum_x / n
+        var_y = sum_yy - sum_y * sum_y / n
+        return cov / np.sqrt(var_x * var_y)
+
+
+def _pearson(x: np.ndarray, y: np.ndarray, valid: np.ndarray, window: int = None) -> tuple:
+    """Returns the number of pairs and the Pearson correlation coefficient for each window."""
+
+    # Centering the values of each series around their mean keeps the running sums small and avoids precision loss
+    count = np.maximum(valid.sum(axis=0), 1)
+    x = np.where(valid, x - np.where(valid, x, 0.0).sum(axis=0) / count, 0.0)
+    y = np.where(valid, y - np.where(valid, y, 0.0).sum(axis=0) / count, 0.0)
+
+    n = _running_sum(valid.astype(np.int64), window)
+    corr = _corr_from_sums(n, _running_sum(x, window), _running_sum(y, window), _running_sum(x * x, window),
+                           _running_sum(y * y, window), _running_sum(x * y, window))
+
+    # Floating point errors can leave a tiny variance in a constant window, so check for constants explicitly
+    for a in (np.where(valid, x, np.nan), np.where(valid, y, np.nan)):
+        low, high = _running_extremes(a, valid, window)
+        corr[low == high] = np.nan
+    return n, corr
+
+
+def _rank_matrix(a: np.ndarray, valid: np.ndarray, window: int = None) -> np.ndarray:
+    """
+    Returns an array where the value in row i and column j is the (average) rank of the j-th value among
+    the valid values in the window ending at position i. Any other axes (e.g. the lags) are kept after the first two.
+    """
+
+    less = _running_sum(((a[:, None] < a[None, :]) & valid[:, None]).astype(np.int64), window)
+    equal = _running_sum(((a[:, None] == a[None, :]) & valid[:, None]).astype(np.int64), window)
+    return less + (equal + 1) / 2
+
+
+def _spearman(x: np.ndarray, y: np.ndarray, valid: np.ndarray, window: int = None) -> tuple:
+    """Returns the number of pairs and the Spearman correlation coefficient for each window."""
+
+    # Ranks change every time a new value is added, so the values are ranked within each window and the Pearson
+    # coefficient of the ranks of each window is calculated in one pass. Memory usage is quadratic in the length
+    # of the series.
+    positions = np.arange(len(x)).reshape((-1,) + (1,) * (x.ndim - 1))
+    in_window = valid[None, :] & (positions[None, :] <= positions[:, None])
+    if window is not None:
+        in_window &= positions[None, :] > positions[:, None] - window
+
+    # Swap the axes so that the values of each window are summed along the first axis, like the pairs of a series
+    in_window = np.swapaxes(in_window, 0, 1)
+    rank_x = np.swapaxes(_rank_matrix(x, valid, window), 0, 1)
+    rank_y = np.swapaxes(_rank_matrix(y, valid, window), 0, 1)
+    n, corr = _pearson(rank_x, rank_y, in_window)
+    return n[-1], corr[-1]
+
+
+METHODS = {'pearson': _pearson, 'spearman': _spearman}
+
+
+def lagged_pairs(x, y, lags) -> tuple:
+    """
+    Returns the (x, y) pairs of each lag, with one row per position and one column per lag. A positive lag k pairs
+    x[i - k] with y[i], i.e. x leads y by k positions, and a negative lag pairs x[i] with y[i + k]. So the pairs
+    of row i only use the values up to position i. Pairs outside the series are missing (NaN).
+    x and y can have more axes after the first one (e.g. one per signal), which are kept before the lag axis.
+    """
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if len(x) != len(y):
+        raise ValueError("Both series must have the same length.")
+    lags = np.asarray(lags, dtype=np.int64)
+
+    positions = np.arange(len(x))[:, None]
+    x_positions = positions - np.maximum(lags, 0)[None, :]
+    y_positions = positions + np.minimum(lags, 0)[None, :]
+    inside = (x_positions >= 0) & (y_positions >= 0)
+    last = max(len(x) - 1, 0)
+    pairs = []
+    for a, a_positions in ((x, x_positions), (y, y_positions)):
+        # Move the lag axis after the other axes of the series
+        values = np.moveaxis(a[np.clip(a_positions, 0, last)], 1, -1)
+        pairs.append(np.where(inside.reshape((len(a),) + (1,) * (a.ndim - 1) + (-1,)), values, np.nan))
+    return tuple(pairs)
+
+
+def lagged_corr(x, y, lags, window: int = None, min_periods: int = 1, method: str = 'pearson') -> tuple:
+    """
+    Calculate the correlation coefficient ('pearson' or 'spearman') between the pairs of each lag
+    (see lagged_pairs) over every expanding window (or every rolling window of the given size) in a single pass.
+    Returns the number of pairs and the coefficients as arrays with one row per window end position
+    and one column per lag. x and y can have more axes after the first one, which are broadcast against each other
+    (e.g. x with one column per signal and y with one per review category give the coefficients of all the pairs).
+    """
+
+    if method not in METHODS:
+        raise ValueError(f"Unsupported correlation method '{method}'. Use one of: {', '.join(METHODS)}.")
+    if window is not None and window < 1:
+        raise ValueError("The window size must be a positive integer.")
+
+    x_lagged, y_lagged = np.broadcast_arrays(*lagged_pairs(x, y, lags))
+    valid = ~(np.isnan(x_lagged) | np.isnan(y_lagged))
+    if not valid.any():
+        return np.zeros(x_lagged.shape, dtype=np.int64), np.full(x_lagged.shape, np.nan)
+
+    n, corr = METHODS[method](x_lagged, y_lagged, valid, window)
+    # Same as pandas - at least min_periods pairs are needed and a single pair has no correlation
+    corr[n < max(min_periods, 2)] = np.nan
+    return n, np.clip(corr, -1.0, 1.0)
+
+
+def expanding_corr(x, y, method: str = 'pearson', min_periods: int = 1) -> np.ndarray:
+    """Calculate the correlation coefficient between x and y over every expanding window [0, i]."""
+
+    return lagged_corr(x, y, [0], min_periods=min_periods, method=method)[1][:, 0]
+
+
+def rolling_corr(x, y, window: int, method: str = 'pearson', min_periods: int = None) -> np.ndarray:
+    """Calculate the correlation coefficient between x and y over every rolling window of the given size."""
+
+    return lagged_corr(x, y, [0], window, window if min_periods is None else min_periods, method)[1][:, 0]
+
+
+def corr_p_values(corr, n) -> np.ndarray:
+    """
+    Returns the two-sided p-values of Pearson correlation coefficients calculated from n pairs
+    (the same as scipy.stats.pearsonr).
+    """
+
+    # SciPy takes long to import and is only needed for the p-values of the lagged mode
+    import scipy.stats
+
+    corr = np.asarray(corr, dtype=float)
+    n = np.asarray(n, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.abs(corr) * np.sqrt((n - 2) / (1 - corr * corr))
+        p = 2 * scipy.stats.t.sf(t, n - 2)
+    return np.where((n > 2) & ~np.isnan(corr), p, np.nan)
+
+
+# The functions below keep the running sums in a dictionary (the "state") that can be saved as a data job property,
+# so that the correlation can be extended with new values without reading the whole history again.
+# The sums are kept around a fixed shift (the first value) to avoid precision loss. The state of several
+# correlations (e.g. of each signal, category and lag) keeps each value as a nested list, with None when missing.
+
+
+def empty_state() -> dict:
+    """Returns the correlation state before any pairs are added."""
+
+    return {'n': 0, 'shift_x': None, 'shift_y': None, 'sum_x': 0.0, 'sum_y': 0.0, 'sum_xx': 0.0,
+            'sum_yy': 0.0, 'sum_xy': 0.0, 'min_x': None, 'max_x': None, 'min_y': None, 'max_y': None}
+
+
+def state_corr(state: dict) -> float:
+    """Returns the Pearson correlation coefficient of all pairs added to the state."""
+
+    if state['n'] < 2 or state['min_x'] == state['max_x'] or state['min_y'] == state['max_y']:
+        return np.nan
+    corr = _corr_from_sums(state['n'], state['sum_x'], state['sum_y'], state['sum_xx'], state['sum_yy'],
+                           state['sum_xy'])
+    return float(np.clip(corr, -1.0, 1.0))
+
+
+def _state_value(a: np.ndarray):
+    """Returns the value of the state as a number or a nested list (of the state of several correlations)."""
+
+    if a.ndim == 0:
+        return None if np.isnan(a) else a.item()
+    return np.where(np.isnan(a), None, a).tolist() if a.dtype.kind == 'f' else a.tolist()
+
+
+def extend_state(state: dict, x, y) -> tuple:
+    """
+    Add the (x, y) pairs to the correlation state. Returns the Pearson correlation coefficient
+    after each added pair and the new state. The given state is not modified.
+    x and y can have more axes after the first one, which are broadcast against each other, to extend the state of
+    a correlation per element at once (e.g. with x of shape (weeks, signals, 1) and y of shape (weeks, 1, categories)).
+    """
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if len(x) != len(y):
+        raise ValueError("Both series must have the same length.")
+    x, y = np.broadcast_arrays(x, y)
+    if len(x) == 0:
+        return np.full(x.shape, np.nan), dict(state)
+    valid = ~(np.isnan(x) | np.isnan(y))
+    before = {key: np.broadcast_to(np.asarray(value, dtype=np.int64 if key == 'n' else float), x.shape[1:])
+              for key, value in state.items() if key in empty_state()}
+
+    # The correlations without pairs so far are shifted by their first valid pair
+    first = valid.argmax(axis=0)[None]
+    start = (before['n'] == 0) & valid.any(axis=0)
+    shift_x = np.where(start, np.take_along_axis(x, first, axis=0)[0], before['shift_x'])
+    shift_y = np.where(start, np.take_along_axis(y, first, axis=0)[0], before['shift_y'])
+
+    n = before['n'] + np.cumsum(valid, axis=0)
+    x_shifted = np.where(valid, x - shift_x, 0.0)
+    y_shifted = np.where(valid, y - shift_y, 0.0)
+    sums = {'sum_x': x_shifted, 'sum_y': y_shifted, 'sum_xx': x_shifted * x_shifted,
+            'sum_yy': y_shifted * y_shifted, 'sum_xy': x_shifted * y_shifted}
+    sums = {key: before[key] + np.cumsum(values, axis=0) for key, values in sums.items()}
+    corr = _corr_from_sums(n, **sums)
+
+    # Check for constant values explicitly (see _pearson). The missing extremes (NaN) of the state are ignored.
+    extremes = {}
+    for a, key in ((x, 'x'), (y, 'y')):
+        low = np.fmin(np.minimum.accumulate(np.where(valid, a, np.inf), axis=0), before[f'min_{key}'])
+        high = np.fmax(np.maximum.accumulate(np.where(valid, a, -np.inf), axis=0), before[f'max_{key}'])
+        corr[low == high] = np.nan
+        extremes[f'min_{key}'] = np.where(n[-1] > 0, low[-1], np.nan)
+        extremes[f'max_{key}'] = np.where(n[-1] > 0, high[-1], np.nan)
+
+    corr[n < 2] = np.nan
+    values = {'n': n[-1], 'shift_x': shift_x, 'shift_y': shift_y, **{key: a[-1] for key, a in sums.items()},
+              **extremes}
+    return np.clip(corr, -1.0, 1.0), dict(state, **{key: _state_value(a) for key, a in values.items()})
@@ -0,0 +1,119 @@
+import pandas as pd
+
+import metrics
+
+# USER DEFINED FUNCTIONS FOR LOADING THE DASHBOARD DATA
+
+# The dashboard only loads the weeks in the selected date range. Long ranges are aggregated in the DB into buckets
+# of several weeks, keeping the minimum and the maximum of each bucket (min/max bucketing), so a line never has
+# more than MAX_POINTS points and its peaks are still shown. The table view is loaded one page at a time.
+# The queries use Trino SQL and the tables store the dates as "YYYY-MM-DD" strings.
+# The time spent in the queries is measured in the "query" phase (see metrics.py).
+
+# Maximum number of points per line (about one point per 2 pixels of the chart width)
+MAX_POINTS = 500
+# Number of rows per page of the table view
+PAGE_SIZE = 50
+
+
+def _range_condition(start: str, end: str) -> str:
+    return f"date BETWEEN '{start}' AND '{end}'"
+
+
+@metrics.timer("query")
+def date_bounds(connection, table: str) -> tuple:
+    """Returns the first and the last date of the table."""
+
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT min(date), max(date) FROM {table}")
+    return tuple(cursor.fetchone())
+
+
+@metrics.timer("query")
+def row_count(connection, table: str, start: str, end: str) -> int:
+    """Returns the number of rows in the date range."""
+
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT count(*) FROM {table} WHERE {_range_condition(start, end)}")
+    return cursor.fetchone()[0]
+
+
+@metrics.timer("query")
+def value_on(connection, table: str, column: str, date: str):
+    """Returns the value of the column on the given date (None if there is no such row)."""
+
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT {column} FROM {table} WHERE date = '{date}'")
+    row = cursor.fetchone()
+    return None if row is None else row[0]
+
+
+def bucket_weeks(start: str, end: str, max_points: int = MAX_POINTS) -> int:
+    """Returns the number of weeks per bucket, so that the range fits in max_points points (2 per bucket)."""
+
+    weeks = (pd.Timestamp(end) - pd.Timestamp(start)).days // 7 + 1
+    return max(1, -(-weeks // max(1, max_points // 2)))
+
+
+def minmax_query(table: str, columns: list, start: str, end: str, weeks: int) -> str:
+    """Returns the query with the minimum and maximum of each column (and their dates) per bucket of weeks."""
+
+    aggregates = ",\n".join(
+        f"min({column}) AS {column}_min, min_by(date, {column}) AS {column}_min_date, "
+        f"max({column}) AS {column}_max, max_by(date, {column}) AS {column}_max_date"
+        for column in columns
+    )
+    return f"""
+        SELECT {aggregates}
+        FROM {table}
+        WHERE {_range_condition(start, end)}
+        GROUP BY date_diff('week', date '{start}', date(date)) / {weeks}
+        """
+
+
+@metrics.timer("query")
+def load_series(connection, table: str, columns: list, start: str, end: str, max_points: int = MAX_POINTS) -> dict:
+    """
+    Load the columns in the date range. Returns a dictionary from column name to a series indexed by date,
+    with up to max_points points.
+    """
+
+    weeks = bucket_weeks(start, end, max_points)
+    if weeks == 1:
+        df = pd.read_sql_query(
+            f"SELECT date, {', '.join(columns)} FROM {table} WHERE {_range_condition(start, end)} ORDER BY date",
+            connection
+        )
+        df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d')
+        return {column: df.set_index('date')[column].astype(float) for column in columns}
+
+    df = pd.read_sql_query(minmax_query(table, columns, start, end, weeks), connection)
+    series = {}
+    for column in columns:
+        points = pd.concat([
+            pd.Series(df[f"{column}_min"].to_numpy(dtype=float), index=df[f"{column}_min_date"]),
+            pd.Series(df[f"{column}_max"].to_numpy(dtype=float), index=df[f"{column}_max_date"])
+        ])
+        # Buckets without values have no dates, and a constant bucket gives the same point twice
+        points = points[points.index.notna()]
+        points = points[~points.index.duplicated()]
+        points.index = pd.to_datetime(points.index, format='%Y-%m-%d')
+        series[column] = points.sort_index().rename_axis('date')
+    return series
+
+
+@metrics.timer("query")
+def load_page(connection, table: str, columns: list, start: str, end: str, page: int,
+              page_size: int = PAGE_SIZE) -> pd.DataFrame:
+    """Load one page of the rows in the date range, from the latest date to the earliest."""
+
+    return pd.read_sql_query(
+        f"""
+        SELECT date, {', '.join(columns)}
+        FROM {table}
+        WHERE {_range_condition(start, end)}
+        ORDER BY date DESC
+        OFFSET {page * page_size} LIMIT {page_size}
+        """,
+        connection
+    )
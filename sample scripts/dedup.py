@@ -0,0 +1,68 @@
+import base64
+import hashlib
+import zlib
+
+import numpy as np
+import pandas as pd
+
+# USER DEFINED FUNCTIONS FOR DETECTING ALREADY INGESTED REVIEWS
+
+# A review is identified by a 64-bit hash of its date and its normalized text (case-folded, with the whitespace
+# collapsed), so the same review is recognized when it moves to another page or is scraped again.
+# The hashes of the ingested reviews of the last ingested date of each product are kept as a sorted array
+# (see SeenSet), which is saved in the data job properties as a compressed base64 string (about 11 characters
+# per review). The older reviews are skipped by their date.
+
+
+def normalize_reviews(reviews: pd.Series) -> pd.Series:
+    """Case-fold the review texts and collapse their whitespace."""
+
+    return reviews.astype(str).str.casefold().str.replace(r"\s+", " ", regex=True).str.strip()
+
+
+def review_hashes(dates, reviews) -> np.ndarray:
+    """Returns the 64-bit hash of each (date, review) pair."""
+
+    texts = normalize_reviews(pd.Series(reviews, dtype=object))
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(f"{date}\x1f{text}".encode('utf-8'), digest_size=8).digest(), 'little')
+         for date, text in zip(dates, texts)),
+        dtype=np.uint64, count=len(texts)
+    )
+
+
+class SeenSet:
+    """A set of review hashes stored as a sorted array."""
+
+    def __init__(self, hashes=None):
+        self.hashes = np.unique(np.asarray(hashes if hashes is not None else [], dtype=np.uint64))
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        """Returns whether each of the hashes is in the set."""
+
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if len(self.hashes) == 0:
+            return np.zeros(len(hashes), dtype=bool)
+        positions = np.searchsorted(self.hashes, hashes)
+        return self.hashes[np.minimum(positions, len(self.hashes) - 1)] == hashes
+
+    def add(self, hashes: np.ndarray):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if len(hashes) > 0:
+            self.hashes = np.union1d(self.hashes, hashes)
+
+    def dumps(self) -> str:
+        """Returns the set as a string for the data job properties."""
+
+        return base64.b64encode(zlib.compress(self.hashes.astype('<u8').tobytes())).decode('ascii')
+
+    @classmethod
+    def loads(cls, data: str) -> 'SeenSet':
+        """Returns the set saved with dumps (an empty set if there is no saved set)."""
+
+        if not data:
+            return cls()
+        return cls(np.frombuffer(zlib.decompress(base64.b64decode(data)), dtype='<u8'))
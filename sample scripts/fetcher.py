@@ -0,0 +1,148 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+# USER DEFINED FUNCTIONS FOR FETCHING WEB PAGES CONCURRENTLY
+
+# HTTP status codes after which the request is retried
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def conditional_get(url: str, validators: dict = None, timeout: float = 30) -> tuple:
+    """
+    Makes a GET request which only downloads the page if it has changed since the response with the given
+    validators (its ETag and Last-Modified headers). Returns the page text (None if the page hasn't changed)
+    and the validators to send with the next request.
+    """
+
+    validators = validators or {}
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    with metrics.timer("fetch"):
+        r = requests.get(url, headers=headers, timeout=timeout)
+        metrics.count("fetch_requests")
+        metrics.count("fetch_bytes", len(r.content))
+    if r.status_code == 304:
+        return None, validators
+    r.raise_for_status()
+    return r.text, {'etag': r.headers.get('ETag'), 'last_modified': r.headers.get('Last-Modified')}
+
+
+class TokenBucket:
+    """Limits the number of requests per second. Up to `capacity` requests can be made at once after a pause."""
+
+    def __init__(self, rate: float, capacity: int = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a request can be made."""
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class PageFetcher:
+    """
+    Fetches web pages in a thread pool over a shared (connection pooling) session.
+    All requests go through one rate limit and failed requests are retried with exponential backoff.
+    The fetched pages are stored in the archive if one is given (see archive.py).
+    """
+
+    def __init__(self, max_workers: int = 4, rate: float = 1.0, burst: int = 1, retries: int = 3,
+                 backoff: float = 1.0, timeout: float = 30, archive=None):
+        self.max_workers = max_workers
+        self.archive = archive
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate, burst)
+        # The HTML parsers of webscrape are only needed by the scraping steps, not by conditional_get
+        from webscrape import HEADERS
+
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def get(self, url: str) -> str:
+        """Makes a GET request to a given URL and returns the page text. Retries on errors."""
+
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            try:
+                with metrics.timer("fetch"):
+                    r = self.session.get(url, timeout=self.timeout)
+                    metrics.count("fetch_requests")
+                    metrics.count("fetch_bytes", len(r.content))
+                if r.status_code not in RETRY_STATUSES:
+                    r.raise_for_status()
+                    if self.archive is not None:
+                        self.archive.put(url, r.text)
+                    return r.text
+                error = f"HTTP {r.status_code}"
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = str(e)
+            if attempt >= self.retries:
+                raise requests.RequestException(f"Failed to fetch {url} after {attempt + 1} attempts: {error}")
+            delay = self.backoff * 2 ** attempt
+            log.info(f"Request to {url} failed ({error}). Retrying in {delay} seconds...")
+            metrics.count("fetch_retries")
+            time.sleep(delay)
+            attempt += 1
+
+    def pages(self, url_for_page: Callable[[int], str], prefetch: int = 2, first_page: int = 1) -> Iterator[tuple]:
+        """
+        Yields (page number, page text) for consecutive pages in order, while the next `prefetch` pages
+        are already being fetched. Stop iterating (break) to cancel the pages that are not needed.
+        """
+
+        pending = {}
+        page = first_page
+        try:
+            while True:
+                # Keep the current page and the next `prefetch` pages in flight
+                for p in range(page, page + prefetch + 1):
+                    if p not in pending:
+                        pending[p] = self.executor.submit(metrics.in_step(self.get), url_for_page(p))
+                yield page, pending.pop(page).result()
+                page += 1
+        finally:
+            for future in pending.values():
+                future.cancel()
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,146 @@
+import logging
+import pathlib
+import re
+import time
+
+import numpy as np
+import pandas as pd
+from vdk.api.job_input import IJobInput
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+# USER DEFINED FUNCTIONS FOR DATA INGESTION
+
+# Directory with the SQL steps creating the tables
+JOB_DIR = pathlib.Path(__file__).parent
+# Maximum size of a single INSERT statement sent by send_dataframe (Trino limits the query length)
+MAX_STATEMENT_BYTES = 512 * 1024
+# Whether send_dataframe inserts the rows with multi-row INSERT statements instead of send_tabular_data_for_ingestion
+BULK_INGESTION = True
+
+
+@metrics.timer("wait")
+def wait_for_rows(job_input: IJobInput, table: str, condition: str, expected_rows: int, timeout: float = 300,
+                  initial_delay: float = 0.5, max_delay: float = 10) -> float:
+    """
+    Wait until at least expected_rows rows matching the condition are visible in the table, checking
+    with exponential backoff. Returns the number of seconds waited. Raises TimeoutError after timeout seconds.
+    """
+
+    start = time.monotonic()
+    delay = initial_delay
+    while True:
+        rows = job_input.execute_query(f"SELECT count(*) FROM {table} WHERE {condition}")[0][0]
+        waited = time.monotonic() - start
+        if rows >= expected_rows:
+            log.info(f"{rows} rows are visible in {table} after waiting {waited:.1f} seconds.")
+            return waited
+        if waited + delay > timeout:
+            raise TimeoutError(f"Only {rows} of {expected_rows} rows are visible in {table} "
+                               f"after {waited:.1f} seconds.")
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
+
+
+def table_schemas(job_dir: pathlib.Path = JOB_DIR) -> dict:
+    """
+    Read the column types of the tables from the CREATE TABLE statements of the SQL steps. Returns a dictionary
+    from the table name without the prefix (e.g. "covid_cases_usa_daily") to a dictionary from column name to type.
+    """
+
+    schemas = {}
+    for path in sorted(job_dir.glob("*.sql")):
+        sql = path.read_text()
+        # The table name is taken from the naming convention comment, e.g. "prefix + _ + covid_cases_usa_daily"
+        name = re.search(r"prefix \+ _ \+ (\w+)", sql)
+        columns = re.search(r"CREATE TABLE[^(]*\((.*)\)", sql, re.DOTALL)
+        if name and columns:
+            schemas[name.group(1)] = dict(column.split() for column in columns.group(1).split(",") if column.strip())
+    return schemas
+
+
+def table_schema(table: str, schemas: dict = None) -> dict:
+    """Returns the column types of the table (with or without the prefix)."""
+
+    schemas = table_schemas() if schemas is None else schemas
+    # Longer names first, so that e.g. yankee_candle_reviews_transformed isn't matched as yankee_candle_reviews
+    for name in sorted(schemas, key=len, reverse=True):
+        if table == name or table.endswith(f"_{name}"):
+            return schemas[name]
+    raise KeyError(f"No CREATE TABLE statement found for table {table}.")
+
+
+def sql_literals(column: pd.Series, column_type: str) -> list:
+    """Returns the values of the column as SQL literals of the given type, with NULL for the missing values."""
+
+    missing = column.isna().to_numpy()
+    column_type = column_type.upper()
+    if column_type in ("INTEGER", "INT", "BIGINT"):
+        literals = np.where(missing, 0, column.to_numpy()).astype(np.int64).astype(str).tolist()
+    elif column_type in ("REAL", "DOUBLE"):
+        values = np.where(missing, 0.0, column.to_numpy(dtype=float)).astype(str).tolist()
+        # The literals would be DOUBLE in Trino, so cast them to the column type
+        literals = [f"CAST({value} AS {column_type})" for value in values]
+    else:
+        # The missing values may not be converted to strings (e.g. NaT), they are replaced with NULL below
+        literals = ["'" + str(value).replace("'", "''") + "'" for value in column.astype(str).tolist()]
+    if missing.any():
+        literals = ["NULL" if m else literal for literal, m in zip(literals, missing.tolist())]
+    return literals
+
+
+def values_statements(df: pd.DataFrame, destination_table: str, schema: dict,
+                      max_bytes: int = MAX_STATEMENT_BYTES) -> list:
+    """
+    Build multi-row INSERT INTO ... VALUES statements for the dataframe, each up to max_bytes long
+    (a row longer than max_bytes gets its own statement). The values are converted column by column.
+    """
+
+    columns = df.columns.to_list()
+    literals = [sql_literals(df[name], schema[name]) for name in columns]
+    tuples = ["(" + ", ".join(row) + ")" for row in zip(*literals)]
+
+    header = f"INSERT INTO {destination_table} ({', '.join(columns)}) VALUES\n"
+    # Split the rows where the statement reaches the byte budget (+ 2 for the separator between the rows)
+    sizes = np.cumsum([len(t.encode("utf-8")) + 2 for t in tuples])
+    statements = []
+    start = 0
+    while start < len(tuples):
+        offset = sizes[start - 1] if start > 0 else 0
+        end = max(int(np.searchsorted(sizes, offset + max_bytes - len(header), side="right")), start + 1)
+        statements.append(header + ",\n".join(tuples[start:end]))
+        start = end
+    return statements
+
+
+@metrics.timer("ingest")
+def send_dataframe(job_input: IJobInput, df: pd.DataFrame, destination_table: str, bulk: bool = BULK_INGESTION,
+                   max_bytes: int = MAX_STATEMENT_BYTES) -> dict:
+    """
+    Ingest the dataframe into the destination table. With bulk=True the rows are inserted with a few multi-row
+    INSERT statements with values of the column types from the CREATE TABLE statements. Otherwise they are sent
+    row by row with send_tabular_data_for_ingestion. Returns the number of rows, bytes (of the statements)
+    and seconds taken.
+    """
+
+    start = time.monotonic()
+    if bulk:
+        statements = values_statements(df, destination_table, table_schema(destination_table), max_bytes)
+        for statement in statements:
+            job_input.execute_query(statement)
+        size = sum(len(statement.encode("utf-8")) for statement in statements)
+    else:
+        job_input.send_tabular_data_for_ingestion(
+            rows=df.values,
+            column_names=df.columns.to_list(),
+            destination_table=destination_table
+        )
+        size = int(df.memory_usage(index=False, deep=True).sum())
+    seconds = time.monotonic() - start
+    metrics.count("ingest_rows", len(df))
+    metrics.count("ingest_bytes", size)
+    log.info(f"{len(df)} rows ({size} bytes) were sent to {destination_table} in {seconds:.2f} seconds "
+             f"({len(df) / max(seconds, 1e-9):.0f} rows/s).")
+    return {"rows": len(df), "bytes": size, "seconds": seconds}
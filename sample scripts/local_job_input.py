@@ -0,0 +1,63 @@
+import copy
+import json
+import pathlib
+import sqlite3
+import threading
+
+# USER DEFINED FUNCTIONS FOR RUNNING THE DATA JOB LOCALLY
+
+# LocalJobInput is a stand-in for VDK's job_input (IJobInput) that keeps the data in a SQLite database
+# (in memory by default) and the data job properties in a dictionary (optionally saved in a JSON file).
+# It only implements the methods used by the steps of this data job, so the job can be run offline
+# (see pipeline.py). The queries are executed by SQLite, so Trino-specific SQL is not supported.
+
+
+class LocalJobInput:
+    """Runs the queries and the ingestion of the data job against a local SQLite database."""
+
+    def __init__(self, database: str = ":memory:", properties: dict = None, properties_file: str = None):
+        # The steps may run in parallel threads, so the connection is shared behind a lock
+        self.connection = sqlite3.connect(database, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.properties_file = pathlib.Path(properties_file) if properties_file else None
+        if properties is None and self.properties_file and self.properties_file.exists():
+            properties = json.loads(self.properties_file.read_text())
+        self.properties = copy.deepcopy(properties or {})
+
+    def get_all_properties(self) -> dict:
+        with self.lock:
+            return copy.deepcopy(self.properties)
+
+    def set_all_properties(self, properties: dict):
+        with self.lock:
+            self.properties = copy.deepcopy(properties)
+            if self.properties_file:
+                self.properties_file.write_text(json.dumps(self.properties, indent=2, sort_keys=True))
+
+    def get_property(self, name: str, default_value=None):
+        with self.lock:
+            return copy.deepcopy(self.properties.get(name, default_value))
+
+    def get_managed_connection(self) -> sqlite3.Connection:
+        # Used for reading query results chunk by chunk (see queries.py), so it doesn't go through the lock
+        return self.connection
+
+    def execute_query(self, query: str) -> list:
+        with self.lock:
+            cursor = self.connection.execute(query)
+            rows = cursor.fetchall()
+            self.connection.commit()
+        return [list(row) for row in rows]
+
+    def send_tabular_data_for_ingestion(self, rows, column_names: list, destination_table: str, method: str = None,
+                                        target: str = None, collection_id: str = None):
+        # Convert NumPy values (e.g. rows=df.values) to Python values, which SQLite can store
+        rows = [row.tolist() if hasattr(row, 'tolist') else list(row) for row in rows]
+        query = f"INSERT INTO {destination_table} ({', '.join(column_names)}) " \
+                f"VALUES ({', '.join('?' for _ in column_names)})"
+        with self.lock:
+            self.connection.executemany(query, rows)
+            self.connection.commit()
+
+    def close(self):
+        self.connection.close()
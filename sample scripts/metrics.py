@@ -0,0 +1,270 @@
+import contextlib
+import contextvars
+import cProfile
+import functools
+import importlib.util
+import io
+import json
+import logging
+import os
+import pathlib
+import pstats
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Callable
+
+# Optional dependencies (see peak_rss_bytes below)
+try:
+    import resource
+except ImportError:
+    resource = None
+
+log = logging.getLogger(__name__)
+
+# USER DEFINED FUNCTIONS FOR MEASURING THE DATA JOB STEPS
+
+# The time spent in each phase of a step (fetch, parse, clean, query, transform, ingest, wait) is measured with
+# the timer context manager, and the amounts processed (e.g. fetch_bytes, ingest_rows, fetch_retries) with count.
+# The measurements are kept per step: the run function of each step is decorated with step, which also writes them
+# when the step finishes (see save) and profiles the step if configured so. Rates are derived from the counters
+# named <phase>_rows and <phase>_bytes, e.g. ingest_rows_per_second.
+
+# Directory of the metrics files (can be overridden by the metrics_dir data job property):
+# - metrics.jsonl: one JSON line per step run
+# - <step>.prom: the latest run of the step in the Prometheus text format (for the node_exporter textfile collector)
+# - <step>.prof / <step>.html: the cProfile / pyinstrument profile of the latest run of the step
+METRICS_DIR = pathlib.Path(__file__).parent / "metrics"
+# Whether the metrics are also saved in the {prefix}_job_stats table (can be overridden by the metrics_table
+# data job property)
+METRICS_TABLE = False
+# Profiler of the steps (can be overridden by the profile_mode data job property):
+# - None: no profiling
+# - "cprofile": profile the thread running the step with cProfile and log the slowest functions
+# - "pyinstrument": profile with pyinstrument (if installed) and save an HTML report
+# Only one profiler can run at a time in newer Python versions, so profile the steps one after another
+# (e.g. pipeline.py --max-workers 1).
+PROFILE_MODE = None
+# Prefix of the Prometheus metric names
+PROMETHEUS_PREFIX = "datajob"
+
+# The step being measured in the current thread. Threads started by a step measure into the step
+# if the functions they run are wrapped with in_step.
+_step = contextvars.ContextVar('step', default='job')
+_lock = threading.Lock()
+# (step, phase) -> [seconds, calls]
+_timers = defaultdict(lambda: [0.0, 0])
+# (step, counter name) -> value
+_counters = defaultdict(float)
+
+
+@contextlib.contextmanager
+def timer(phase: str):
+    """Measure the time spent in the with block as part of the phase of the current step."""
+
+    step = _step.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            measured = _timers[(step, phase)]
+            measured[0] += elapsed
+            measured[1] += 1
+
+
+def count(name: str, value: float = 1):
+    """Add the value to the counter of the current step."""
+
+    with _lock:
+        _counters[(_step.get(), name)] += value
+
+
+def in_step(function: Callable) -> Callable:
+    """Returns the function measuring into the current step, to be run in another thread (e.g. in a thread pool)."""
+
+    context = contextvars.copy_context()
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        # A context can't be entered by several threads at once, so each call runs in its own copy
+        return context.copy().run(function, *args, **kwargs)
+    return wrapper
+
+
+def peak_rss_bytes():
+    """Returns the peak resident set size of the process in bytes (None where it isn't available, e.g. Windows)."""
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes and macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def snapshot(step: str = None) -> dict:
+    """Returns the measurements of the step (by default the current one)."""
+
+    step = step or _step.get()
+    with _lock:
+        phases = {phase: {'seconds': seconds, 'calls': calls}
+                  for (name, phase), (seconds, calls) in _timers.items() if name == step}
+        counters = {counter: value for (name, counter), value in _counters.items() if name == step}
+    for counter, value in list(counters.items()):
+        phase, _, unit = counter.rpartition('_')
+        if unit in ('rows', 'bytes') and phases.get(phase, {}).get('seconds'):
+            counters[f"{counter}_per_second"] = value / phases[phase]['seconds']
+    return {
+        'step': step,
+        'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'phases': phases,
+        'counters': counters,
+        'peak_rss_bytes': peak_rss_bytes()
+    }
+
+
+def reset(step: str = None):
+    """Forget the measurements of the step (by default the current one)."""
+
+    step = step or _step.get()
+    with _lock:
+        for measurements in (_timers, _counters):
+            for key in [key for key in measurements if key[0] == step]:
+                del measurements[key]
+
+
+def flatten(stats: dict) -> dict:
+    """Returns the measurements of a snapshot as a dictionary from metric name (e.g. fetch_seconds) to value."""
+
+    metrics = {}
+    for phase, measured in stats['phases'].items():
+        metrics[f"{phase}_seconds"] = measured['seconds']
+        metrics[f"{phase}_calls"] = measured['calls']
+    metrics.update(stats['counters'])
+    if stats['peak_rss_bytes'] is not None:
+        metrics['peak_rss_bytes'] = stats['peak_rss_bytes']
+    return metrics
+
+
+def write_json(stats: dict, directory: pathlib.Path):
+    """Append the snapshot to metrics.jsonl in the directory."""
+
+    directory.mkdir(parents=True, exist_ok=True)
+    with _lock, open(directory / "metrics.jsonl", "a", encoding="utf-8") as file:
+        file.write(json.dumps(stats) + "\n")
+
+
+def write_prometheus(stats: dict, directory: pathlib.Path):
+    """Write the snapshot to <step>.prom in the directory in the Prometheus text format."""
+
+    step = stats['step']
+    lines = [f"# TYPE {PROMETHEUS_PREFIX}_phase_seconds gauge",
+             *(f'{PROMETHEUS_PREFIX}_phase_seconds{{step="{step}",phase="{phase}"}} {measured["seconds"]}'
+               for phase, measured in stats['phases'].items()),
+             f"# TYPE {PROMETHEUS_PREFIX}_phase_calls gauge",
+             *(f'{PROMETHEUS_PREFIX}_phase_calls{{step="{step}",phase="{phase}"}} {measured["calls"]}'
+               for phase, measured in stats['phases'].items()),
+             f"# TYPE {PROMETHEUS_PREFIX}_counter gauge",
+             *(f'{PROMETHEUS_PREFIX}_counter{{step="{step}",name="{name}"}} {value}'
+               for name, value in stats['counters'].items())]
+    if stats['peak_rss_bytes'] is not None:
+        lines += [f"# TYPE {PROMETHEUS_PREFIX}_peak_rss_bytes gauge",
+                  f'{PROMETHEUS_PREFIX}_peak_rss_bytes{{step="{step}"}} {stats["peak_rss_bytes"]}']
+    directory.mkdir(parents=True, exist_ok=True)
+    # The collector may read the file at any time, so it is replaced at once
+    temporary = directory / f"{step}.prom.tmp"
+    temporary.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    os.replace(temporary, directory / f"{step}.prom")
+
+
+def send_stats(job_input, stats: dict, destination_table: str):
+    """Ingest the snapshot into the stats table (see 07_create_job_stats.sql), one row per metric."""
+
+    import pandas as pd
+    import ingestion
+
+    metrics = flatten(stats)
+    ingestion.send_dataframe(job_input, pd.DataFrame({
+        'run_time': stats['time'],
+        'step': stats['step'],
+        'metric': list(metrics),
+        'value': list(metrics.values())
+    }), destination_table=destination_table)
+
+
+def save(job_input, props: dict, stats: dict):
+    """Write the snapshot of a step to the metrics files and, if configured so, to the stats table."""
+
+    directory = pathlib.Path(props.get("metrics_dir", METRICS_DIR))
+    write_json(stats, directory)
+    write_prometheus(stats, directory)
+    if props.get("metrics_table", METRICS_TABLE):
+        send_stats(job_input, stats, f"{props['prefix']}_job_stats")
+    log.info(f"Metrics of {stats['step']}: {json.dumps(flatten(stats))}")
+
+
+@contextlib.contextmanager
+def profiled(name: str, mode: str, directory: pathlib.Path):
+    """Profile the with block with the profiler of the mode (see PROFILE_MODE) and save the profile as <name>.*"""
+
+    if mode is None:
+        yield
+    elif mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            directory.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(directory / f"{name}.prof")
+            report = io.StringIO()
+            pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(20)
+            log.info(f"Profile of {name}:\n{report.getvalue()}")
+    elif mode == "pyinstrument":
+        # pyinstrument is only imported when it is used, so that the steps don't pay for its import
+        from pyinstrument import Profiler
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            directory.mkdir(parents=True, exist_ok=True)
+            (directory / f"{name}.html").write_text(profiler.output_html(), encoding="utf-8")
+            log.info(f"Profile of {name}:\n{profiler.output_text()}")
+    else:
+        raise ValueError(f"Unknown profile mode '{mode}'. Use one of: cprofile, pyinstrument.")
+
+
+def step(run: Callable) -> Callable:
+    """
+    Decorator of the run function of a job step: measures the step (the timers and counters of the functions
+    it calls), profiles it if configured so and saves the measurements when it finishes.
+    """
+
+    name = pathlib.Path(run.__code__.co_filename).stem
+
+    @functools.wraps(run)
+    def wrapper(job_input):
+        props = job_input.get_all_properties()
+        mode = props.get("profile_mode", PROFILE_MODE)
+        if mode == "pyinstrument" and importlib.util.find_spec("pyinstrument") is None:
+            raise ValueError("The pyinstrument profile mode needs the pyinstrument package. Install it with pip.")
+        token = _step.set(name)
+        try:
+            with profiled(name, mode, pathlib.Path(props.get("metrics_dir", METRICS_DIR))), timer("step"):
+                return run(job_input)
+        finally:
+            stats = snapshot(name)
+            reset(name)
+            _step.reset(token)
+            # Failing to save the metrics doesn't fail the step
+            try:
+                save(job_input, props, stats)
+            except Exception as e:
+                log.warning(f"The metrics of {name} could not be saved: {e}")
+    return wrapper
@@ -0,0 +1,171 @@
+"""
+Run the steps of the data job as a dependency graph: the steps that don't depend on each other
+(e.g. the COVID ingestion and the Amazon reviews scraping) run at the same time.
+
+To run the data job locally against a SQLite database (see local_job_input.py):
+
+    python pipeline.py --database job.sqlite --properties properties.json --prefix <prefix>
+"""
+import argparse
+import copy
+import importlib.util
+import logging
+import pathlib
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+log = logging.getLogger(__name__)
+
+# Directory with the steps of the data job
+JOB_DIR = pathlib.Path(__file__).parent.absolute()
+
+# The tables each step reads (inputs) and creates or writes (outputs), without the prefix.
+# A step depends on the previous steps (in the order of their file names) which output any of its inputs.
+STEPS = {
+    '01_create_covid_cases_usa_daily.sql': {'inputs': [], 'outputs': ['covid_cases_usa_daily']},
+    '02_create_yankee_candle_reviews.sql': {'inputs': [], 'outputs': ['yankee_candle_reviews']},
+    '03_create_yankee_candle_reviews_transformed.sql': {'inputs': [], 'outputs': ['yankee_candle_reviews_transformed']},
+    '04_create_weekly_correlation.sql': {'inputs': [], 'outputs': ['weekly_correlation']},
+    '05_create_correlation_matrix.sql': {'inputs': [], 'outputs': ['correlation_matrix']},
+    '06_create_lagged_correlation.sql': {'inputs': [], 'outputs': ['lagged_correlation']},
+    '07_create_job_stats.sql': {'inputs': [], 'outputs': ['job_stats']},
+    # The Python steps may write their metrics into job_stats (see metrics.py)
+    '10_ingest_covid_data.py': {'inputs': ['covid_cases_usa_daily', 'job_stats'], 'outputs': ['covid_cases_usa_daily']},
+    '20_ingest_amazon_reviews.py': {'inputs': ['yankee_candle_reviews', 'job_stats'],
+                                    'outputs': ['yankee_candle_reviews']},
+    '30_transform_amazon_reviews.py': {'inputs': ['yankee_candle_reviews', 'yankee_candle_reviews_transformed',
+                                                  'job_stats'],
+                                       'outputs': ['yankee_candle_reviews_transformed']},
+    '40_calculate_correlation.py': {'inputs': ['covid_cases_usa_daily', 'yankee_candle_reviews_transformed',
+                                               'weekly_correlation', 'correlation_matrix', 'lagged_correlation',
+                                               'job_stats'],
+                                    'outputs': ['weekly_correlation', 'correlation_matrix', 'lagged_correlation']},
+}
+
+
+def dependencies(steps: dict) -> dict:
+    """Returns a dictionary from each step to the set of steps it depends on."""
+
+    names = sorted(steps)
+    return {
+        name: {previous for previous in names[:i] if set(steps[previous]['outputs']) & set(steps[name]['inputs'])}
+        for i, name in enumerate(names)
+    }
+
+
+class StepJobInput:
+    """
+    The job_input passed to a step. The steps read all properties, change some of them and save all of them,
+    so when steps run at the same time only the properties changed by the step are saved, on top of the
+    properties saved by the other steps in the meantime.
+    """
+
+    def __init__(self, job_input, lock: threading.Lock):
+        self.job_input = job_input
+        self.lock = lock
+        self.read_properties = {}
+
+    def get_all_properties(self) -> dict:
+        properties = self.job_input.get_all_properties()
+        # A deep copy, as the steps change nested properties (e.g. the dates per product) in place
+        self.read_properties = copy.deepcopy(properties)
+        return properties
+
+    def set_all_properties(self, properties: dict):
+        with self.lock:
+            current = self.job_input.get_all_properties()
+            for key, value in properties.items():
+                if key not in self.read_properties or self.read_properties[key] != value:
+                    current[key] = value
+            for key in self.read_properties.keys() - properties.keys():
+                current.pop(key, None)
+            self.job_input.set_all_properties(current)
+            self.read_properties = copy.deepcopy(properties)
+
+    def __getattr__(self, name):
+        return getattr(self.job_input, name)
+
+
+def run_step(job_input, name: str, job_dir: pathlib.Path = JOB_DIR):
+    """Runs a SQL or Python step of the data job."""
+
+    path = job_dir / name
+    if path.suffix == '.sql':
+        # Replace the {property} placeholders (e.g. {prefix}) with the property values like VDK does
+        properties = job_input.get_all_properties()
+        query = re.sub(r"\{(\w+)\}", lambda m: str(properties.get(m.group(1), m.group(0))), path.read_text())
+        job_input.execute_query(query)
+    else:
+        spec = importlib.util.spec_from_file_location(path.stem, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        module.run(job_input)
+
+
+def run_pipeline(job_input, steps: dict = STEPS, job_dir: pathlib.Path = JOB_DIR, max_workers: int = 4) -> list:
+    """
+    Run the steps in threads as soon as the steps they depend on have finished. Returns the names of the steps
+    in the order they finished. If a step fails, the steps depending on it are not started and the error is raised
+    once the running steps finish.
+    """
+
+    # The Python steps import the helper modules from the job directory
+    if str(job_dir) not in sys.path:
+        sys.path.insert(0, str(job_dir))
+
+    step_dependencies = dependencies(steps)
+    lock = threading.Lock()
+    finished = []
+    running = {}
+    error = None
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            # Start all steps whose dependencies have finished
+            if error is None:
+                started = set(running.values())
+                for name in sorted(steps):
+                    if name not in finished and name not in started and step_dependencies[name] <= set(finished):
+                        log.info(f"Starting step {name}")
+                        running[executor.submit(run_step, StepJobInput(job_input, lock), name, job_dir)] = name
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    future.result()
+                except Exception as e:
+                    log.error(f"Step {name} failed: {e}")
+                    error = error or e
+                else:
+                    log.info(f"Step {name} finished")
+                    finished.append(name)
+
+    if error is not None:
+        raise error
+    return finished
+
+
+if __name__ == "__main__":
+    from local_job_input import LocalJobInput
+
+    parser = argparse.ArgumentParser(description="Run the data job locally against a SQLite database.")
+    parser.add_argument("--database", default=":memory:", help="SQLite database file")
+    parser.add_argument("--properties", help="JSON file with the data job properties")
+    parser.add_argument("--prefix", help="Table name prefix (the prefix data job property)")
+    parser.add_argument("--max-workers", type=int, default=4, help="Number of steps running at the same time")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(threadName)s %(name)s: %(message)s")
+    local_job_input = LocalJobInput(args.database, properties_file=args.properties)
+    if args.prefix:
+        properties = local_job_input.get_all_properties()
+        properties['prefix'] = args.prefix
+        local_job_input.set_all_properties(properties)
+    start = time.monotonic()
+    run_pipeline(local_job_input, max_workers=args.max_workers)
+    log.info(f"The data job finished in {time.monotonic() - start:.1f} seconds.")
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+from vdk.api.job_input import IJobInput
+
+import metrics
+
+# USER DEFINED FUNCTIONS FOR READING QUERY RESULTS
+
+# The columns of a query result are given as a dictionary from column name to type, e.g.
+# {'date': 'date', 'num_no_scent_reviews': 'int32'}. The type is "date" (a "YYYY-MM-DD" string parsed to
+# datetime64), "str" or a NumPy dtype. Integer and float columns with NULLs get the nullable pandas dtype.
+
+# Number of rows fetched from the DB at a time
+CHUNK_SIZE = 100_000
+
+
+def _typed_column(values: tuple, column_type: str):
+    if column_type == 'date':
+        return pd.to_datetime(np.array(values, dtype=object), format='%Y-%m-%d')
+    if column_type == 'str':
+        return np.array(values, dtype=object)
+    if None in values:
+        return pd.array(values, dtype=column_type.capitalize())
+    return np.array(values, dtype=column_type)
+
+
+def typed_frame(rows: list, columns: dict) -> pd.DataFrame:
+    """Build a dataframe from query result rows, converting each column straight to its type."""
+
+    values = list(zip(*rows)) if len(rows) > 0 else [() for _ in columns]
+    return pd.DataFrame({name: _typed_column(column, column_type)
+                         for (name, column_type), column in zip(columns.items(), values)})
+
+
+def read_query(job_input: IJobInput, query: str, columns: dict, chunk_size: int = CHUNK_SIZE) -> pd.DataFrame:
+    """
+    Execute the query and return its result as a dataframe with typed columns. The rows are fetched and converted
+    chunk_size rows at a time, so that the whole result is never held as Python lists.
+    """
+
+    cursor = job_input.get_managed_connection().cursor()
+    chunks = []
+    try:
+        with metrics.timer("query"):
+            cursor.execute(query)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                chunks.append(typed_frame(rows, columns))
+    finally:
+        cursor.close()
+    metrics.count("query_rows", sum(len(chunk) for chunk in chunks))
+    if not chunks:
+        return typed_frame([], columns)
+    return pd.concat(chunks, ignore_index=True)
@@ -0,0 +1,85 @@
+import abc
+import json
+
+import numpy as np
+import pandas as pd
+
+import metrics
+
+# USER DEFINED TIME SERIES SOURCES
+
+# A time series source (e.g. the COVID-19 cases in the US) is a signal correlated with the review categories
+# in 40_calculate_correlation.py. Each source fetches its new values incrementally, as a dataframe with a "date"
+# ("YYYY-MM-DD" string) and a "value" column, and declares whether its values are cumulative (like the COVID-19
+# cases) or daily. The values are stored in the source's table (with the prefix), in its date and value columns.
+#
+# To add a source, subclass TimeSeriesSource, add a CREATE TABLE step for its table and add it to SOURCES.
+# Step 10 ingests all sources and step 40 correlates all of them with all review categories at once.
+
+
+class TimeSeriesSource(abc.ABC):
+    """A signal fetched incrementally and stored in a table."""
+
+    # Name of the signal in the correlation results
+    name = ''
+    # Table without the prefix and its date and value columns
+    table = ''
+    date_column = 'date'
+    value_column = 'value'
+    # Whether the values are cumulative (converted to daily values by daily_values)
+    cumulative = False
+
+    @abc.abstractmethod
+    def fetch(self, last_date: str, state: dict = None) -> tuple:
+        """
+        Fetch the values after last_date. The state is what the previous fetch returned (e.g. HTTP validators).
+        Returns a dataframe with the date and value columns sorted by date, and the new state.
+        """
+
+    def daily_values(self, values: np.ndarray, previous_value: float = None) -> np.ndarray:
+        """
+        Returns the daily values of consecutive dates. Cumulative values are turned into differences, where the first
+        date (without previous_value) has a daily value of 0.
+        """
+
+        values = np.asarray(values, dtype=float)
+        if not self.cumulative or len(values) == 0:
+            return values
+        return np.diff(values, prepend=values[0] if previous_value is None else previous_value)
+
+
+class CovidCasesSource(TimeSeriesSource):
+    """The cumulative number of COVID-19 cases in the US from the COVID-19 API."""
+
+    name = 'covid_cases'
+    table = 'covid_cases_usa_daily'
+    date_column = 'obs_date'
+    value_column = 'number_of_cases'
+    cumulative = True
+    url = "https://covid-api.mmediagroup.fr/v1/history?country=US&status=confirmed"
+
+    def fetch(self, last_date: str, state: dict = None) -> tuple:
+        # The API only returns the whole history, so the request is conditional on the validators (ETag and
+        # Last-Modified) of the previous response - if the data hasn't changed since then, nothing is downloaded.
+        # The HTTP client is only imported when fetching, as step 40 only uses the description of the sources.
+        import fetcher
+
+        text, state = fetcher.conditional_get(self.url, state)
+        if text is None:
+            return pd.DataFrame({'date': [], 'value': []}), state
+
+        # Parse the dates and the numbers of cases straight into typed arrays
+        with metrics.timer("parse"):
+            dates_cases = json.loads(text)['All']['dates']
+            dates = np.array(list(dates_cases), dtype='datetime64[D]')
+            cases = np.fromiter(dates_cases.values(), dtype=np.int64, count=len(dates_cases))
+
+        # Keep only the dates after last_date
+        new = np.flatnonzero(dates > np.datetime64(last_date))
+        new = new[np.argsort(dates[new])]
+        return pd.DataFrame({'date': dates[new].astype(str), 'value': cases[new]}), state
+
+
+COVID_CASES = CovidCasesSource()
+# All time series correlated with the reviews
+SOURCES = [COVID_CASES]
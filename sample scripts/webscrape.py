@@ -1,6 +1,17 @@
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 import re
+from datetime import date
+
+# Optional faster HTML parsers (see page_elements below)
+try:
+    from lxml import html as lxml_html
+except ImportError:
+    lxml_html = None
+try:
+    from selectolax.lexbor import LexborHTMLParser as SelectolaxParser
+except ImportError:
+    SelectolaxParser = None
 
 # USER DEFINED FUNCTIONS FOR WEB SCRAPING
 
@@ -26,12 +37,25 @@ def get_data(url: str) -> str:
     return r.text
 
 
+# Classes of the html tags containing the review text and the review date
+REVIEW_CLASS = "a-row a-spacing-small review-data"
+DATE_CLASS = "a-size-base a-color-secondary review-date"
+# Whitespace characters as defined by BeautifulSoup
+ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+
+
+def html_soup(htmldata: str) -> BeautifulSoup:
+    """Parses already fetched HTML code."""
+
+    return BeautifulSoup(htmldata, 'html.parser')
+
+
 def html_code(url: str) -> BeautifulSoup:
     """Renders the HTML for the given URL."""
 
     # Pass the url into get_data function
     htmldata = get_data(url)
-    soup = BeautifulSoup(htmldata, 'html.parser')
+    soup = html_soup(htmldata)
     # Return html code
     return soup
 
@@ -40,10 +64,7 @@ def cus_rev(soup: BeautifulSoup) -> list:
     """Extract the customer reviews from the HTML."""
 
     # Find the html tag containing the reviews and convert into string
-    data_str = ""
-
-    for item in soup.find_all("div", class_="a-row a-spacing-small review-data"):
-        data_str = data_str + item.get_text()
+    data_str = "".join(item.get_text() for item in soup.find_all("div", class_=REVIEW_CLASS))
 
     result = data_str.split("\n")
     return result
@@ -56,22 +77,201 @@ def rev_date(soup: BeautifulSoup) -> list:
     date_str = ""
     date_list = []
 
-    for item in soup.find_all("span", class_="a-size-base a-color-secondary review-date"):
+    for item in soup.find_all("span", class_=DATE_CLASS):
         date_str = date_str + item.get_text()
         date_list.append(date_str)
         date_str = ""
     return date_list
 
 
+def _is_review_tag(name: str, attrs: dict) -> bool:
+    """Checks whether the html tag contains a review text or a review date."""
+
+    css_class = attrs.get("class")
+    if isinstance(css_class, list):
+        css_class = " ".join(css_class)
+    return (name, css_class) in (("div", REVIEW_CLASS), ("span", DATE_CLASS))
+
+
+def _join_text(strings) -> str:
+    """Joins the text pieces of a tag the same way BeautifulSoup's get_text does."""
+
+    # BeautifulSoup replaces the text pieces made only of whitespace with a single newline or space
+    return "".join(("\n" if "\n" in string else " ") if string and not string.strip(ASCII_SPACES) else string
+                   for string in strings)
+
+
+def _elements_lxml(htmldata: str) -> list:
+    tree = lxml_html.fromstring(htmldata)
+    items = tree.xpath(f"//div[@class='{REVIEW_CLASS}'] | //span[@class='{DATE_CLASS}']")
+    return [("review" if item.tag == "div" else "date", _join_text(item.xpath(".//text()"))) for item in items]
+
+
+def _elements_selectolax(htmldata: str) -> list:
+    tree = SelectolaxParser(htmldata)
+    items = tree.css(f'div[class="{REVIEW_CLASS}"], span[class="{DATE_CLASS}"]')
+    return [("review" if item.tag == "div" else "date",
+             _join_text(node.text_content for node in item.traverse(include_text=True) if node.tag == "-text"))
+            for item in items]
+
+
+def _elements_soupstrainer(htmldata: str) -> list:
+    # Only the review and date tags are kept in the parse tree
+    soup = BeautifulSoup(htmldata, 'html.parser',
+                         parse_only=SoupStrainer(["div", "span"], class_=[REVIEW_CLASS, DATE_CLASS]))
+    items = soup.find_all(lambda tag: _is_review_tag(tag.name, tag.attrs))
+    return [("review" if item.name == "div" else "date", item.get_text()) for item in items]
+
+
+# HTML parsers that can be used for extracting the reviews, in order of preference
+BACKENDS = {"soupstrainer": _elements_soupstrainer}
+if lxml_html is not None:
+    BACKENDS = {"lxml": _elements_lxml, **BACKENDS}
+if SelectolaxParser is not None:
+    BACKENDS = {"selectolax": _elements_selectolax, **BACKENDS}
+
+
+def page_elements(htmldata: str, backend: str = None) -> list:
+    """
+    Extract the review texts and review dates from the HTML in a single pass.
+    Returns a list of ("review", text) and ("date", text) items in the order they appear on the page.
+    """
+
+    if backend is None:
+        backend = next(iter(BACKENDS))
+    if backend not in BACKENDS:
+        raise ValueError(f"HTML parser '{backend}' is not available. Use one of: {', '.join(BACKENDS)}.")
+    if not htmldata.strip():
+        return []
+    return BACKENDS[backend](htmldata)
+
+
+def parse_page(htmldata: str, backend: str = None) -> tuple:
+    """Extract the customer reviews and review dates from the HTML. Same as cus_rev and rev_date but faster."""
+
+    items = page_elements(htmldata, backend)
+    reviews = "".join(text for kind, text in items if kind == "review").split("\n")
+    dates = [text for kind, text in items if kind == "date"]
+    return reviews, dates
+
+
+# Review dates are in the format "Reviewed in the United States on February 14, 2022"
+# or "Reviewed in the United Kingdom on 3 March 2022", depending on the country
+DATE_PATTERN = re.compile(r"\bon (?:(?P<month>[A-Za-z]+)\.? (?P<day>\d{1,2}),? (?P<year>\d{4})"
+                          r"|(?P<day2>\d{1,2})\.? (?P<month2>[A-Za-z]+)\.?,? (?P<year2>\d{4}))\s*$")
+MONTHS = {name: number for number, names in enumerate(
+    [("january", "jan"), ("february", "feb"), ("march", "mar"), ("april", "apr"), ("may",), ("june", "jun"),
+     ("july", "jul"), ("august", "aug"), ("september", "sep", "sept"), ("october", "oct"),
+     ("november", "nov"), ("december", "dec")], start=1) for name in names}
+
+
+def review_dates(text: str, counters: dict = None) -> list:
+    """
+    Extract the dates from the review date text and return them as strings in the format "2022-02-14".
+    Uses a fixed date pattern and only searches the text with datefinder if the pattern does not match.
+    If counters is given, the text is counted in it as "date_pattern" (extracted with DATE_PATTERN),
+    "date_fallback" (with datefinder) or "date_failed" (without any date).
+    """
+
+    match = DATE_PATTERN.search(text)
+    if match:
+        month = MONTHS.get((match.group("month") or match.group("month2")).lower())
+        try:
+            result = date(int(match.group("year") or match.group("year2")), month,
+                          int(match.group("day") or match.group("day2")))
+        except (TypeError, ValueError):
+            pass
+        else:
+            if counters is not None:
+                counters["date_pattern"] = counters.get("date_pattern", 0) + 1
+            return [result.strftime("%Y-%m-%d")]
+
+    # datefinder is slow to import and to search with, so only use it for unexpected formats
+    import datefinder
+    result = [found.strftime("%Y-%m-%d") for found in datefinder.find_dates(text)]
+    if counters is not None:
+        key = "date_fallback" if result else "date_failed"
+        counters[key] = counters.get(key, 0) + 1
+    return result
+
+
+# Emojis and other symbols are not utf-8 compliant for the destination table and break ingestion.
+# Characters outside the Basic Multilingual Plane (4-byte utf-8) are rejected by the VARCHAR columns as well.
+EMOJI_PATTERN = re.compile("["
+                           u"\U0001F600-\U0001F64F"  # emoticons
+                           u"\U0001F300-\U0001F5FF"  # symbols & pictographs
+                           u"\U0001F680-\U0001F6FF"  # transport & map symbols
+                           u"\U0001F1E0-\U0001F1FF"  # flags (iOS)
+                           u"\U00002702-\U000027B0"
+                           u"\U000024C2-\U0001F251"
+                           u"\U00010000-\U0010FFFF"  # non-BMP characters
+                           "]+", flags=re.UNICODE)
+
+
 def remove_emoji(string: str) -> str:
     """Remove emojis from text using regular expressions and returns a 'cleaned' string."""
 
-    emoji_pattern = re.compile("["
-                               u"\U0001F600-\U0001F64F"  # emoticons
-                               u"\U0001F300-\U0001F5FF"  # symbols & pictographs
-                               u"\U0001F680-\U0001F6FF"  # transport & map symbols
-                               u"\U0001F1E0-\U0001F1FF"  # flags (iOS)
-                               u"\U00002702-\U000027B0"
-                               u"\U000024C2-\U0001F251"
-                               "]+", flags=re.UNICODE)
-    return emoji_pattern.sub(r'', string)
+    return EMOJI_PATTERN.sub(r'', string)
+
+
+def remove_emoji_column(column):
+    """Remove emojis from all texts in a pandas Series (column) and returns the 'cleaned' Series."""
+
+    # Mapping remove_emoji is as fast as column.str.replace or faster (see benchmarks/bench_remove_emoji.py)
+    return column.map(remove_emoji)
+
+
+# Lines of the review texts which are not part of the review
+NOT_REVIEW_LINES = {"", "The media could not be loaded."}
+
+
+def page_reviews(htmldata: str, backend: str = None) -> tuple:
+    """
+    Extract the cleaned reviews of a review page as aligned lists of review dates (in the format "2022-02-14")
+    and review texts. Each review container has a date followed by the text of the review, so the date and the text
+    of a review are taken together and a review can't shift the dates of the next ones.
+    Returns the dates, the texts and a validation report of the page with the number of:
+    - dates: review dates found on the page (0 after the last page)
+    - reviews: reviews kept
+    - no_text: reviews dropped because they have no text (e.g. photo only, or the top reviews shown above the list)
+    - no_date: reviews dropped because no date could be extracted from their date text
+    - misaligned: review texts dropped because they are not preceded by a review date
+    - date_pattern, date_fallback, date_failed: date texts of the reviews with text, by how their date was extracted
+      (see review_dates)
+    """
+
+    report = dict.fromkeys(["dates", "reviews", "no_text", "no_date", "misaligned", "date_pattern", "date_fallback",
+                            "date_failed"], 0)
+    dates = []
+    reviews = []
+    # The date text and the text pieces of the current review
+    date_text, texts = None, []
+
+    def add_review():
+        # Initially, dates are in the format "Reviewed in the United States on February 14, 2022"
+        review = "\n".join(line.strip() for line in "".join(texts).split("\n")
+                           if line.strip() not in NOT_REVIEW_LINES)
+        if not review:
+            report["no_text"] += 1
+            return
+        found = review_dates(date_text, report) if date_text.strip() else []
+        if not found:
+            report["no_date"] += 1
+            return
+        dates.append(found[0])
+        reviews.append(review)
+        report["reviews"] += 1
+
+    for kind, text in page_elements(htmldata, backend):
+        if kind == "date":
+            if date_text is not None:
+                add_review()
+            report["dates"] += 1
+            date_text, texts = text, []
+        elif date_text is not None:
+            texts.append(text)
+        elif text.strip():
+            report["misaligned"] += 1
+    if date_text is not None:
+        add_review()
+    return dates, reviews, report
@@ -0,0 +1,43 @@
+import numpy as np
+
+# USER DEFINED FUNCTIONS FOR WEEKLY AGGREGATION
+
+# Weeks start on Monday and are identified by the number of days between 1970-01-01 and their Monday.
+# The daily values are summed per week on the sorted arrays with np.add.reduceat, without grouping or resampling
+# dataframes. The result is the same as shifting the dates 6 days back and resampling on "W-MON"
+# (see tests/test_weekly.py).
+
+
+def week_starts(dates) -> np.ndarray:
+    """Returns the Monday of the week of each date, as the number of days since 1970-01-01."""
+
+    days = np.asarray(dates, dtype='datetime64[D]').astype(np.int64)
+    # 1970-01-01 was a Thursday, so (days + 3) % 7 is the number of days since Monday
+    return days - (days + 3) % 7
+
+
+def weekly_buckets(dates, values, first_week=None, last_week=None) -> tuple:
+    """
+    Sum the values of the sorted dates per week. values has one value per date, or one row per date with one column
+    per series. All weeks from first_week to last_week (by default the weeks of the first and the last date)
+    are returned, with 0 for the weeks without dates, and dates outside them are skipped.
+    Returns the start (Monday) of each week as datetime64[D] and the weekly sums.
+    """
+
+    weeks = week_starts(dates)
+    values = np.asarray(values, dtype=float)
+    first = week_starts([first_week])[0] if first_week is not None else (weeks[0] if len(weeks) else 0)
+    last = week_starts([last_week])[0] if last_week is not None else (weeks[-1] if len(weeks) else first - 7)
+    number_of_weeks = max(0, (last - first) // 7 + 1)
+
+    index = (weeks - first) // 7
+    inside = (index >= 0) & (index < number_of_weeks)
+    if not inside.all():
+        index, values = index[inside], values[inside]
+
+    sums = np.zeros((number_of_weeks,) + values.shape[1:])
+    if len(index) > 0:
+        # The first position of each week in the sorted arrays
+        starts = np.flatnonzero(np.diff(index, prepend=-1))
+        sums[index[starts]] = np.add.reduceat(values, starts, axis=0)
+    return (first + 7 * np.arange(number_of_weeks)).astype('datetime64[D]'), sums
@@ -0,0 +1,131 @@
+import html
+import http.server
+import pathlib
+import sys
+import threading
+import types
+from datetime import date
+
+import pytest
+
+# The modules of the data job are imported from its directory, like the steps do
+JOB_DIR = pathlib.Path(__file__).parent.parent / "sample scripts"
+sys.path.insert(0, str(JOB_DIR))
+
+
+class _Server:
+    """A local HTTP server which answers each path with its queued responses (status, headers, body)."""
+
+    def __init__(self):
+        self.responses = {}
+        self.requests = []
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append((self.path, dict(self.headers)))
+                queue = server.responses.get(self.path, [])
+                status, headers, body = queue.pop(0) if len(queue) > 1 else queue[0] if queue else (404, {}, "")
+                data = body.encode("utf-8")
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_port}{path}"
+
+
+@pytest.fixture
+def http_server():
+    """Serves the responses queued in http_server.responses[path]; the last response of a path is repeated."""
+
+    server = _Server()
+    yield server
+    server.httpd.shutdown()
+    server.httpd.server_close()
+
+
+def review_page(reviews: list) -> str:
+    """Returns an Amazon review page with the (date, text) reviews, dates in the format "2022-02-14"."""
+
+    containers = "".join(
+        f'<div data-hook="review" class="a-section review aok-relative">'
+        f'<div class="a-row"><span class="a-profile-name">Customer</span></div>'
+        f'<span data-hook="review-date" class="a-size-base a-color-secondary review-date">'
+        f'Reviewed in the United States on {date.fromisoformat(day):%B %d, %Y}</span>'
+        f'<div class="a-row a-spacing-small review-data"><span data-hook="review-body" '
+        f'class="a-size-base review-text review-text-content"><span>{html.escape(text)}</span></span></div></div>'
+        for day, text in reviews
+    )
+    return f'<html><body><div id="cm_cr-review_list">{containers}</div></body></html>'
+
+
+class _AmazonServer:
+    """Serves the review pages of products (sorted by most recent) on the local HTTP server."""
+
+    def __init__(self, server: _Server):
+        self.server = server
+
+    def path(self, product: dict, page: int) -> str:
+        return f"/{product['product']}/product-reviews?filterByStar={product['filter']}&pageNumber={page}"
+
+    def url(self, product: dict, page: int) -> str:
+        return self.server.url(self.path(product, page))
+
+    def serve(self, product: dict, reviews: list, reviews_per_page: int = 10):
+        """Serve the (date, text) reviews of the product, newest first, followed by empty pages."""
+
+        pages = [reviews[i:i + reviews_per_page] for i in range(0, len(reviews), reviews_per_page)]
+        for page in range(1, len(pages) + 10):
+            self.server.responses[self.path(product, page)] = [(200, {}, review_page(
+                pages[page - 1] if page <= len(pages) else []))]
+
+    def requested_pages(self, product: dict) -> list:
+        """Returns the numbers of the requested review pages of the product, in the order of the requests."""
+
+        prefix = self.path(product, page=0)[:-1]
+        return [int(path[len(prefix):]) for path, _ in self.server.requests if path.startswith(prefix)]
+
+
+@pytest.fixture
+def amazon_server(http_server):
+    """Serves generated Amazon review pages, see _AmazonServer.serve."""
+
+    return _AmazonServer(http_server)
+
+
+def _load_step(name: str) -> types.ModuleType:
+    """
+    Load the functions of a job step. The steps contain the blanks of the exercises (marked with !!!),
+    so the top level functions with blanks (e.g. run) are left out.
+    """
+
+    blocks = [[]]
+    for line in (JOB_DIR / name).read_text(encoding="utf-8").splitlines(keepends=True):
+        # A top level function or class starts a new block, together with its decorators
+        decorated = blocks[-1] and blocks[-1][-1].startswith("@")
+        if line.startswith(("@", "def ", "class ")) and not decorated:
+            blocks.append([])
+        blocks[-1].append(line)
+    source = "".join("".join(block) for block in blocks if "!!!" not in "".join(block))
+    module = types.ModuleType(pathlib.Path(name).stem)
+    module.__file__ = str(JOB_DIR / name)
+    exec(compile(source, module.__file__, "exec"), module.__dict__)
+    return module
+
+
+@pytest.fixture
+def load_step():
+    """Returns a function loading a job step without its functions with blanks. The steps need VDK."""
+
+    pytest.importorskip("vdk.api.job_input")
+    return _load_step
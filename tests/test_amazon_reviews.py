@@ -0,0 +1,128 @@
+import threading
+from datetime import date, timedelta
+from functools import partial
+
+import pandas as pd
+import pytest
+
+import pipeline
+from fetcher import PageFetcher
+from local_job_input import LocalJobInput
+
+PRODUCT = {'key': "B000JDGC78_critical", 'product': "B000JDGC78", 'name': "Candle", 'filter': "critical",
+           'start_date': None}
+
+
+def daily_reviews(last_date: str, days: int, per_day: int = 3, prefix: str = "review") -> list:
+    """Returns `per_day` (date, text) reviews of each of the `days` dates until last_date, newest first."""
+
+    dates = [(date.fromisoformat(last_date) - timedelta(days=i)).isoformat() for i in range(days)]
+    return [(day, f"{prefix} {i} of {day}") for day in dates for i in range(per_day)]
+
+
+@pytest.fixture
+def step(load_step, amazon_server, monkeypatch):
+    """Step 20 scraping the review pages of the local server."""
+
+    step = load_step("20_ingest_amazon_reviews.py")
+    monkeypatch.setattr(step, "review_page_url", amazon_server.url)
+    return step
+
+
+def scrape(step, last_date_amazon: str, **kwargs) -> pd.DataFrame:
+    with PageFetcher(rate=1000, backoff=0) as page_fetcher:
+        return pd.concat(step.get_amazon_reviews(PRODUCT, last_date_amazon, page_fetcher, **kwargs),
+                         ignore_index=True)
+
+
+def test_crawl_stops_at_the_page_reaching_the_last_ingested_date(step, amazon_server):
+    # 10 reviews per page: the reviews reach 2022-10-05 on page 2 of 6
+    reviews = daily_reviews("2022-10-10", days=20)
+    amazon_server.serve(PRODUCT, reviews)
+
+    df = scrape(step, "2022-10-05")
+    assert sorted(zip(df['Date'], df['Review'])) == sorted(review for review in reviews if review[0] > "2022-10-05")
+
+    # The pages prefetched after page 2 are cancelled, the pages after them are never requested
+    requested = amazon_server.requested_pages(PRODUCT)
+    assert {1, 2} <= set(requested) <= set(range(1, 3 + step.PREFETCH_PAGES))
+    assert len(requested) == len(set(requested))
+
+
+@pytest.fixture
+def job_input(step):
+    """A local job input with the reviews table, whose step 20 ingests the reviews row by row."""
+
+    step.send_reviews = lambda job_input, df, destination_table: job_input.send_tabular_data_for_ingestion(
+        rows=df.values, column_names=df.columns.to_list(), destination_table=destination_table)
+    job_input = LocalJobInput(properties={'prefix': 'test', 'last_date_amazon': '2022-09-25',
+                                          'last_date_amazon_products': {}, 'amazon_crawl': {},
+                                          'amazon_seen_reviews': {}})
+    pipeline.run_step(job_input, '02_create_yankee_candle_reviews.sql')
+    yield job_input
+    job_input.close()
+
+
+def ingest(step, job_input) -> int:
+    props = job_input.get_all_properties()
+    with PageFetcher(rate=1000, backoff=0) as page_fetcher:
+        return step.ingest_product_reviews(job_input, props, threading.Lock(), PRODUCT,
+                                           partial(step.get_amazon_reviews, page_fetcher=page_fetcher))
+
+
+def ingested_reviews(job_input) -> list:
+    return sorted(map(tuple, job_input.execute_query("SELECT Date, Review FROM test_yankee_candle_reviews")))
+
+
+def test_new_reviews_of_the_last_date_and_shifted_pages_are_ingested_once(step, job_input, amazon_server):
+    reviews = daily_reviews("2022-10-10", days=20)
+    amazon_server.serve(PRODUCT, reviews)
+    assert ingest(step, job_input) == 15 * 3
+
+    # New reviews of the last ingested date and of the next days push the reviews to the next pages
+    reviews = daily_reviews("2022-10-12", days=2) + daily_reviews("2022-10-10", days=1, per_day=2, prefix="late") + \
+        reviews
+    amazon_server.serve(PRODUCT, reviews)
+    assert ingest(step, job_input) == 8
+    assert ingested_reviews(job_input) == sorted(review for review in reviews if review[0] > "2022-09-25")
+
+    props = job_input.get_all_properties()
+    assert props['last_date_amazon_products'][PRODUCT['key']] == "2022-10-12"
+    assert props['amazon_crawl'] == {}
+    # Nothing new: no reviews are ingested again
+    assert ingest(step, job_input) == 0
+
+
+def test_interrupted_crawl_resumes_from_its_progress(step, job_input, amazon_server):
+    reviews = daily_reviews("2022-10-10", days=20)
+    amazon_server.serve(PRODUCT, reviews)
+
+    # The ingestion fails after the complete dates of the first page (2022-10-08 to 2022-10-10) were ingested
+    send_reviews = step.send_reviews
+    sent = []
+
+    def failing_send(job_input, df, destination_table):
+        if sent:
+            raise ConnectionError("The connection was lost.")
+        sent.append(len(df))
+        send_reviews(job_input, df, destination_table)
+
+    step.send_reviews = failing_send
+    with pytest.raises(ConnectionError):
+        ingest(step, job_input)
+    crawl = job_input.get_all_properties()['amazon_crawl'][PRODUCT['key']]
+    assert (crawl['oldest'], crawl['newest']) == ("2022-10-08", "2022-10-10")
+    assert PRODUCT['key'] not in job_input.get_all_properties()['last_date_amazon_products']
+
+    # New reviews of the dates ingested by the interrupted crawl and of a new date arrived in the meantime
+    reviews = daily_reviews("2022-10-11", days=1) + daily_reviews("2022-10-10", days=1, per_day=2, prefix="late") + \
+        reviews
+    amazon_server.serve(PRODUCT, reviews)
+    step.send_reviews = send_reviews
+    ingest(step, job_input)
+
+    ingested = ingested_reviews(job_input)
+    assert ingested == sorted(review for review in reviews if review[0] > "2022-09-25")
+    props = job_input.get_all_properties()
+    assert props['last_date_amazon_products'][PRODUCT['key']] == "2022-10-11"
+    assert props['amazon_crawl'] == {}
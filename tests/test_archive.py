@@ -0,0 +1,32 @@
+from archive import PageArchive, replay
+
+
+def test_round_trip(tmp_path):
+    archive = PageArchive(tmp_path)
+    first = archive.put("https://example.com/1", "<html>é \U0001F600</html>", fetched_at="2022-10-10T00:00:00+00:00")
+    second = archive.put("https://example.com/2", "<html>2</html>")
+    # The same page fetched again is stored once, but its fetch is recorded
+    again = archive.put("https://example.com/1", "<html>é \U0001F600</html>")
+
+    assert again == first
+    assert archive.get(first) == "<html>é \U0001F600</html>"
+    assert len(list(tmp_path.glob("objects/*/*.html.gz"))) == 2
+    entries = list(archive.entries())
+    assert [entry['url'] for entry in entries] == ["https://example.com/1", "https://example.com/2",
+                                                   "https://example.com/1"]
+    assert entries[0]['fetched_at'] == "2022-10-10T00:00:00+00:00"
+    assert archive.latest() == {"https://example.com/1": first, "https://example.com/2": second}
+
+
+def test_empty_archive(tmp_path):
+    archive = PageArchive(tmp_path / "missing")
+    assert archive.latest() == {}
+    assert replay(archive, [], len) == []
+
+
+def test_replay_in_order(tmp_path):
+    archive = PageArchive(tmp_path)
+    texts = [f"<html>{'x' * i}</html>" for i in range(20)]
+    hashes = [archive.put(f"https://example.com/{i}", text) for i, text in enumerate(texts)]
+
+    assert replay(archive, hashes[::-1], len, max_workers=2) == [len(text) for text in texts[::-1]]
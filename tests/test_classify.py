@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import classify
+
+CATEGORIES = {
+    'no_scent': ['scent', 'smell', 'fragrance'],
+    'burn': ['burn', 'tunnel', 'soot', 'smoke'],
+    'wick': ['wick'],
+    'packaging': ['packag', 'broken', 'shatter', 'crack'],
+    # Keywords inside, overlapping or starting other keywords
+    'overlap': ['kesm', 'smokes', 'ntun'],
+}
+
+
+def contains_flags(texts: pd.Series, categories: dict) -> pd.DataFrame:
+    """The flags of the original classification: one str.contains per category."""
+
+    return pd.DataFrame({name: texts.str.lower().str.contains("|".join(keywords)).fillna(False).astype(bool)
+                         for name, keywords in categories.items()}, index=texts.index)
+
+
+def random_texts(rows: int = 2000, seed: int = 0) -> pd.Series:
+    rng = np.random.default_rng(seed)
+    pieces = np.array(["Strong ", "smoke", "smell", "s", "scent", "un", "tunnel", "wick", "ed ", "crack", "packag",
+                       "ing", "burn", "t", " ", "SMOKES", "Fragrance", "soot", "broken", "shatter", "a", "x"])
+    texts = ["".join(rng.choice(pieces, rng.integers(0, 12))) for _ in range(rows)]
+    return pd.Series(texts + ["Strong smoke smell", "smokesmell", None], dtype=object)
+
+
+@pytest.mark.parametrize("masks", [classify._masks_regex, classify._masks_ahocorasick])
+def test_flags_match_str_contains(monkeypatch, masks):
+    if masks is classify._masks_ahocorasick and classify.ahocorasick is None:
+        pytest.skip("pyahocorasick is not installed")
+    if masks is classify._masks_regex:
+        monkeypatch.setattr(classify, "ahocorasick", None)
+    texts = random_texts()
+    pd.testing.assert_frame_equal(classify.flag_categories(texts, CATEGORIES), contains_flags(texts, CATEGORIES))
+
+
+def test_overlapping_keywords():
+    flags = classify.flag_categories(pd.Series(["Strong smoke smell", "smokesmell"]), CATEGORIES)
+    assert flags['no_scent'].all() and flags['burn'].all()
+    assert flags['overlap'].to_list() == [False, True]
+
+
+def test_count_categories():
+    df = pd.DataFrame({'product': ['a', 'a', 'b'], 'date': ['2022-01-01'] * 3,
+                       'review': ["No smell", "Burnt wick", "smell"]})
+    flags = classify.flag_categories(df['review'], {'no_scent': ['smell'], 'wick': ['wick']})
+    counts = classify.count_categories(df, flags, ['product', 'date'])
+    assert counts.to_dict('records') == [
+        {'product': 'a', 'date': '2022-01-01', 'num_negative_reviews': 2, 'num_no_scent_reviews': 1,
+         'num_wick_reviews': 1},
+        {'product': 'b', 'date': '2022-01-01', 'num_negative_reviews': 1, 'num_no_scent_reviews': 1,
+         'num_wick_reviews': 0},
+    ]
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import correlation
+
+
+def test_lagged_pairs_only_use_values_up_to_each_position():
+    x = np.arange(5, dtype=float)
+    y = 10 + np.arange(5, dtype=float)
+    x_pairs, y_pairs = correlation.lagged_pairs(x, y, [-2, 0, 1])
+
+    # Lag 1: x[i - 1] with y[i]; lag -2: x[i] with y[i - 2]
+    np.testing.assert_array_equal(x_pairs[:, 2], [np.nan, 0, 1, 2, 3])
+    np.testing.assert_array_equal(y_pairs[:, 2], [np.nan, 11, 12, 13, 14])
+    np.testing.assert_array_equal(x_pairs[:, 0], [np.nan, np.nan, 2, 3, 4])
+    np.testing.assert_array_equal(y_pairs[:, 0], [np.nan, np.nan, 10, 11, 12])
+
+    # Appending values doesn't change the earlier rows
+    n, corr = correlation.lagged_corr(x[:3], y[:3], [-2, 0, 1])
+    n_more, corr_more = correlation.lagged_corr(np.append(x, 3), np.append(y, 0), [-2, 0, 1])
+    np.testing.assert_array_equal(n, n_more[:3])
+    np.testing.assert_allclose(corr, corr_more[:3], atol=1e-12)
+
+
+def test_extend_state_in_chunks_matches_lagged_corr():
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=60)
+    y = x + rng.normal(size=60)
+    x[[3, 17]] = np.nan
+
+    state = correlation.empty_state()
+    chunks = []
+    for part in np.split(np.arange(60), [1, 2, 10, 33]):
+        corr, state = correlation.extend_state(state, x[part], y[part])
+        chunks.append(corr)
+    np.testing.assert_allclose(np.concatenate(chunks), correlation.lagged_corr(x, y, [0])[1][:, 0], atol=1e-12)
+    assert state['n'] == 58
+
+
+def test_lagged_corr_matches_pandas():
+    rng = np.random.default_rng(1)
+    x = rng.normal(size=40)
+    y = np.roll(x, 2) + rng.normal(scale=0.5, size=40)
+    n, corr = correlation.lagged_corr(x, y, [0, 2], window=10)
+    expected = pd.Series(x).shift(2).rolling(10, min_periods=1).corr(pd.Series(y))
+    np.testing.assert_allclose(corr[:, 1], expected.to_numpy(), atol=1e-9)
+    assert n[-1, 1] == 10
+
+
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")  # Series.corr of a single pair
+def test_expanding_corr_skips_missing_values_and_constant_prefix_like_pandas():
+    rng = np.random.default_rng(2)
+    x = rng.normal(size=30)
+    y = x + rng.normal(size=30)
+    x[:5] = 1.0
+    x[[7, 12]] = np.nan
+    y[[5, 20]] = np.nan
+
+    expected = [pd.Series(x[:i + 1]).corr(pd.Series(y[:i + 1])) for i in range(30)]
+    np.testing.assert_allclose(correlation.expanding_corr(x, y), expected, atol=1e-12)
+    assert np.isnan(correlation.expanding_corr(x, y)[:5]).all()
+
+
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")  # Series.corr of a single pair
+def test_spearman_matches_pandas_on_ranks():
+    rng = np.random.default_rng(3)
+    x = rng.integers(0, 5, 40).astype(float)
+    y = x + rng.integers(0, 3, 40)
+    x[:3] = 7.0
+    x[[10, 25]] = np.nan
+    y[5] = np.nan
+
+    def spearman(start: int, end: int, min_periods: int = 1) -> float:
+        # Pandas ranks the pairs without missing values (average ranks for ties) and correlates the ranks
+        pairs = pd.DataFrame({'x': x[start:end], 'y': y[start:end]}).dropna()
+        if len(pairs) < min_periods:
+            return np.nan
+        return pairs['x'].rank().corr(pairs['y'].rank())
+
+    expected = [spearman(0, i + 1) for i in range(40)]
+    np.testing.assert_allclose(correlation.expanding_corr(x, y, method='spearman'), expected, atol=1e-12)
+
+    expected = [spearman(max(0, i - 7), i + 1, min_periods=8) for i in range(40)]
+    np.testing.assert_allclose(correlation.rolling_corr(x, y, 8, method='spearman'), expected, atol=1e-12)
+
+    with pytest.raises(ValueError):
+        correlation.expanding_corr(x, y, method='kendall')
+
+
+def test_extend_state_of_all_pairs_at_once_matches_each_pair():
+    rng = np.random.default_rng(4)
+    x = rng.normal(size=(30, 2))
+    y = np.column_stack([x[:, 0] + rng.normal(size=30), rng.normal(size=30), np.ones(30)])
+    x[:4, 1] = np.nan
+
+    state = correlation.empty_state()
+    chunks = []
+    for part in np.split(np.arange(30), [1, 12]):
+        corr, state = correlation.extend_state(state, x[part, :, None], y[part, None, :])
+        chunks.append(corr)
+    corr = np.concatenate(chunks)
+    assert corr.shape == (30, 2, 3)
+    for i in range(2):
+        for j in range(3):
+            np.testing.assert_allclose(corr[:, i, j], correlation.expanding_corr(x[:, i], y[:, j]), atol=1e-12)
+    assert state['n'] == [[30, 30, 30], [26, 26, 26]]
@@ -0,0 +1,54 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def step(load_step):
+    return load_step("40_calculate_correlation.py")
+
+
+def daily_data(seed: int = 0) -> tuple:
+    """Returns the cumulative covid cases of each day and the no scent reviews of some of the days."""
+
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2020-01-22', '2021-06-30').strftime('%Y-%m-%d')
+    covid = pd.DataFrame({'date': dates, 'number_of_covid_cases': np.cumsum(rng.integers(0, 1000, len(dates)))})
+    review_dates = np.sort(rng.choice(dates, 150, replace=False))
+    reviews = pd.DataFrame({'date': review_dates, 'num_no_scent_reviews': rng.integers(0, 4, len(review_dates))})
+    return covid, reviews
+
+
+def weekly_correlation(step, covid: pd.DataFrame, reviews: pd.DataFrame, state: dict) -> tuple:
+    """Runs weekly_correlation on the rows read by the step from the week of the state on."""
+
+    first_date = state['week'] or ''
+    covid_df = step.queries.typed_frame(covid[covid['date'] >= first_date].values.tolist(),
+                                   {'date': 'date', 'number_of_covid_cases': 'int64'})
+    reviews_df = step.queries.typed_frame(reviews[reviews['date'] >= first_date].values.tolist(),
+                                     {'date': 'date', 'num_no_scent_reviews': 'int32'})
+    df_merged = reviews_df.merge(covid_df, on=['date'], how='right').fillna(0).sort_values('date')
+    last_review_date = reviews_df['date'].max() if len(reviews_df) > 0 else None
+    df_weekly, state = step.weekly_correlation(df_merged.reset_index(drop=True), state, last_review_date)
+    # The state is saved as a job property
+    return df_weekly.set_index('date'), json.loads(json.dumps(state))
+
+
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+def test_reviews_aggregated_again_are_counted(step):
+    covid, reviews = daily_data()
+    state = step.new_correlation_state()
+    weeks = {}
+    for cut in ['2020-03-04', '2020-03-08', '2020-03-09', '2020-06-02', '2020-09-13', '2021-01-03', '2021-06-30']:
+        df_weekly, state = weekly_correlation(step, covid[covid['date'] <= cut], reviews[reviews['date'] <= cut],
+                                              state)
+        weeks.update(df_weekly.to_dict('index'))
+        # Step 30 aggregates more reviews of the latest date of the reviews before the next run
+        if cut != '2021-06-30':
+            reviews.loc[reviews['date'] == reviews[reviews['date'] <= cut]['date'].max(), 'num_no_scent_reviews'] += 2
+    expected, _ = weekly_correlation(step, covid, reviews, step.new_correlation_state())
+
+    result = pd.DataFrame.from_dict(weeks, orient='index').sort_index()
+    pd.testing.assert_frame_equal(result, expected, check_freq=False, check_names=False)
@@ -0,0 +1,32 @@
+import numpy as np
+
+import dedup
+
+
+def test_seen_set_add_contains_and_round_trip():
+    seen = dedup.SeenSet([5, 3, 5])
+    assert len(seen) == 2
+    np.testing.assert_array_equal(seen.contains([3, 4, 5, 2 ** 64 - 1]), [True, False, True, False])
+
+    seen.add(np.array([4, 3], dtype=np.uint64))
+    assert len(seen) == 3
+    restored = dedup.SeenSet.loads(seen.dumps())
+    np.testing.assert_array_equal(restored.hashes, [3, 4, 5])
+    assert restored.contains([4]).all()
+
+
+def test_seen_set_empty():
+    for data in (None, "", dedup.SeenSet().dumps()):
+        seen = dedup.SeenSet.loads(data)
+        assert len(seen) == 0
+        assert not seen.contains([0, 1]).any()
+
+
+def test_review_hashes_ignore_case_and_whitespace_but_not_the_date():
+    hashes = dedup.review_hashes(
+        ["2022-10-10", "2022-10-10", "2022-10-11", "2022-10-10"],
+        ["No  scent at all", "no scent\nat all ", "No scent at all", "No scent at all!"]
+    )
+    assert hashes.dtype == np.uint64
+    assert hashes[0] == hashes[1]
+    assert len(set(hashes.tolist())) == 3
@@ -0,0 +1,76 @@
+import time
+
+import pytest
+import requests
+
+from archive import PageArchive
+from fetcher import PageFetcher, TokenBucket, conditional_get
+
+
+def test_conditional_get_sends_the_validators(http_server):
+    http_server.responses['/history'] = [
+        (200, {'ETag': '"v1"', 'Last-Modified': 'Mon, 10 Oct 2022 00:00:00 GMT'}, "cases"),
+        (304, {}, ""),
+    ]
+
+    text, validators = conditional_get(http_server.url('/history'))
+    assert text == "cases"
+    assert validators == {'etag': '"v1"', 'last_modified': 'Mon, 10 Oct 2022 00:00:00 GMT'}
+    assert 'If-None-Match' not in http_server.requests[0][1]
+
+    # The page hasn't changed: no text and the same validators
+    assert conditional_get(http_server.url('/history'), validators) == (None, validators)
+    headers = http_server.requests[1][1]
+    assert headers['If-None-Match'] == '"v1"'
+    assert headers['If-Modified-Since'] == 'Mon, 10 Oct 2022 00:00:00 GMT'
+
+
+def test_conditional_get_raises_on_errors(http_server):
+    http_server.responses['/history'] = [(500, {}, "")]
+    with pytest.raises(requests.HTTPError):
+        conditional_get(http_server.url('/history'))
+
+
+def test_token_bucket_limits_the_rate():
+    bucket = TokenBucket(rate=50, capacity=3)
+    start = time.monotonic()
+    # The first `capacity` requests don't wait, the others wait 1 / rate seconds each
+    for _ in range(3):
+        bucket.acquire()
+    assert time.monotonic() - start < 0.05
+    for _ in range(5):
+        bucket.acquire()
+    assert time.monotonic() - start >= 5 / 50 * 0.9
+
+
+def test_page_fetcher_retries(http_server):
+    http_server.responses['/page'] = [(503, {}, ""), (429, {}, ""), (200, {}, "page")]
+    with PageFetcher(rate=1000, backoff=0) as fetcher:
+        assert fetcher.get(http_server.url('/page')) == "page"
+    assert len(http_server.requests) == 3
+
+
+def test_page_fetcher_gives_up(http_server):
+    http_server.responses['/page'] = [(503, {}, "")]
+    with PageFetcher(rate=1000, retries=2, backoff=0) as fetcher, pytest.raises(requests.RequestException):
+        fetcher.get(http_server.url('/page'))
+    assert len(http_server.requests) == 3
+
+
+def test_page_fetcher_pages_in_order(http_server, tmp_path):
+    for page in range(1, 7):
+        http_server.responses[f'/reviews?page={page}'] = [(200, {}, f"page {page}")]
+    archive = PageArchive(tmp_path)
+
+    with PageFetcher(max_workers=3, rate=1000, archive=archive) as fetcher:
+        pages = []
+        for number, text in fetcher.pages(lambda page: http_server.url(f'/reviews?page={page}'), first_page=2):
+            pages.append((number, text))
+            if number == 4:
+                break
+
+    assert pages == [(2, "page 2"), (3, "page 3"), (4, "page 4")]
+    # The prefetched pages are fetched once at most, and the fetched pages are archived
+    paths = [path for path, _ in http_server.requests]
+    assert len(paths) == len(set(paths))
+    assert {archive.get(sha256) for sha256 in archive.latest().values()} >= {"page 2", "page 3", "page 4"}
@@ -0,0 +1,27 @@
+import os
+import pathlib
+import subprocess
+import sys
+
+import pytest
+
+JOB_DIR = pathlib.Path(__file__).parent.parent / "sample scripts"
+
+# The modules the steps import, without the steps (they contain the blanks of the exercises) and the dashboard
+HELPERS = sorted(path.stem for path in JOB_DIR.glob("[a-z]*.py") if path.stem != "build_streamlit_dashboard")
+# Only the code that needs them imports these modules (e.g. the p-values of correlation.py or the date fallback
+# of webscrape.py), so that the steps don't pay for their import
+HEAVY = ("datefinder", "matplotlib", "pyinstrument", "scipy", "sklearn", "streamlit")
+
+
+def test_helper_modules_do_not_import_heavy_modules():
+    pytest.importorskip("vdk.api.job_input")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(JOB_DIR), os.environ.get("PYTHONPATH")])))
+    process = subprocess.run(
+        [sys.executable, "-c", f"import sys\nfor name in {HELPERS!r}: __import__(name)\nprint(' '.join(sys.modules))"],
+        env=env, capture_output=True, text=True, check=True
+    )
+
+    imported = {name.split(".")[0] for name in process.stdout.split()}
+    assert set(HELPERS) <= imported
+    assert imported.isdisjoint(HEAVY)
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from local_job_input import LocalJobInput
+
+pytest.importorskip("vdk.api.job_input")
+import ingestion  # noqa: E402
+
+SCHEMA = {'date': 'DATE', 'product': 'VARCHAR', 'review': 'VARCHAR', 'rating': 'INTEGER', 'score': 'DOUBLE'}
+
+
+def round_trip(df: pd.DataFrame, max_bytes: int = ingestion.MAX_STATEMENT_BYTES) -> tuple:
+    """Inserts the dataframe into a local table with values_statements. Returns the statements and the rows read."""
+
+    job_input = LocalJobInput()
+    job_input.execute_query(f"CREATE TABLE p_reviews ({', '.join(f'{n} {t}' for n, t in SCHEMA.items())})")
+    statements = ingestion.values_statements(df, "p_reviews", SCHEMA, max_bytes)
+    for statement in statements:
+        job_input.execute_query(statement)
+    return statements, job_input.execute_query(f"SELECT {', '.join(df.columns)} FROM p_reviews ORDER BY rowid")
+
+
+def test_sql_literals():
+    assert ingestion.sql_literals(pd.Series(["O'Brien", "C:\\candles\\", None]), "VARCHAR") == \
+        ["'O''Brien'", "'C:\\candles\\'", "NULL"]
+    assert ingestion.sql_literals(pd.Series([1.0, np.nan, 3.0]), "integer") == ["1", "NULL", "3"]
+    assert ingestion.sql_literals(pd.Series([0.5, np.nan]), "REAL") == ["CAST(0.5 AS REAL)", "NULL"]
+    assert ingestion.sql_literals(pd.to_datetime(pd.Series(["2022-02-14", None])), "DATE") == ["'2022-02-14'", "NULL"]
+
+
+def test_values_round_trip():
+    df = pd.DataFrame({
+        'date': pd.to_datetime(["2022-02-14", "2022-02-15", None, "2022-02-16"]),
+        'product': ["B000JDGC78", "B000JDGC78", "B000JDGC78", None],
+        'review': ["O'Brien's candle has no scent", "C:\\path\\ and \\' quote", None, "Bougie parfumée 🕯️ 無香"],
+        'rating': pd.array([1, None, 3, 2], dtype="Int64"),
+        'score': [0.25, np.nan, -1e-300, 1e300],
+    })
+    statements, rows = round_trip(df)
+
+    assert len(statements) == 1
+    assert rows == [
+        ["2022-02-14", "B000JDGC78", "O'Brien's candle has no scent", 1, 0.25],
+        ["2022-02-15", "B000JDGC78", "C:\\path\\ and \\' quote", None, None],
+        [None, "B000JDGC78", None, 3, -1e-300],
+        ["2022-02-16", None, "Bougie parfumée 🕯️ 無香", 2, 1e300],
+    ]
+
+
+@pytest.mark.parametrize("max_bytes", [300, 301, 302, 450, 10_000])
+def test_multi_byte_text_near_the_byte_limit(max_bytes):
+    # Each character of the reviews takes 2 to 4 bytes in UTF-8
+    reviews = [("é" * 40, "無" * 30, "🕯" * 20)[i % 3] + str(i) for i in range(30)]
+    df = pd.DataFrame({'review': reviews, 'rating': range(30)})
+    statements, rows = round_trip(df, max_bytes)
+
+    assert all(len(statement.encode("utf-8")) <= max_bytes for statement in statements)
+    assert len(statements) > 1 or max_bytes == 10_000
+    assert rows == [[review, i] for i, review in enumerate(reviews)]
+
+
+def test_row_longer_than_the_limit_gets_its_own_statement():
+    df = pd.DataFrame({'review': ["short", "🕯" * 100, "short"]})
+    statements, rows = round_trip(df, max_bytes=200)
+
+    assert len(statements) == 3
+    assert rows == [["short"], ["🕯" * 100], ["short"]]
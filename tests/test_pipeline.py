@@ -0,0 +1,137 @@
+import threading
+
+import pytest
+
+from local_job_input import LocalJobInput
+from pipeline import StepJobInput, dependencies, run_pipeline
+
+
+def test_nested_property_changed_in_place_is_saved():
+    job_input = LocalJobInput(properties={'last_date_amazon_products': {'a': '2022-01-01'}})
+    step_input = StepJobInput(job_input, threading.Lock())
+
+    props = step_input.get_all_properties()
+    props['last_date_amazon_products']['a'] = '2022-02-01'
+    props['last_date_amazon_products']['b'] = '2022-03-01'
+    props.setdefault('amazon_crawl', {})['a'] = {'oldest': '2022-01-15'}
+    step_input.set_all_properties(props)
+
+    assert job_input.get_all_properties() == {
+        'last_date_amazon_products': {'a': '2022-02-01', 'b': '2022-03-01'},
+        'amazon_crawl': {'a': {'oldest': '2022-01-15'}},
+    }
+
+    # A later change of the same nested property is saved too
+    props['last_date_amazon_products']['a'] = '2022-04-01'
+    step_input.set_all_properties(props)
+    assert job_input.get_property('last_date_amazon_products')['a'] == '2022-04-01'
+
+
+def test_concurrent_steps_keep_each_others_changes():
+    job_input = LocalJobInput(properties={'prefix': 'p', 'last_date_covid': '2020-01-01', 'sources': {}})
+    lock = threading.Lock()
+    covid, reviews = StepJobInput(job_input, lock), StepJobInput(job_input, lock)
+
+    covid_props = covid.get_all_properties()
+    reviews_props = reviews.get_all_properties()
+    covid_props['last_date_covid'] = '2022-10-10'
+    covid_props['sources']['other'] = {'last_date': '2022-10-09'}
+    reviews_props['last_date_amazon'] = '2022-10-01'
+    covid.set_all_properties(covid_props)
+    reviews.set_all_properties(reviews_props)
+
+    assert job_input.get_all_properties() == {
+        'prefix': 'p',
+        'last_date_covid': '2022-10-10',
+        'sources': {'other': {'last_date': '2022-10-09'}},
+        'last_date_amazon': '2022-10-01',
+    }
+
+
+def test_dependencies():
+    steps = {
+        '01_a.sql': {'inputs': [], 'outputs': ['a']},
+        '02_b.sql': {'inputs': [], 'outputs': ['b']},
+        '10_a.py': {'inputs': ['a'], 'outputs': ['a']},
+        '20_ab.py': {'inputs': ['a', 'b'], 'outputs': []},
+    }
+    assert dependencies(steps) == {
+        '01_a.sql': set(),
+        '02_b.sql': set(),
+        '10_a.py': {'01_a.sql'},
+        '20_ab.py': {'01_a.sql', '02_b.sql', '10_a.py'},
+    }
+
+
+STEPS = {
+    '01_create_covid.sql': {'inputs': [], 'outputs': ['covid']},
+    '02_create_reviews.sql': {'inputs': [], 'outputs': ['reviews']},
+    '03_create_transformed.sql': {'inputs': [], 'outputs': ['transformed']},
+    '10_ingest_covid.py': {'inputs': ['covid'], 'outputs': ['covid']},
+    '20_ingest_reviews.py': {'inputs': ['reviews'], 'outputs': ['reviews']},
+    '30_transform_reviews.py': {'inputs': ['reviews', 'transformed'], 'outputs': ['transformed']},
+    '40_correlate.py': {'inputs': ['covid', 'transformed'], 'outputs': []},
+}
+
+
+# A dummy Python step, which records when it starts and finishes in job_input.events
+STEP = """
+def run(job_input):
+    job_input.events.append(('start', NAME))
+    if NAME in ('10_ingest_covid.py', '20_ingest_reviews.py'):
+        # The two ingestion steps only get past the barrier if they run at the same time
+        job_input.barrier.wait()
+    if NAME == FAIL:
+        raise RuntimeError("Step failed")
+    # The tables written by the steps it depends on have rows
+    for table in set(INPUTS) - set(OUTPUTS):
+        assert job_input.execute_query(f"SELECT count(*) FROM p_{table}")[0][0] > 0
+    for table in OUTPUTS:
+        job_input.execute_query(f"INSERT INTO p_{table} VALUES (1)")
+    job_input.events.append(('end', NAME))
+"""
+
+
+def write_steps(job_dir, fail: str = None):
+    for name, step in STEPS.items():
+        if name.endswith('.sql'):
+            (job_dir / name).write_text(f"CREATE TABLE {{prefix}}_{step['outputs'][0]} (value INTEGER)")
+        else:
+            (job_dir / name).write_text(f"NAME, FAIL, INPUTS, OUTPUTS = {name!r}, {fail!r}, {step['inputs']!r}, "
+                                        f"{step['outputs']!r}\n{STEP}")
+
+
+def local_job_input() -> LocalJobInput:
+    job_input = LocalJobInput(properties={'prefix': 'p'})
+    job_input.events = []
+    job_input.barrier = threading.Barrier(2, timeout=10)
+    return job_input
+
+
+def test_run_pipeline_runs_independent_steps_in_parallel(tmp_path):
+    write_steps(tmp_path)
+    job_input = local_job_input()
+    finished = run_pipeline(job_input, STEPS, tmp_path)
+
+    assert sorted(finished) == sorted(STEPS)
+    # Each step finished after the steps it depends on, and the correlation waits for both branches
+    for name, required in dependencies(STEPS).items():
+        assert all(finished.index(step) < finished.index(name) for step in required)
+    assert finished[-1] == '40_correlate.py'
+    # Both ingestion steps started before either of them finished
+    events = job_input.events
+    assert max(events.index(('start', name)) for name in ('10_ingest_covid.py', '20_ingest_reviews.py')) < \
+        min(events.index(('end', name)) for name in ('10_ingest_covid.py', '20_ingest_reviews.py'))
+    assert job_input.execute_query("SELECT count(*) FROM p_transformed") == [[1]]
+
+
+def test_run_pipeline_skips_the_dependents_of_a_failed_step(tmp_path):
+    write_steps(tmp_path, fail='20_ingest_reviews.py')
+    job_input = local_job_input()
+    with pytest.raises(RuntimeError, match="Step failed"):
+        run_pipeline(job_input, STEPS, tmp_path)
+
+    started = [name for event, name in job_input.events if event == 'start']
+    assert sorted(started) == ['10_ingest_covid.py', '20_ingest_reviews.py']
+    # The independent branch still finished
+    assert ('end', '10_ingest_covid.py') in job_input.events
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from local_job_input import LocalJobInput
+
+pytest.importorskip("vdk.api.job_input")
+import queries  # noqa: E402
+
+COLUMNS = {'date': 'date', 'product': 'str', 'num_no_scent_reviews': 'int32'}
+QUERY = "SELECT date, product, num_no_scent_reviews FROM p_reviews ORDER BY date"
+
+
+@pytest.fixture
+def job_input():
+    job_input = LocalJobInput()
+    job_input.execute_query("CREATE TABLE p_reviews (date VARCHAR, product VARCHAR, num_no_scent_reviews INTEGER)")
+    return job_input
+
+
+def insert(job_input: LocalJobInput, rows: list):
+    job_input.send_tabular_data_for_ingestion(rows, list(COLUMNS), "p_reviews")
+
+
+# Chunks smaller than, equal to and larger than the result, and a NULL only in the last chunk
+@pytest.mark.parametrize("chunk_size", [1, 2, 4, 5, 100])
+def test_read_query_chunk_boundaries(job_input, chunk_size):
+    insert(job_input, [("2022-02-14", "a", 1), ("2022-02-15", "b", 2), ("2022-02-16", None, 0),
+                       ("2022-02-17", "a", 4), ("2022-02-18", "a", None)])
+    df = queries.read_query(job_input, QUERY, COLUMNS, chunk_size)
+
+    assert df['date'].dt.strftime('%Y-%m-%d').tolist() == ["2022-02-14", "2022-02-15", "2022-02-16",
+                                                           "2022-02-17", "2022-02-18"]
+    assert df['product'].fillna("").tolist() == ["a", "b", "", "a", "a"]
+    # The NULL makes the whole column a nullable integer
+    assert df['num_no_scent_reviews'].dtype == pd.Int32Dtype()
+    assert df['num_no_scent_reviews'].tolist() == [1, 2, 0, 4, pd.NA]
+    assert df.index.tolist() == list(range(5))
+
+
+def test_read_query_without_nulls(job_input):
+    insert(job_input, [("2022-02-14", "a", 1), ("2022-02-15", "a", 2)])
+    df = queries.read_query(job_input, QUERY, COLUMNS, chunk_size=1)
+
+    assert df['num_no_scent_reviews'].dtype == np.int32
+    assert df['num_no_scent_reviews'].tolist() == [1, 2]
+
+
+def test_read_query_empty_result(job_input):
+    df = queries.read_query(job_input, QUERY, COLUMNS)
+
+    assert df.columns.tolist() == list(COLUMNS)
+    assert len(df) == 0
+    assert pd.api.types.is_datetime64_dtype(df['date'])
+    assert df['num_no_scent_reviews'].dtype == np.int32
+
+
+def test_typed_frame():
+    df = queries.typed_frame([["2022-02-14", 3], ["2022-02-15", None]], {'date': 'date', 'count': 'int64'})
+
+    assert df['date'].tolist() == [pd.Timestamp("2022-02-14"), pd.Timestamp("2022-02-15")]
+    assert df['count'].dtype == pd.Int64Dtype()
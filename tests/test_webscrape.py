@@ -0,0 +1,24 @@
+import webscrape
+
+
+def review(date_text: str, text: str) -> str:
+    return (f'<div data-hook="review" class="a-section review aok-relative">'
+            f'<span data-hook="review-date" class="a-size-base a-color-secondary review-date">{date_text}</span>'
+            f'<div class="a-row a-spacing-small review-data"><span data-hook="review-body" '
+            f'class="a-size-base review-text review-text-content"><span>{text}</span></span></div></div>')
+
+
+def test_page_reviews_counts_the_dates_of_each_page():
+    page = ('<html><body><div id="cm_cr-review_list">' +
+            review("Reviewed in the United States on February 14, 2022", "No scent at all") +
+            review("Reviewed in the United Kingdom on 3 March 2022", "Weak smell") +
+            review("Reviewed in the United States on February 15, 2022", "The media could not be loaded.") +
+            '</div></body></html>')
+
+    dates, reviews, report = webscrape.page_reviews(page)
+    assert dates == ["2022-02-14", "2022-03-03"]
+    assert reviews == ["No scent at all", "Weak smell"]
+    assert report == {'dates': 3, 'reviews': 2, 'no_text': 1, 'no_date': 0, 'misaligned': 0, 'date_pattern': 2,
+                      'date_fallback': 0, 'date_failed': 0}
+    # The counts are returned per page, not accumulated across calls
+    assert webscrape.page_reviews(page)[2] == report
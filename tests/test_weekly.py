@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from weekly import week_starts, weekly_buckets
+
+
+def daily_data(days: int, seed: int) -> pd.DataFrame:
+    """Daily cumulative covid cases and "no scent" reviews, with about 5% of the dates missing."""
+
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'date': pd.date_range("2020-01-22", periods=days),
+        'num_no_scent_reviews': rng.integers(0, 4, days).astype(float),
+        'number_of_covid_cases': np.cumsum(rng.integers(0, 200_000, days)),
+    })
+    return df[rng.random(days) > 0.05].reset_index(drop=True)
+
+
+def resampled_weekly(df: pd.DataFrame) -> pd.DataFrame:
+    """The weekly sums with pandas: shift the dates 6 days back and resample on "W-MON"."""
+
+    df = df.sort_values('date', ascending=False).reset_index(drop=True)
+    df['number_of_covid_cases_weekly'] = df['number_of_covid_cases'].diff(periods=-1).fillna(0)
+    df['date'] = df['date'] - pd.to_timedelta(6, unit='D')
+    return df.drop(columns=['number_of_covid_cases']).resample('W-MON', on='date').sum().reset_index()
+
+
+# Several sizes, including a single day and a single week
+@pytest.mark.parametrize("days, seed", [(1, 0), (7, 1), (30, 2), (365, 3), (1000, 4)])
+def test_same_as_resampling(days, seed):
+    df = daily_data(days, seed)
+    expected = resampled_weekly(df)
+    cases = df['number_of_covid_cases'].to_numpy(dtype=float)
+    weeks, sums = weekly_buckets(df['date'].to_numpy(), np.column_stack(
+        [df['num_no_scent_reviews'].to_numpy(), np.diff(cases, prepend=cases[0])]))
+
+    np.testing.assert_array_equal(weeks, expected['date'].to_numpy(dtype='datetime64[D]'))
+    np.testing.assert_array_equal(sums, expected[['num_no_scent_reviews', 'number_of_covid_cases_weekly']]
+                                  .to_numpy(dtype=float))
+
+
+def test_week_starts_on_monday():
+    dates = np.array(['2022-10-09', '2022-10-10', '2022-10-16', '2022-10-17'], dtype='datetime64[D]')
+    assert week_starts(dates).astype('datetime64[D]').astype(str).tolist() == \
+        ['2022-10-03', '2022-10-10', '2022-10-10', '2022-10-17']
+
+
+def test_first_and_last_week():
+    dates = np.array(['2022-10-04', '2022-10-12', '2022-10-27'], dtype='datetime64[D]')
+    weeks, sums = weekly_buckets(dates, [1.0, 2.0, 3.0], first_week='2022-10-10', last_week='2022-10-31')
+
+    # The first date is before first_week, the weeks without dates are 0
+    assert weeks.astype(str).tolist() == ['2022-10-10', '2022-10-17', '2022-10-24', '2022-10-31']
+    assert sums.tolist() == [2.0, 0.0, 3.0, 0.0]